@@ -0,0 +1,161 @@
+import bisect
+import logging
+import os
+import re
+
+import cv2
+from dotenv import load_dotenv
+
+from clip_writer import clip_extension, open_clip_writer
+from motion_detection import DEFAULT_MOTION_SCALE, DEFAULT_MOTION_THRESHOLD, create_motion_detector
+
+load_dotenv()
+
+# The proxy is at most this wide (never upscaled) and sampled at this frame rate.
+PROXY_WIDTH = int(os.getenv("ANALYSIS_PROXY_WIDTH", 640))
+PROXY_FPS = float(os.getenv("ANALYSIS_PROXY_FPS", 5))
+# Seconds of a static stretch that are kept as context; the rest is cut.
+PROXY_MAX_STATIC = float(os.getenv("ANALYSIS_PROXY_MAX_STATIC", 2))
+
+# "m:ss" or "h:mm:ss" set off the way the annotator reports times: in bold
+# ("**0:18**") or in brackets ("[0:18]"). Other times in the text (e.g. a clock
+# reading "12:30 pm") are left alone.
+TIMESTAMP_PATTERN = re.compile(r"\*\*((?:\d+:)?\d+:[0-5]\d)\*\*|\[((?:\d+:)?\d+:[0-5]\d)\]")
+
+
+class TimeMap:
+    """
+    Maps times in a proxy back to times in its source clip.
+
+    Stored compactly as one (proxy_start, source_start) pair per uncut run of
+    proxy frames; within a run both clocks advance together.
+    """
+
+    def __init__(self, fps):
+        self.fps = fps
+        self.runs = []
+        self.frames = 0
+
+    def append(self, source_time):
+        """Record the next proxy frame, taken at `source_time` in the source."""
+        proxy_time = self.frames / self.fps
+        self.frames += 1
+        if self.runs:
+            proxy_start, source_start = self.runs[-1]
+            if abs(source_start + proxy_time - proxy_start - source_time) < 0.5 / self.fps:
+                return
+        self.runs.append((proxy_time, source_time))
+
+    def to_source(self, proxy_time):
+        """Source time (seconds) shown at `proxy_time` in the proxy."""
+        if not self.runs:
+            return proxy_time
+        i = max(0, bisect.bisect_right([run[0] for run in self.runs], proxy_time) - 1)
+        proxy_start, source_start = self.runs[i]
+        return source_start + proxy_time - proxy_start
+
+
+def format_timestamp(seconds, hours=False):
+    seconds = int(round(seconds))
+    h, rest = divmod(seconds, 3600)
+    m, s = divmod(rest, 60)
+    if hours or h:
+        return f"{h}:{m:02d}:{s:02d}"
+    return f"{m}:{s:02d}"
+
+
+def remap_timestamps(annotations, time_map):
+    """
+    Rewrite the proxy times in annotator output ("**0:18**", "[1:02:03]") to
+    source times. Works on strings and on lists/dicts of them.
+    """
+    if time_map is None:
+        return annotations
+    if isinstance(annotations, dict):
+        return {key: remap_timestamps(value, time_map) for key, value in annotations.items()}
+    if isinstance(annotations, list):
+        return [remap_timestamps(value, time_map) for value in annotations]
+    if not isinstance(annotations, str):
+        return annotations
+
+    def remap(match):
+        text = match.group(1) or match.group(2)
+        parts = [int(part) for part in text.split(":")]
+        proxy_time = sum(part * 60 ** i for i, part in enumerate(reversed(parts)))
+        source_time = format_timestamp(time_map.to_source(proxy_time), hours=len(parts) == 3)
+        return match.group(0).replace(text, source_time)
+
+    return TIMESTAMP_PATTERN.sub(remap, annotations)
+
+
+def build_analysis_proxy(source, dest=None, width=PROXY_WIDTH, fps=PROXY_FPS, max_static=PROXY_MAX_STATIC,
+                         motion_backend=None, motion_zones=None, motion_threshold=DEFAULT_MOTION_THRESHOLD):
+    """
+    Write a reduced copy of `source` for the annotator: at most `width` pixels wide,
+    `fps` frames per second, and with static stretches cut down to `max_static`
+    seconds. Returns `(proxy_path, TimeMap)`, or `(None, None)` if the source
+    cannot be read.
+
+    Motion is scored on the proxy frames, so the cut costs almost nothing on top
+    of the downscale.
+    """
+    cap = cv2.VideoCapture(source)
+    if not cap.isOpened():
+        logging.error(f"Cannot open {source} to build an analysis proxy.")
+        return None, None
+    source_fps = cap.get(cv2.CAP_PROP_FPS) or 30
+    src_width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    src_height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    if src_width == 0 or src_height == 0:
+        cap.release()
+        return None, None
+    fps = min(fps, source_fps)
+    scale = min(1.0, width / src_width)
+    size = (int(round(src_width * scale)) // 2 * 2, int(round(src_height * scale)) // 2 * 2)
+
+    dest = dest or f"{os.path.splitext(source)[0]}.proxy{clip_extension(default='.mp4')}"
+    # Blocking: the time map assumes every kept frame is in the proxy.
+    writer = open_clip_writer(dest, fps, size, fourcc="mp4v", block=True)
+    detector = create_motion_detector(
+        motion_backend,
+        scale=min(1.0, DEFAULT_MOTION_SCALE / scale),
+        threshold=motion_threshold,
+        zones=motion_zones,
+    )
+    time_map = TimeMap(fps)
+    step = 1 / fps
+    next_sample = 0.0
+    static_for = 0.0
+    index = 0
+    kept = 0
+    # Frames between samples are only grabbed, never converted, resized or scored.
+    while cap.grab():
+        source_time = index / source_fps
+        index += 1
+        if source_time + 1e-6 < next_sample:
+            continue
+        next_sample += step
+        ret, frame = cap.retrieve()
+        if not ret:
+            break
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA) if size != (src_width, src_height) else frame
+        score = detector.score(small)
+        if score is not None and score <= motion_threshold:
+            static_for += step
+            if static_for > max_static:
+                continue
+        else:
+            static_for = 0.0
+        time_map.append(source_time)
+        writer.write(small)
+        kept += 1
+    cap.release()
+    if writer.release() is None or writer.error is not None:
+        # Annotate the original clip instead.
+        logging.error(f"Analysis proxy {dest} could not be written: {writer.error or 'no frames'}")
+        if os.path.exists(dest):
+            os.remove(dest)
+        return None, None
+
+    logging.info(f"Analysis proxy {dest}: {kept} of {index} frames at {size[0]}x{size[1]}")
+    return dest, time_map
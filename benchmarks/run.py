@@ -0,0 +1,284 @@
+"""
+Offline benchmarks for the capture and motion pipeline.
+
+Generates synthetic videos, runs `capture_and_detect_motion`,
+`VideoProcessor.process_video` and `VideoSnippetRecorder` (transcoding and
+stream-copy modes) against them from local files, and writes the results as JSON.
+
+Each benchmark runs in a fresh process so peak RSS and CPU time are its own.
+
+Usage (from the repository root):
+    python -m benchmarks.run --resolution 1280x720 --duration 20 --out bench.json
+    python -m benchmarks.run --baseline bench.json   # exit 1 on a >10% fps/core regression
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from benchmarks.synthetic_video import generate_video
+
+BENCHMARKS = ("capture_and_detect_motion", "video_processor", "snippet_recorder", "snippet_recorder_copy")
+
+
+class BenchmarkSkipped(Exception):
+    """Raised by a benchmark that cannot run here (e.g. a missing tool); reported, not failed."""
+
+
+class FrameTimer:
+    """Collects the time between consecutive frames passing a point of the pipeline."""
+
+    def __init__(self):
+        self.last = None
+        self.intervals = []
+        # Set by benchmarks that never see individual frames (e.g. stream copy).
+        self.frames = None
+
+    def tick(self):
+        now = time.perf_counter()
+        if self.last is not None:
+            self.intervals.append(now - self.last)
+        self.last = now
+
+
+def timed_detectors(module, timer):
+    """Patch `module.create_motion_detector` so every scored frame ticks `timer`."""
+    create = module.create_motion_detector
+
+    def create_timed(*args, **kwargs):
+        detector = create(*args, **kwargs)
+        score = detector.score
+
+        def timed_score(frame):
+            timer.tick()
+            return score(frame)
+
+        detector.score = timed_score
+        return detector
+
+    module.create_motion_detector = create_timed
+
+
+class TimedCapture:
+    """Wraps a cv2.VideoCapture so every read ticks `timer`."""
+
+    def __init__(self, cap, timer):
+        self.cap = cap
+        self.timer = timer
+
+    def read(self, *args):
+        self.timer.tick()
+        return self.cap.read(*args)
+
+    def __getattr__(self, name):
+        return getattr(self.cap, name)
+
+
+def bench_capture_and_detect_motion(video, out_dir, options, timer):
+    import video_processing
+    timed_detectors(video_processing, timer)
+    for _ in video_processing.capture_and_detect_motion(
+        video, chunk_duration=options["chunk_duration"], wait_duration=0, min_motion_frames=1,
+        threaded=options["threaded"], motion_backend=options["motion_backend"],
+    ):
+        pass
+    # Chunks stay in memory; nothing is written to disk.
+    return 0
+
+
+def bench_video_processor(video, out_dir, options, timer):
+    import video_processor
+    timed_detectors(video_processor, timer)
+    processor = video_processor.VideoProcessor(motion_backend=options["motion_backend"])
+    processor.use_fixed_video = True
+    processor.fixed_video_path = video
+    processor.source_folder = out_dir
+    processor.realtime = False
+    processor.running = True
+    processor.process_video()
+    return directory_size(out_dir)
+
+
+def bench_snippet_recorder(video, out_dir, options, timer):
+    import video_recorder
+    recorder = video_recorder.VideoSnippetRecorder(duration=options["duration"], source=video, tmp_folder=out_dir)
+    recorder.cap = TimedCapture(recorder.cap, timer)
+    path = recorder.record_snippet()
+    return os.path.getsize(path) if path else 0
+
+
+def bench_snippet_recorder_copy(video, out_dir, options, timer):
+    import cv2
+    import video_recorder
+    cap = cv2.VideoCapture(video)
+    timer.frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    recorder = video_recorder.VideoSnippetRecorder(duration=options["chunk_duration"], source=video,
+                                                   tmp_folder=out_dir, mode="copy")
+    if recorder.mode != "copy":
+        # The recorder fell back to transcoding; that is what snippet_recorder measures.
+        raise BenchmarkSkipped(recorder.stats["last_error"])
+    for _ in recorder.record_segments():
+        pass
+    return directory_size(out_dir)
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return total
+
+
+def run_one(name, video, options, results):
+    """Child-process entry point: run one benchmark and report its measurements."""
+    out_dir = tempfile.mkdtemp(prefix=f"bench-{name}-")
+    timer = FrameTimer()
+    bench = globals()[f"bench_{name}"]
+    cpu_start = resource.getrusage(resource.RUSAGE_SELF)
+    children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.perf_counter()
+    try:
+        bytes_written = bench(video, out_dir, options, timer)
+    except BenchmarkSkipped as e:
+        results.put({"name": name, "skipped": str(e)})
+        return
+    finally:
+        shutil.rmtree(out_dir, ignore_errors=True)
+    wall = time.perf_counter() - start
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    children = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # Child CPU covers ffmpeg encoder and segmenter processes.
+    cpu = (usage.ru_utime - cpu_start.ru_utime) + (usage.ru_stime - cpu_start.ru_stime) + \
+        (children.ru_utime - children_start.ru_utime) + (children.ru_stime - children_start.ru_stime)
+
+    frames = timer.frames if timer.frames is not None else len(timer.intervals) + (1 if timer.last is not None else 0)
+    latencies = np.array(timer.intervals) * 1000 if timer.intervals else np.zeros(1)
+    results.put({
+        "name": name,
+        "frames": frames,
+        "wall_seconds": round(wall, 4),
+        "cpu_seconds": round(cpu, 4),
+        "fps": round(frames / wall, 2) if wall else None,
+        "fps_per_core": round(frames / cpu, 2) if cpu else None,
+        "latency_ms": {
+            "p50": round(float(np.percentile(latencies, 50)), 3),
+            "p90": round(float(np.percentile(latencies, 90)), 3),
+            "p99": round(float(np.percentile(latencies, 99)), 3),
+            "max": round(float(latencies.max()), 3),
+        },
+        # ru_maxrss is in KiB on Linux, bytes on macOS.
+        "peak_rss_bytes": usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024),
+        "bytes_written": bytes_written,
+    })
+
+
+def run_isolated(name, video, options):
+    ctx = multiprocessing.get_context("spawn")
+    results = ctx.Queue()
+    proc = ctx.Process(target=run_one, args=(name, video, options, results))
+    proc.start()
+    proc.join()
+    if proc.exitcode != 0:
+        return {"name": name, "error": f"exited with code {proc.exitcode}"}
+    return results.get()
+
+
+def environment():
+    import cv2
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        commit = None
+    return {
+        "commit": commit or None,
+        "python": platform.python_version(),
+        "opencv": cv2.__version__,
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Names of benchmarks whose fps_per_core dropped more than `tolerance` below the baseline."""
+    before = {r["name"]: r for r in baseline["results"] if "error" not in r and "skipped" not in r}
+    regressions = []
+    for result in results:
+        old = before.get(result["name"])
+        if not old or "error" in result or "skipped" in result:
+            continue
+        if not old.get("fps_per_core") or not result.get("fps_per_core"):
+            continue
+        change = result["fps_per_core"] / old["fps_per_core"] - 1
+        print(f"{result['name']}: {old['fps_per_core']} -> {result['fps_per_core']} fps/core ({change:+.1%})")
+        if change < -tolerance:
+            regressions.append(result["name"])
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--resolution", default="1280x720", help="WIDTHxHEIGHT of the synthetic video")
+    parser.add_argument("--fps", type=int, default=30)
+    parser.add_argument("--duration", type=float, default=20, help="Seconds of synthetic video")
+    parser.add_argument("--motion-density", type=float, default=0.05, help="Fraction of the frame that moves")
+    parser.add_argument("--static-ratio", type=float, default=0.5, help="Fraction of the time without motion")
+    parser.add_argument("--motion-backend", default="frame_diff")
+    parser.add_argument("--inline", action="store_true", help="Disable the threaded frame grabber")
+    parser.add_argument("--only", choices=BENCHMARKS, action="append", help="Run only these benchmarks")
+    parser.add_argument("--video", help="Use this local file instead of generating one")
+    parser.add_argument("--out", help="Write the JSON results here (default: stdout)")
+    parser.add_argument("--baseline", help="Previous JSON results to compare fps/core against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed fps/core drop vs the baseline")
+    args = parser.parse_args(argv)
+
+    width, height = (int(v) for v in args.resolution.lower().split("x"))
+    params = {
+        "width": width, "height": height, "fps": args.fps, "duration": args.duration,
+        "motion_density": args.motion_density, "static_ratio": args.static_ratio,
+    }
+    options = {
+        "duration": args.duration, "chunk_duration": min(5.0, args.duration),
+        "threaded": not args.inline, "motion_backend": args.motion_backend,
+    }
+
+    work_dir = tempfile.mkdtemp(prefix="bench-")
+    try:
+        video = args.video
+        if video is None:
+            video = os.path.join(work_dir, "synthetic.avi")
+            generate_video(video, **params)
+        results = [run_isolated(name, video, options) for name in (args.only or BENCHMARKS)]
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    report = {"environment": environment(), "video": params if args.video is None else {"path": args.video},
+              "options": options, "results": results}
+    text = json.dumps(report, indent=2)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print(f"Regressions: {', '.join(regressions)}", file=sys.stderr)
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
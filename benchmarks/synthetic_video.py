@@ -0,0 +1,54 @@
+import cv2
+import numpy as np
+
+
+def generate_video(path, width=1280, height=720, fps=30, duration=20, motion_density=0.05,
+                   static_ratio=0.5, static_period=5, fourcc="MJPG", seed=0):
+    """
+    Write a synthetic test video and return the number of frames written.
+
+    The scene is a fixed noisy background with moving rectangles on it. Time is cut
+    into `static_period`-second slices; a `static_ratio` share of them has no
+    movement at all (only sensor-like noise), the others have objects covering
+    about `motion_density` of the frame area moving around.
+
+    :param path: Output file (use .avi with MJPG, .mp4 with mp4v).
+    :param motion_density: Fraction (0-1) of the frame covered by moving objects.
+    :param static_ratio: Fraction (0-1) of the time with no motion.
+    :param static_period: Length in seconds of each static or moving slice.
+    """
+    rng = np.random.default_rng(seed)
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, (width, height))
+    if not writer.isOpened():
+        raise RuntimeError(f"Could not open a {fourcc} writer for {path}")
+
+    background = cv2.GaussianBlur(rng.integers(0, 256, (height, width, 3), dtype=np.uint8), (31, 31), 0)
+    noise = rng.integers(-4, 5, (8, height, width, 3), dtype=np.int16)
+
+    # A handful of equally sized objects covering `motion_density` of the frame.
+    n_objects = max(1, int(np.ceil(motion_density * 20))) if motion_density > 0 else 0
+    side = int(np.sqrt(motion_density * width * height / n_objects)) if n_objects else 0
+    positions = rng.uniform([0, 0], [max(1, width - side), max(1, height - side)], (n_objects, 2))
+    velocities = rng.uniform(-1, 1, (n_objects, 2)) * max(width, height) / (2 * fps)
+    # Dark or bright objects so they stand out against the mid-grey background.
+    colors = rng.choice([rng.integers(0, 40, 3), rng.integers(215, 256, 3)], n_objects)
+
+    slices = int(np.ceil(duration / static_period))
+    n_static = int(round(slices * static_ratio))
+    static_slices = set(rng.choice(slices, n_static, replace=False).tolist()) if n_static else set()
+
+    total = int(duration * fps)
+    for i in range(total):
+        frame = np.clip(background + noise[i % len(noise)], 0, 255).astype(np.uint8)
+        moving = int(i / fps / static_period) not in static_slices
+        if moving:
+            positions += velocities
+            for axis, limit in ((0, width - side), (1, height - side)):
+                bounce = (positions[:, axis] < 0) | (positions[:, axis] > limit)
+                velocities[bounce, axis] *= -1
+                positions[:, axis] = np.clip(positions[:, axis], 0, max(0, limit))
+        for (x, y), color in zip(positions.astype(int), colors):
+            cv2.rectangle(frame, (x, y), (x + side, y + side), color.tolist(), -1)
+        writer.write(frame)
+    writer.release()
+    return total
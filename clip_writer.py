@@ -0,0 +1,202 @@
+import concurrent.futures
+import logging
+import os
+import queue
+import subprocess
+import threading
+
+import cv2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# "opencv" (cv2.VideoWriter) or "ffmpeg" (H.264 through an ffmpeg subprocess)
+ENCODER_BACKEND = os.getenv("ENCODER_BACKEND", "opencv")
+FFMPEG_PATH = os.getenv("FFMPEG_PATH", "ffmpeg")
+FFMPEG_PRESET = os.getenv("FFMPEG_PRESET", "veryfast")
+FFMPEG_CRF = int(os.getenv("FFMPEG_CRF", 23))
+# Frames waiting for the encoder before new ones are dropped
+ENCODER_QUEUE_SIZE = int(os.getenv("ENCODER_QUEUE_SIZE", 256))
+# Raw frame bytes waiting for the encoder before new ones are dropped, whichever
+# limit is hit first (256 queued 1080p frames alone would be 1.5 GB).
+ENCODER_QUEUE_MAX_BYTES = int(os.getenv("ENCODER_QUEUE_MAX_BYTES", 256 * 1024 ** 2))
+
+
+class OpenCVEncoder:
+    """Encodes with cv2.VideoWriter (mp4v, XVID, ...)."""
+
+    def __init__(self, path, fps, size, fourcc="mp4v"):
+        self.writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*fourcc), fps, size)
+
+    def isOpened(self):
+        return self.writer.isOpened()
+
+    def write(self, frame):
+        self.writer.write(frame)
+
+    def release(self):
+        self.writer.release()
+
+
+class FfmpegEncoder:
+    """
+    Pipes raw BGR frames into an ffmpeg subprocess that encodes H.264 (libx264)
+    with the configured preset and CRF. Much smaller files than mp4v/XVID, and the
+    encoding runs on other cores.
+    """
+
+    def __init__(self, path, fps, size, preset=FFMPEG_PRESET, crf=FFMPEG_CRF):
+        width, height = size
+        self.frame_bytes = width * height * 3
+        self.proc = subprocess.Popen(
+            [
+                FFMPEG_PATH, "-hide_banner", "-loglevel", "error", "-y",
+                "-f", "rawvideo", "-pix_fmt", "bgr24", "-s", f"{width}x{height}", "-r", str(fps),
+                "-i", "pipe:0",
+                "-c:v", "libx264", "-preset", preset, "-crf", str(crf), "-pix_fmt", "yuv420p",
+                "-movflags", "+faststart",
+                path,
+            ],
+            stdin=subprocess.PIPE,
+        )
+
+    def isOpened(self):
+        return self.proc.poll() is None
+
+    def write(self, frame):
+        if frame.nbytes != self.frame_bytes:
+            raise ValueError(f"Frame has {frame.nbytes} bytes, encoder expects {self.frame_bytes}")
+        self.proc.stdin.write(memoryview(frame if frame.flags.c_contiguous else frame.copy()))
+
+    def release(self):
+        try:
+            self.proc.stdin.close()
+        except BrokenPipeError:
+            pass
+        if self.proc.wait() != 0:
+            logging.error(f"ffmpeg exited with code {self.proc.returncode}")
+
+
+ENCODERS = {"opencv": OpenCVEncoder, "ffmpeg": FfmpegEncoder}
+
+
+class AsyncClipWriter:
+    """
+    Drop-in replacement for cv2.VideoWriter that encodes on its own thread.
+
+    `write()` only puts the frame on a bounded queue, so the capture loop never
+    waits on the encoder or the disk. If the encoder falls `queue_size` frames or
+    `max_bytes` of raw frames behind, new frames are dropped (counted in `dropped`
+    and logged when the clip is finished) rather than blocking capture. Frames
+    must not be modified after being written.
+
+    With `block=True` (for offline use, where every frame must make it into the
+    file) `write()` waits for room in the queue instead of dropping.
+
+    `finish()` closes the file on the encoder thread as well and returns a Future
+    for its path, so starting the next clip does not wait for the last frames to
+    be encoded or for the muxer to finalize the file.
+    """
+
+    def __init__(self, encoder, path=None, queue_size=ENCODER_QUEUE_SIZE, max_bytes=ENCODER_QUEUE_MAX_BYTES,
+                 block=False):
+        self.encoder = encoder
+        self.path = path
+        self.queue_size = queue_size
+        self.max_bytes = max_bytes
+        self.block = block
+        # Unbounded so the end-of-clip marker never blocks; write() enforces the limits.
+        self.frames = queue.Queue()
+        self.queued_bytes = 0
+        self.space = threading.Condition()
+        self.written = 0
+        self.dropped = 0
+        self.error = None
+        self.done = concurrent.futures.Future()
+        self.finishing = False
+        self.thread = threading.Thread(target=self._encode_loop, name="clip-writer", daemon=True)
+        self.thread.start()
+
+    def isOpened(self):
+        return self.error is None and self.encoder.isOpened()
+
+    def write(self, frame):
+        with self.space:
+            if self.block:
+                self.space.wait_for(lambda: not self._full(frame.nbytes))
+            elif self._full(frame.nbytes):
+                self.dropped += 1
+                return
+            self.queued_bytes += frame.nbytes
+        self.frames.put(frame)
+
+    def finish(self):
+        """
+        Flush the queued frames and close the file without waiting. Returns a
+        `concurrent.futures.Future` that resolves to `path` once the file is
+        complete, or to None if no frame was written (the file is removed).
+        """
+        if not self.finishing:
+            self.finishing = True
+            self.frames.put(None)
+        return self.done
+
+    def release(self):
+        """Like `finish()`, but blocks until the file is closed. Returns the same path (or None)."""
+        return self.finish().result()
+
+    def _full(self, nbytes):
+        # A single frame is always accepted, however large.
+        return self.frames.qsize() >= self.queue_size or (
+            self.queued_bytes and self.queued_bytes + nbytes > self.max_bytes)
+
+    def _encode_loop(self):
+        while True:
+            frame = self.frames.get()
+            if frame is None:
+                break
+            if self.error is None:
+                try:
+                    self.encoder.write(frame)
+                    self.written += 1
+                except Exception as e:
+                    self.error = e
+                    logging.error(f"Encoding failed: {e}")
+            with self.space:
+                self.queued_bytes -= frame.nbytes
+                self.space.notify_all()
+        try:
+            self.encoder.release()
+        except Exception as e:
+            logging.error(f"Closing {self.path} failed: {e}")
+            self.done.set_exception(e)
+            return
+        if self.dropped:
+            logging.warning(f"Encoder fell behind on {self.path}, dropped {self.dropped} of "
+                            f"{self.dropped + self.written} frames.")
+        if self.written == 0:
+            # Header-only file: nothing to keep.
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
+            self.done.set_result(None)
+        else:
+            self.done.set_result(self.path)
+
+
+def clip_extension(backend=None, default=".avi"):
+    """File extension to use for clips written with `backend`."""
+    return ".mp4" if (backend or ENCODER_BACKEND) == "ffmpeg" else default
+
+
+def open_clip_writer(path, fps, size, fourcc="mp4v", backend=None, queue_size=ENCODER_QUEUE_SIZE,
+                     max_bytes=ENCODER_QUEUE_MAX_BYTES, block=False):
+    """
+    Open an asynchronous clip writer. `backend` is "opencv" (using `fourcc`) or
+    "ffmpeg" (H.264); defaults to ENCODER_BACKEND. `block` makes `write()` wait
+    instead of dropping frames when the encoder is behind.
+    """
+    backend = backend or ENCODER_BACKEND
+    if backend not in ENCODERS:
+        raise ValueError(f"Unknown encoder backend {backend!r}, expected one of {sorted(ENCODERS)}")
+    encoder = OpenCVEncoder(path, fps, size, fourcc) if backend == "opencv" else FfmpegEncoder(path, fps, size)
+    return AsyncClipWriter(encoder, path, queue_size=queue_size, max_bytes=max_bytes, block=block)
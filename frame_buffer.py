@@ -0,0 +1,85 @@
+import numpy as np
+
+
+class FrameRingBuffer:
+    """
+    Fixed-size ring of BGR frames backed by one preallocated, contiguous uint8 array
+    of shape (capacity, height, width, channels).
+
+    Frames are decoded straight into the next free slot, so memory per camera is
+    `capacity * height * width * channels` bytes no matter how long it runs. Once
+    full, each new frame overwrites the oldest one.
+    """
+
+    def __init__(self, capacity, height, width, channels=3):
+        self.capacity = capacity
+        self.frames = np.empty((capacity, height, width, channels), dtype=np.uint8)
+        self.start = 0
+        self.count = 0
+
+    @property
+    def frame_shape(self):
+        return self.frames.shape[1:]
+
+    @property
+    def nbytes(self):
+        return self.frames.nbytes
+
+    def __len__(self):
+        return self.count
+
+    def clear(self):
+        self.start = 0
+        self.count = 0
+
+    def next_slot(self):
+        """The slot the next frame should be written into (a view, not a copy)."""
+        return self.frames[(self.start + self.count) % self.capacity]
+
+    def commit(self):
+        """Publish the frame written into `next_slot()`."""
+        if self.count < self.capacity:
+            self.count += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def read_from(self, cap):
+        """
+        Decode the next frame of `cap` (a cv2.VideoCapture) straight into the buffer.
+        Returns the frame view, or None at end of stream.
+        """
+        slot = self.next_slot()
+        ret, frame = cap.read(slot)
+        if not ret:
+            return None
+        if not np.may_share_memory(frame, slot):
+            # OpenCV had to allocate its own output; fall back to a copy.
+            if frame.shape != slot.shape:
+                raise ValueError(f"Frame size changed from {slot.shape} to {frame.shape}")
+            np.copyto(slot, frame)
+        self.commit()
+        return slot
+
+    def segments(self):
+        """The buffered frames in capture order, as one or two zero-copy views."""
+        end = self.start + self.count
+        if end <= self.capacity:
+            return [self.frames[self.start:end]]
+        return [self.frames[self.start:], self.frames[:end - self.capacity]]
+
+    def view(self):
+        """
+        All buffered frames as a single (n, h, w, c) array. Zero-copy unless the ring
+        has wrapped around, in which case the two halves are joined into a copy.
+        """
+        segments = self.segments()
+        return segments[0] if len(segments) == 1 else np.concatenate(segments)
+
+    def __iter__(self):
+        for segment in self.segments():
+            yield from segment
+
+    def __getitem__(self, index):
+        if not -self.count <= index < self.count:
+            raise IndexError("frame index out of range")
+        return self.frames[(self.start + index % self.count) % self.capacity]
@@ -0,0 +1,131 @@
+import collections
+import logging
+import threading
+import time
+
+import numpy as np
+
+# Frames kept between the grab thread and the consumer before the oldest is dropped.
+FRAME_QUEUE_SIZE = 64
+# A frame handed to the consumer more than this many seconds after it was grabbed counts as late.
+LATE_FRAME_SECONDS = 1.0
+
+
+class FrameGrabber:
+    """
+    Reads a cv2.VideoCapture continuously on a dedicated thread and hands frames to
+    the consumer through a bounded queue, so a slow consumer never stalls the
+    stream or overflows the decoder buffer.
+
+    When the queue is full the oldest frame is dropped. `stats` counts grabbed,
+    delivered, dropped, late and skipped (grabbed while paused) frames.
+
+    With a `buffer` (a `FrameRingBuffer`) frames are decoded straight into its
+    slots and the queue only carries views of them, so nothing is allocated or
+    copied per frame. The buffer must hold more frames than the queue. While
+    `pause()`d the grabber keeps the stream drained with `grab()` (no decoding) and
+    leaves the buffer alone, so the consumer can hand it out safely.
+    """
+
+    def __init__(self, cap, queue_size=FRAME_QUEUE_SIZE, late_after=LATE_FRAME_SECONDS, buffer=None):
+        if buffer is not None and buffer.capacity <= queue_size:
+            raise ValueError(f"Buffer of {buffer.capacity} frames must be larger than the queue ({queue_size})")
+        self.cap = cap
+        self.late_after = late_after
+        self.buffer = buffer
+        self.frames = collections.deque(maxlen=queue_size)
+        self.cond = threading.Condition()
+        self.running = False
+        self.finished = False
+        self.paused = False
+        self.writing = False
+        self.error = None
+        self.thread = None
+        self.stats = {"grabbed": 0, "delivered": 0, "dropped": 0, "late": 0, "skipped": 0}
+
+    def start(self):
+        self.running = True
+        self.thread = threading.Thread(target=self._grab_loop, name="frame-grabber", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.running = False
+        if self.thread:
+            self.thread.join()
+
+    def pause(self):
+        """Stop writing into the buffer; returns once no frame is being decoded into it."""
+        with self.cond:
+            self.paused = True
+            self.cond.wait_for(lambda: not self.writing)
+
+    def resume(self, clear=True):
+        """Start filling the buffer again, by default from empty."""
+        with self.cond:
+            if clear:
+                self.stats["skipped"] += len(self.frames)
+                self.frames.clear()
+                if self.buffer is not None:
+                    self.buffer.clear()
+            self.paused = False
+
+    def read(self, timeout=None):
+        """
+        Next frame as `(frame, grabbed_at)` where `grabbed_at` is a `time.monotonic()`
+        timestamp. Returns None once the stream has ended and the queue is drained,
+        or if `timeout` seconds pass without a frame.
+        """
+        with self.cond:
+            if not self.cond.wait_for(lambda: self.frames or self.finished, timeout=timeout):
+                return None
+            if not self.frames:
+                return None
+            frame, grabbed_at = self.frames.popleft()
+        self.stats["delivered"] += 1
+        if time.monotonic() - grabbed_at > self.late_after:
+            self.stats["late"] += 1
+        return frame, grabbed_at
+
+    def _grab_loop(self):
+        while self.running:
+            with self.cond:
+                paused = self.paused
+                slot = self.buffer.next_slot() if self.buffer is not None and not paused else None
+                self.writing = slot is not None
+            if paused:
+                if not self.cap.grab():
+                    logging.warning("Frame grabber: end of stream or read error.")
+                    break
+                self.stats["skipped"] += 1
+                continue
+            ret, frame = self.cap.read(slot) if slot is not None else self.cap.read()
+            if ret and slot is not None and not np.may_share_memory(frame, slot):
+                # OpenCV had to allocate its own output (e.g. the size changed).
+                if frame.shape != slot.shape:
+                    self.error = f"Frame size changed from {slot.shape} to {frame.shape}"
+                    logging.error(f"Frame grabber: {self.error}")
+                    ret = False
+                else:
+                    np.copyto(slot, frame)
+                frame = slot
+            grabbed_at = time.monotonic()
+            with self.cond:
+                self.writing = False
+                self.cond.notify_all()
+                if not ret:
+                    if self.error is None:
+                        logging.warning("Frame grabber: end of stream or read error.")
+                    break
+                if slot is not None:
+                    self.buffer.commit()
+                if len(self.frames) == self.frames.maxlen:
+                    # deque(maxlen) evicts the oldest frame on append.
+                    self.stats["dropped"] += 1
+                self.frames.append((frame, grabbed_at))
+                self.stats["grabbed"] += 1
+                self.cond.notify()
+        with self.cond:
+            self.writing = False
+            self.finished = True
+            self.cond.notify_all()
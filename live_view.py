@@ -0,0 +1,226 @@
+import asyncio
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+
+import cv2
+from dotenv import load_dotenv
+
+load_dotenv()
+
+LIVE_VIEW_JPEG_QUALITY = int(os.getenv("LIVE_VIEW_JPEG_QUALITY", 80))
+# Frames are encoded at most this often; the capture worker still records every frame.
+LIVE_VIEW_MAX_FPS = float(os.getenv("LIVE_VIEW_MAX_FPS", 15))
+# A camera's worker stops encoding this many seconds after the last viewer left (avoids gaps on a quick reload).
+LIVE_VIEW_IDLE_TIMEOUT = float(os.getenv("LIVE_VIEW_IDLE_TIMEOUT", 5))
+# Live frames waiting to be picked up by the API process before new ones are dropped.
+LIVE_VIEW_QUEUE_SIZE = int(os.getenv("LIVE_VIEW_QUEUE_SIZE", 64))
+
+MJPEG_BOUNDARY = "frame"
+
+
+class LiveStream:
+    """
+    One camera's live view: each frame arrives JPEG-encoded once (see
+    `LiveViewHub`) and every subscriber gets the same bytes.
+
+    Subscribers only ever see the latest frame, so a slow client skips frames
+    instead of holding up the capture or the other viewers. While it has
+    subscribers the camera's shared `watched` flag is set; the hub clears it and
+    closes the stream once it has been idle for `idle_timeout` seconds.
+    """
+
+    def __init__(self, camera_id, watched, idle_timeout=LIVE_VIEW_IDLE_TIMEOUT):
+        self.camera_id = camera_id
+        self.watched = watched
+        self.idle_timeout = idle_timeout
+        self.latest = None  # (sequence number, jpeg bytes)
+        self.subscribers = {}  # asyncio.Event -> its event loop
+        self.lock = threading.Lock()
+        self.closed = False
+        self.idle_since = time.monotonic()
+        self.stats = {"frames": 0}
+
+    def subscribe(self):
+        event = asyncio.Event()
+        with self.lock:
+            self.subscribers[event] = asyncio.get_running_loop()
+            self.idle_since = None
+            self.watched.value = 1
+        return event
+
+    def unsubscribe(self, event):
+        with self.lock:
+            self.subscribers.pop(event, None)
+            if not self.subscribers:
+                self.idle_since = time.monotonic()
+
+    async def frames(self):
+        """Yield JPEG frames for one viewer until it disconnects or the stream is closed."""
+        event = self.subscribe()
+        seen = None
+        try:
+            while not self.closed:
+                await event.wait()
+                event.clear()
+                if self.latest is None:
+                    continue
+                sequence, jpeg = self.latest
+                if sequence != seen:
+                    seen = sequence
+                    yield jpeg
+        finally:
+            self.unsubscribe(event)
+
+    async def mjpeg(self):
+        """`frames()` as a multipart/x-mixed-replace body."""
+        async for jpeg in self.frames():
+            yield (f"--{MJPEG_BOUNDARY}\r\nContent-Type: image/jpeg\r\n"
+                   f"Content-Length: {len(jpeg)}\r\n\r\n").encode() + jpeg + b"\r\n"
+
+    def close_if_idle(self, now=None):
+        """Stop the camera's encoding and close the stream once idle long enough. True if closed."""
+        with self.lock:
+            if self.closed:
+                return True
+            if self.idle_since is None or (now or time.monotonic()) - self.idle_since < self.idle_timeout:
+                return False
+            self.closed = True
+            self.watched.value = 0
+        return True
+
+    def close(self):
+        with self.lock:
+            self.closed = True
+            self.watched.value = 0
+        # Wake remaining viewers so they see the stream has ended.
+        self._notify()
+
+    def _publish(self, jpeg):
+        self.latest = ((self.latest[0] + 1) if self.latest else 0, jpeg)
+        self.stats["frames"] += 1
+        self._notify()
+
+    def _notify(self):
+        with self.lock:
+            subscribers = list(self.subscribers.items())
+        for event, loop in subscribers:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                pass  # The viewer's loop is closed; it unsubscribes itself.
+
+
+class LiveViewHub:
+    """
+    Live views of all cameras, kept in the API process.
+
+    The capture workers already decode every frame. While a camera has viewers,
+    its worker JPEG-encodes at most `max_fps` of them and `publish()`es them
+    through a process-shared queue, so watching a camera opens no second
+    connection to it. A thread in the API process hands each frame to the
+    camera's `LiveStream`, at most one per camera.
+    """
+
+    def __init__(self, queue_size=LIVE_VIEW_QUEUE_SIZE, quality=LIVE_VIEW_JPEG_QUALITY,
+                 max_fps=LIVE_VIEW_MAX_FPS, idle_timeout=LIVE_VIEW_IDLE_TIMEOUT):
+        # Created before the workers fork, so every process shares it.
+        self.queue = multiprocessing.Queue(maxsize=queue_size)
+        self.quality = quality
+        self.min_interval = 1 / max_fps if max_fps else 0
+        self.idle_timeout = idle_timeout
+        self.flags = {}  # camera_id -> shared flag, 1 while the camera has viewers
+        self.streams = {}  # camera_id -> LiveStream
+        self.lock = threading.Lock()
+        self.thread = None
+        self.last_encoded = {}  # camera_id -> monotonic time; capture worker side
+
+    def watch_flag(self, camera_id):
+        """
+        The shared "has viewers" flag of a camera. The supervisor creates it before
+        forking the camera's worker, which inherits it.
+        """
+        camera_id = str(camera_id)
+        with self.lock:
+            flag = self.flags.get(camera_id)
+            if flag is None:
+                flag = self.flags[camera_id] = multiprocessing.Value("b", 0, lock=False)
+            return flag
+
+    def watched(self, camera_id):
+        """Called from a capture worker: whether anyone is watching the camera."""
+        flag = self.flags.get(str(camera_id))
+        return bool(flag is not None and flag.value)
+
+    def publish_frame(self, camera_id, frame):
+        """Called from a capture worker with every decoded frame; encodes only those a viewer will see."""
+        if not self.watched(camera_id):
+            return
+        now = time.monotonic()
+        if now - self.last_encoded.get(camera_id, 0.0) < self.min_interval:
+            return
+        self.last_encoded[camera_id] = now
+        ok, buffer = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if ok:
+            self.publish(camera_id, buffer.tobytes())
+
+    def publish(self, camera_id, jpeg):
+        """Called from a capture worker. Drops the frame if nobody watches or the API process is behind."""
+        if not self.watched(camera_id):
+            return
+        try:
+            self.queue.put_nowait((str(camera_id), jpeg))
+        except queue.Full:
+            pass
+
+    def start(self):
+        """Start handing published frames to the viewers (in the API process)."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._collect, name="live-view", daemon=True)
+            self.thread.start()
+        return self
+
+    def stream(self, camera_id):
+        camera_id = str(camera_id)
+        flag = self.watch_flag(camera_id)
+        with self.lock:
+            stream = self.streams.get(camera_id)
+            if stream is None or stream.closed:
+                stream = self.streams[camera_id] = LiveStream(camera_id, flag, idle_timeout=self.idle_timeout)
+            return stream
+
+    def remove(self, camera_id):
+        """Close the live view of a deleted camera."""
+        with self.lock:
+            stream = self.streams.pop(str(camera_id), None)
+        if stream is not None:
+            stream.close()
+
+    def close_idle(self, now=None):
+        with self.lock:
+            idle = [camera_id for camera_id, stream in self.streams.items() if stream.close_if_idle(now)]
+            for camera_id in idle:
+                del self.streams[camera_id]
+        if idle:
+            logging.info(f"Live view stopped for {len(idle)} idle camera(s).")
+
+    def _collect(self):
+        while True:
+            try:
+                try:
+                    camera_id, jpeg = self.queue.get(timeout=1)
+                except queue.Empty:
+                    pass
+                else:
+                    stream = self.streams.get(camera_id)
+                    if stream is not None:
+                        stream._publish(jpeg)
+                self.close_idle()
+            except Exception as e:
+                logging.error(f"Live view hub: {e}")
+
+
+live_views = LiveViewHub()
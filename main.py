@@ -16,6 +16,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Browsers only let scripts read response headers listed here (log pagination).
+    expose_headers=["X-Next-Cursor"],
 )
 
 @app.on_event("startup")
@@ -0,0 +1,275 @@
+import json
+import logging
+
+import cv2
+import numpy as np
+
+# Motion is scored on a proxy this fraction of the source resolution.
+DEFAULT_MOTION_SCALE = 0.25
+# Share (0-1) of the monitored area that must change for a frame to count as motion.
+DEFAULT_MOTION_THRESHOLD = 0.015
+
+
+def validate_zones(zones):
+    """
+    Check a `Camera.motion_zones` value (a dict, or the JSON text EdgeDB returns)
+    and return it as a dict: "include" and "exclude" are lists of polygons, each
+    of at least 3 [x, y] points with both coordinates in 0-1 and enclosing some
+    area. Raises ValueError.
+    """
+    if isinstance(zones, str):
+        try:
+            zones = json.loads(zones)
+        except ValueError as e:
+            raise ValueError(f"Motion zones are not valid JSON: {e}")
+    zones = zones or {}
+    if not isinstance(zones, dict):
+        raise ValueError("Motion zones must be an object with 'include' and 'exclude' lists")
+    for kind in ("include", "exclude"):
+        polygons = zones.get(kind) or []
+        if not isinstance(polygons, list):
+            raise ValueError(f"Motion zones '{kind}' must be a list of polygons")
+        for polygon in polygons:
+            if not isinstance(polygon, list) or len(polygon) < 3:
+                raise ValueError(f"Every '{kind}' polygon needs at least 3 points")
+            for point in polygon:
+                if (not isinstance(point, (list, tuple)) or len(point) != 2
+                        or not all(isinstance(v, (int, float)) and 0 <= v <= 1 for v in point)):
+                    raise ValueError(f"Polygon points must be [x, y] with 0 <= x, y <= 1, got {point!r}")
+            # Shoelace formula; collinear or repeated points enclose nothing.
+            area = sum(x1 * y2 - x2 * y1 for (x1, y1), (x2, y2) in zip(polygon, polygon[1:] + polygon[:1]))
+            if abs(area) < 1e-9:
+                raise ValueError(f"Every '{kind}' polygon must enclose an area")
+    return zones
+
+
+def zone_mask(zones, width, height):
+    """
+    Build a uint8 mask (255 = monitored) for a `Camera.motion_zones` value.
+
+    `zones` looks like {"include": [polygon, ...], "exclude": [polygon, ...]} where
+    each polygon is a list of [x, y] points in 0-1 coordinates of the frame
+    (a rectangle is just four points). With no include zones the whole frame is
+    monitored; exclude zones are always cut out. The JSON text EdgeDB returns for
+    the property is accepted as well. Raises ValueError for malformed zones (see
+    `validate_zones`).
+    """
+    zones = validate_zones(zones)
+    include = zones.get("include") or []
+    exclude = zones.get("exclude") or []
+    scale = np.array([width, height], dtype=np.float32)
+
+    def to_pixels(polygon):
+        return np.round(np.asarray(polygon, dtype=np.float32) * scale).astype(np.int32)
+
+    mask = np.zeros((height, width), dtype=np.uint8) if include else np.full((height, width), 255, dtype=np.uint8)
+    if include:
+        cv2.fillPoly(mask, [to_pixels(p) for p in include], 255)
+    if exclude:
+        cv2.fillPoly(mask, [to_pixels(p) for p in exclude], 0)
+    return mask
+
+
+class MotionDetector:
+    """
+    Base class for motion detectors. Every backend works on a downscaled grayscale
+    proxy, restricted to a camera's motion zones, and `score(frame)` returns the
+    fraction of the monitored area that moved, so thresholds do not depend on the
+    camera resolution.
+
+    Subclasses implement `_foreground(gray)`, returning a binary (0/255) motion
+    mask for the proxy, or None while they have nothing to compare against yet.
+    """
+
+    name = None
+
+    def __init__(self, scale=DEFAULT_MOTION_SCALE, threshold=DEFAULT_MOTION_THRESHOLD,
+                 zones=None, blur=True):
+        self.scale = scale
+        self.threshold = threshold
+        self.zones = self._checked_zones(zones)
+        self.blur = blur
+        self.mask = None
+        self.area = 0
+        self.size = None
+        self.kernel = None
+
+    def reset(self):
+        """Forget the scene history, e.g. after a gap in the stream."""
+
+    def proxy(self, frame):
+        """Downscaled, grayscale (and optionally blurred) version of a BGR frame."""
+        height, width = frame.shape[:2]
+        if self.size is None:
+            self._configure(width, height)
+        small = cv2.resize(frame, self.size, interpolation=cv2.INTER_AREA) if self.scale != 1 else frame
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        if self.blur:
+            gray = cv2.GaussianBlur(gray, self.kernel, 0)
+        return gray
+
+    def score(self, frame):
+        """Moving fraction (0-1) of the monitored area, or None if it cannot be scored yet."""
+        moving = self._foreground(self.proxy(frame))
+        if moving is None:
+            return None
+        if self.mask is not None:
+            moving = cv2.bitwise_and(moving, self.mask)
+        return cv2.countNonZero(moving) / self.area if self.area else 0.0
+
+    def detect(self, frame):
+        """True if the frame shows motion above the threshold."""
+        score = self.score(frame)
+        return score is not None and score > self.threshold
+
+    def _foreground(self, gray):
+        raise NotImplementedError
+
+    @staticmethod
+    def _checked_zones(zones):
+        # The routes reject malformed zones; anything stored before that must not
+        # take down the capture worker or the analysis proxy.
+        if not zones:
+            return None
+        try:
+            return validate_zones(zones)
+        except ValueError as e:
+            logging.error(f"Ignoring invalid motion zones, monitoring the whole frame: {e}")
+            return None
+
+    def _configure(self, width, height):
+        self.size = (max(1, int(round(width * self.scale))), max(1, int(round(height * self.scale))))
+        # Keep the blur radius proportional to the proxy (21x21 at full resolution).
+        k = max(3, int(21 * self.scale) | 1)
+        self.kernel = (k, k)
+        if self.zones:
+            self.mask = zone_mask(self.zones, *self.size)
+            self.area = cv2.countNonZero(self.mask)
+        else:
+            self.mask = None
+            self.area = self.size[0] * self.size[1]
+
+
+class FrameDifferenceDetector(MotionDetector):
+    """Thresholded difference against the previous frame, optionally dilated. Cheapest backend."""
+
+    name = "frame_diff"
+
+    def __init__(self, dilate=True, diff_threshold=25, **kwargs):
+        super().__init__(**kwargs)
+        self.dilate = dilate
+        self.diff_threshold = diff_threshold
+        self.prev = None
+
+    def reset(self):
+        self.prev = None
+
+    def _foreground(self, gray):
+        prev, self.prev = self.prev, gray
+        if prev is None:
+            return None
+        delta = cv2.absdiff(prev, gray)
+        _, thresh = cv2.threshold(delta, self.diff_threshold, 255, cv2.THRESH_BINARY)
+        if self.dilate:
+            thresh = cv2.dilate(thresh, None, iterations=2)
+        return thresh
+
+
+class BackgroundSubtractorDetector(MotionDetector):
+    """
+    OpenCV MOG2 or KNN background subtraction. Learns the static scene, so it copes
+    with slow lighting changes and flicker better than frame differencing, at a
+    higher CPU cost.
+    """
+
+    def __init__(self, method="mog2", history=500, learning_rate=-1, warmup_frames=5, **kwargs):
+        kwargs.setdefault("blur", False)
+        super().__init__(**kwargs)
+        if method not in ("mog2", "knn"):
+            raise ValueError(f"Unknown background subtraction method {method!r}")
+        self.name = method
+        self.method = method
+        self.history = history
+        self.learning_rate = learning_rate
+        self.warmup_frames = warmup_frames
+        self.warmup = 0
+        self.subtractor = None
+        self.reset()
+
+    def reset(self):
+        if self.method == "mog2":
+            self.subtractor = cv2.createBackgroundSubtractorMOG2(history=self.history, detectShadows=False)
+        else:
+            self.subtractor = cv2.createBackgroundSubtractorKNN(history=self.history, detectShadows=False)
+        self.warmup = 0
+
+    def _foreground(self, gray):
+        moving = self.subtractor.apply(gray, learningRate=self.learning_rate)
+        # Until the model has seen a few frames most of the scene reads as foreground.
+        if self.warmup < self.warmup_frames:
+            self.warmup += 1
+            return None
+        return moving
+
+
+class BlockSumDetector(MotionDetector):
+    """
+    Compares per-block brightness sums, read from an integral image, between
+    consecutive frames. A block counts as moving when its mean changes by more than
+    `diff_threshold`. Very cheap and robust to pixel noise, but coarse.
+    """
+
+    name = "block_sum"
+
+    def __init__(self, block_size=8, diff_threshold=12, **kwargs):
+        kwargs.setdefault("blur", False)
+        super().__init__(**kwargs)
+        self.block_size = block_size
+        self.diff_threshold = diff_threshold
+        self.prev = None
+
+    def reset(self):
+        self.prev = None
+
+    def _block_means(self, gray):
+        b = self.block_size
+        rows, cols = gray.shape[0] // b, gray.shape[1] // b
+        integral = cv2.integral(gray)
+        ys, xs = np.arange(rows + 1) * b, np.arange(cols + 1) * b
+        corners = integral[np.ix_(ys, xs)]
+        sums = corners[1:, 1:] - corners[:-1, 1:] - corners[1:, :-1] + corners[:-1, :-1]
+        return sums / float(b * b)
+
+    def _foreground(self, gray):
+        means = self._block_means(gray)
+        prev, self.prev = self.prev, means
+        if prev is None:
+            return None
+        moving_blocks = (np.abs(means - prev) > self.diff_threshold).astype(np.uint8) * 255
+        # Paint the block decision back at proxy resolution so zone masks still apply.
+        b = self.block_size
+        moving = np.zeros(gray.shape, dtype=np.uint8)
+        rows, cols = moving_blocks.shape
+        moving[:rows * b, :cols * b] = cv2.resize(moving_blocks, (cols * b, rows * b),
+                                                  interpolation=cv2.INTER_NEAREST)
+        return moving
+
+
+MOTION_BACKENDS = {
+    "frame_diff": FrameDifferenceDetector,
+    "mog2": lambda **kwargs: BackgroundSubtractorDetector(method="mog2", **kwargs),
+    "knn": lambda **kwargs: BackgroundSubtractorDetector(method="knn", **kwargs),
+    "block_sum": BlockSumDetector,
+}
+
+
+def create_motion_detector(backend="frame_diff", **kwargs):
+    """
+    Build the motion detector for a camera's `motion_backend`
+    ("frame_diff", "mog2", "knn" or "block_sum"; None means "frame_diff").
+    Keyword arguments go to the backend (scale, threshold, zones, ...).
+    """
+    backend = backend or "frame_diff"
+    if backend not in MOTION_BACKENDS:
+        raise ValueError(f"Unknown motion backend {backend!r}, expected one of {sorted(MOTION_BACKENDS)}")
+    return MOTION_BACKENDS[backend](**kwargs)
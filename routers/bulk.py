@@ -0,0 +1,33 @@
+import uuid
+from fastapi import HTTPException
+
+# Most items accepted by one bulk request; each request runs as a single query.
+BULK_MAX_ITEMS = 5000
+
+
+def check_batch_size(items):
+    if len(items) > BULK_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BULK_MAX_ITEMS} items per request")
+
+
+def is_uuid(value):
+    try:
+        uuid.UUID(str(value))
+        return True
+    except ValueError:
+        return False
+
+
+def item_created(index, **fields):
+    return {"index": index, "status": "created", **fields}
+
+
+def item_failed(index, error):
+    return {"index": index, "status": "failed", "error": error}
+
+
+def bulk_response(results):
+    """Per-item results in request order, with created / failed totals."""
+    results = sorted(results, key=lambda result: result["index"])
+    created = sum(1 for result in results if result["status"] == "created")
+    return {"created": created, "failed": len(results) - created, "results": results}
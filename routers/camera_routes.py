@@ -1,14 +1,47 @@
-from fastapi import APIRouter, HTTPException, Query
-from pydantic import BaseModel
+import json
+from email.utils import formatdate
+from typing import Literal
+from fastapi import APIRouter, Header, HTTPException, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, confloat, conlist, field_validator
 from db import client
+from live_view import MJPEG_BOUNDARY, live_views
+from motion_detection import validate_zones
+from routers.bulk import bulk_response, check_batch_size, is_uuid, item_created, item_failed
+from tasks.camera_health import camera_health
+from tasks.capture_supervisor import CameraConfig, camera_config, supervisor
+from tasks.rule_index import rule_index
+from tasks.snapshot_registry import snapshot_registry
 
 router = APIRouter()
 
 # Note: We added a "user_id" field here so that the camera can be added to the user's camera list.
+ZonePoint = conlist(confloat(ge=0, le=1), min_length=2, max_length=2)  # [x, y] in 0-1 frame coordinates
+ZonePolygon = conlist(ZonePoint, min_length=3)
+
+class CameraZones(BaseModel):
+    include: list[ZonePolygon] = []  # Only motion inside these counts (whole frame if empty)
+    exclude: list[ZonePolygon] = []  # Motion inside these is always ignored
+
+    @field_validator("include", "exclude")
+    @classmethod
+    def check_polygons(cls, polygons):
+        # The point and size limits are in the types; this also rejects polygons
+        # without area (the same check the motion detectors apply to stored zones).
+        validate_zones({"include": polygons})
+        return polygons
+
+MotionBackend = Literal["frame_diff", "mog2", "knn", "block_sum"]
+
+class CameraMotionBackend(BaseModel):
+    backend: MotionBackend | None = None  # None falls back to frame_diff
+
 class CameraCreate(BaseModel):
     ip_address: str
     room_id: str  # UUID of the Room
     user_id: str  # UUID of the User
+    motion_zones: CameraZones | None = None
+    motion_backend: MotionBackend | None = None
 
 @router.post("/cameras")
 async def create_camera(camera: CameraCreate):
@@ -29,12 +62,16 @@ async def create_camera(camera: CameraCreate):
             '''
             INSERT Camera {
                 ip_address := <str>$ip_address,
-                room := (SELECT Room FILTER .id = <uuid>$room_id)
+                room := (SELECT Room FILTER .id = <uuid>$room_id),
+                motion_zones := <optional json>$motion_zones,
+                motion_backend := <optional str>$motion_backend
             }
             RETURNING { id, ip_address }
             ''',
             ip_address=camera.ip_address,
-            room_id=camera.room_id
+            room_id=camera.room_id,
+            motion_zones=json.dumps(camera.motion_zones.dict()) if camera.motion_zones else None,
+            motion_backend=camera.motion_backend
         )
         await client.query(
             '''
@@ -45,12 +82,129 @@ async def create_camera(camera: CameraCreate):
             user_id=camera.user_id,
             camera_id=camera_obj["id"]
         )
+        supervisor.add_camera(camera_obj["id"], CameraConfig(
+            camera.ip_address,
+            camera.motion_backend,
+            camera.motion_zones.dict() if camera.motion_zones else None,
+        ))
+        rule_index.invalidate()
         
         return camera_obj
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+class CameraBulkItem(BaseModel):
+    ip_address: str
+    room_id: str  # UUID of the Room
+    motion_zones: CameraZones | None = None
+    motion_backend: MotionBackend | None = None
+
+class CameraBulkCreate(BaseModel):
+    user_id: str  # UUID of the User all cameras are added to
+    cameras: list[CameraBulkItem]
+
+# Items whose room does not exist are skipped and existing ip_addresses are left
+# alone (UNLESS CONFLICT); nothing is inserted if the user does not exist.
+BULK_CREATE_CAMERAS_QUERY = '''
+WITH
+    u := (SELECT User FILTER .id = <uuid>$user_id),
+    created := (
+        FOR owner IN u
+        UNION (
+            FOR item IN array_unpack(<array<json>>$items)
+            UNION (
+                SELECT {
+                    index := <int64>item['index'],
+                    room_found := EXISTS (SELECT Room FILTER .id = <uuid>item['room_id']),
+                    camera := (
+                        FOR room IN (SELECT Room FILTER .id = <uuid>item['room_id'])
+                        UNION (
+                            INSERT Camera {
+                                ip_address := <str>item['ip_address'],
+                                room := room,
+                                motion_zones := json_get(item, 'motion_zones'),
+                                motion_backend := <str>json_get(item, 'motion_backend')
+                            }
+                            UNLESS CONFLICT ON .ip_address
+                        )
+                    )
+                }
+            )
+        )
+    ),
+    linked := (UPDATE u SET { camera += created.camera })
+SELECT {
+    user_found := EXISTS linked,
+    items := created { index, room_found, camera: { id, ip_address, motion_backend, motion_zones } }
+}
+'''
+
+@router.post("/cameras/bulk")
+async def bulk_create_cameras(batch: CameraBulkCreate):
+    """
+    Create many cameras for one user in a single transaction. Every camera gets
+    a result in `results`, in request order. Items that cannot be created (bad
+    room id, unknown room, duplicate or existing ip_address) are reported as
+    failed and the rest are still created.
+
+    Example curl:
+    curl -X POST "http://localhost:8000/cameras/bulk" \
+      -H "Content-Type: application/json" \
+      -d '{
+            "user_id": "USER_UUID",
+            "cameras": [
+              {"ip_address": "192.168.1.10", "room_id": "ROOM_UUID"},
+              {"ip_address": "192.168.1.11", "room_id": "ROOM_UUID", "motion_backend": "mog2"}
+            ]
+          }'
+    """
+    check_batch_size(batch.cameras)
+    results = []
+    items = []
+    seen = set()
+    for index, camera in enumerate(batch.cameras):
+        if not is_uuid(camera.room_id):
+            results.append(item_failed(index, "Invalid room_id"))
+        elif camera.ip_address in seen:
+            results.append(item_failed(index, "Duplicate ip_address in this request"))
+        else:
+            seen.add(camera.ip_address)
+            item = {"index": index, "ip_address": camera.ip_address, "room_id": camera.room_id}
+            if camera.motion_zones:
+                item["motion_zones"] = camera.motion_zones.dict()
+            if camera.motion_backend:
+                item["motion_backend"] = camera.motion_backend
+            items.append(json.dumps(item))
+
+    try:
+        outcome = await client.query_single(
+            BULK_CREATE_CAMERAS_QUERY,
+            user_id=batch.user_id,
+            items=items
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not outcome.user_found:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    created = {}
+    for item in outcome.items:
+        if item.camera:
+            created[str(item.camera.id)] = camera_config(item.camera)
+            results.append(item_created(item.index, id=str(item.camera.id), ip_address=item.camera.ip_address))
+        elif not item.room_found:
+            results.append(item_failed(item.index, "Room not found"))
+        else:
+            results.append(item_failed(item.index, "A camera with this ip_address already exists"))
+    if created:
+        # One registration; the supervisor thread starts the workers at CAPTURE_START_RATE.
+        supervisor.add_cameras(created)
+        rule_index.invalidate()
+
+    return bulk_response(results)
+
+
 @router.delete("/cameras/{camera_id}")
 async def delete_camera(camera_id: str):
     """
@@ -66,11 +220,85 @@ async def delete_camera(camera_id: str):
             ''',
             camera_id=camera_id
         )
+        supervisor.remove_camera(camera_id)
+        rule_index.invalidate()
+        snapshot_registry.remove(camera_id)
+        camera_health.remove(camera_id)
+        live_views.remove(camera_id)
         return {"status": "camera deleted"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.put("/cameras/{camera_id}/zones")
+async def set_camera_zones(camera_id: str, zones: CameraZones):
+    """
+    Set the include/exclude motion zones of a camera.
+
+    Example curl (ignore the top fifth of the frame):
+    curl -X PUT "http://localhost:8000/cameras/CAMERA_UUID/zones" \
+      -H "Content-Type: application/json" \
+      -d '{"include": [], "exclude": [[[0, 0], [1, 0], [1, 0.2], [0, 0.2]]]}'
+    """
+    try:
+        camera_obj = await client.query_single(
+            '''
+            SELECT (
+                UPDATE Camera FILTER .id = <uuid>$camera_id SET {
+                    motion_zones := <json>$motion_zones
+                }
+            ) { ip_address, motion_backend, motion_zones }
+            ''',
+            camera_id=camera_id,
+            motion_zones=json.dumps(zones.dict())
+        )
+        if not camera_obj:
+            raise HTTPException(status_code=404, detail="Camera not found")
+        # The capture worker restarts with the new zones; analysis picks them up too.
+        supervisor.add_camera(camera_id, camera_config(camera_obj))
+        rule_index.invalidate()
+        return {"status": "zones updated"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.put("/cameras/{camera_id}/motion_backend")
+async def set_camera_motion_backend(camera_id: str, motion: CameraMotionBackend):
+    """
+    Choose the motion detector backend of a camera: frame_diff (cheapest), mog2 / knn
+    (background subtraction, most robust) or block_sum (coarse, very cheap).
+
+    Example curl:
+    curl -X PUT "http://localhost:8000/cameras/CAMERA_UUID/motion_backend" \
+      -H "Content-Type: application/json" \
+      -d '{"backend": "mog2"}'
+    """
+    try:
+        camera_obj = await client.query_single(
+            '''
+            SELECT (
+                UPDATE Camera FILTER .id = <uuid>$camera_id SET {
+                    motion_backend := <optional str>$motion_backend
+                }
+            ) { ip_address, motion_backend, motion_zones }
+            ''',
+            camera_id=camera_id,
+            motion_backend=motion.backend
+        )
+        if not camera_obj:
+            raise HTTPException(status_code=404, detail="Camera not found")
+        # The capture worker restarts with the new backend; analysis picks it up too.
+        supervisor.add_camera(camera_id, camera_config(camera_obj))
+        rule_index.invalidate()
+        return {"status": "motion backend updated"}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.get("/cameras")
 async def get_cameras(user_id: str = Query(None), room_id: str = Query(None)):
     """
@@ -101,6 +329,8 @@ async def get_cameras(user_id: str = Query(None), room_id: str = Query(None)):
     SELECT Camera {{
         id,
         ip_address,
+        motion_zones,
+        motion_backend,
         room: {{ id, name }}
     }}
     FILTER {filter_clause}
@@ -115,6 +345,77 @@ async def get_cameras(user_id: str = Query(None), room_id: str = Query(None)):
         raise HTTPException(status_code=400, detail=str(e))
 
 
+@router.get("/cameras/status")
+async def get_cameras_status():
+    """
+    Health of every supervised camera from the capture workers' heartbeats, read
+    from memory (no query, no stream is opened). `status` is "online", "stale"
+    (worker alive but no recent frames) or "offline" (no recent heartbeat).
+
+    Example curl:
+    curl -X GET "http://localhost:8000/cameras/status"
+    """
+    return [camera_health.status(camera_id) for camera_id in list(supervisor.cameras)]
+
+
+@router.get("/cameras/{camera_id}/live")
+async def get_camera_live_view(camera_id: str):
+    """
+    Live MJPEG view of a camera, fed by its capture worker (no second connection
+    to the camera is opened). The worker JPEG-encodes frames from the first viewer
+    until shortly after the last one leaves, and all viewers share each encode.
+    In copy recording mode frames arrive at the snapshot interval.
+
+    Example (open in a browser or an <img> tag):
+    curl -N "http://localhost:8000/cameras/CAMERA_UUID/live" --output -
+    """
+    try:
+        camera_obj = await client.query_single(
+            '''
+            SELECT Camera { id } FILTER .id = <uuid>$camera_id
+            ''',
+            camera_id=camera_id
+        )
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not camera_obj:
+        raise HTTPException(status_code=404, detail="Camera not found")
+
+    stream = live_views.stream(camera_id)
+    return StreamingResponse(
+        stream.mjpeg(),
+        media_type=f"multipart/x-mixed-replace; boundary={MJPEG_BOUNDARY}",
+    )
+
+
+@router.get("/cameras/{camera_id}/snapshot")
+async def get_camera_snapshot(
+    camera_id: str,
+    width: int | None = Query(None, ge=16, le=3840),
+    if_none_match: str | None = Header(None),
+):
+    """
+    Most recent frame of a camera as a JPEG, served from memory (no stream is
+    opened and no query is made). Frames are refreshed by the capture worker every
+    SNAPSHOT_INTERVAL seconds. `width` downscales it; send the ETag back in
+    If-None-Match to get a 304 when the frame has not changed.
+
+    Example curl:
+    curl -X GET "http://localhost:8000/cameras/CAMERA_UUID/snapshot?width=320" --output snapshot.jpg
+    """
+    snapshot = snapshot_registry.get(camera_id, width)
+    if snapshot is None:
+        raise HTTPException(status_code=404, detail="No snapshot for this camera yet")
+    headers = {
+        "ETag": snapshot.etag,
+        "Cache-Control": "no-cache",
+        "Last-Modified": formatdate(snapshot.captured_at, usegmt=True),
+    }
+    if if_none_match and snapshot.etag in [tag.strip() for tag in if_none_match.split(",")]:
+        return Response(status_code=304, headers=headers)
+    return Response(content=snapshot.jpeg, media_type="image/jpeg", headers=headers)
+
+
 @router.get("/cameras/{camera_id}/rules")
 async def get_camera_rules(camera_id: str, user_id: str = Query(...)):
     """
@@ -1,138 +1,175 @@
 from fastapi import APIRouter, HTTPException, Header
+import asyncio
 import datetime
+import os
 import random
+import time
 from db import client  # Your EdgeDB client
+from tasks.camera_health import camera_health
 
 router = APIRouter()
 
+# Seconds an assembled dashboard payload is reused for the same user.
+DASHBOARD_CACHE_TTL = float(os.getenv("DASHBOARD_CACHE_TTL", 10))
+
+_dashboard_cache = {}  # user_id -> (expires_at, payload)
+_dashboard_locks = {}  # user_id -> asyncio.Lock, so concurrent tabs share one refresh
+
+
+async def cached_dashboard(user_id, build):
+    entry = _dashboard_cache.get(user_id)
+    if entry and entry[0] > time.monotonic():
+        return entry[1]
+    lock = _dashboard_locks.setdefault(user_id, asyncio.Lock())
+    async with lock:
+        entry = _dashboard_cache.get(user_id)
+        if entry and entry[0] > time.monotonic():
+            return entry[1]
+        payload = await build()
+        _dashboard_cache[user_id] = (time.monotonic() + DASHBOARD_CACHE_TTL, payload)
+        # Drop expired payloads of users who stopped polling.
+        now = time.monotonic()
+        for key in [key for key, (expires_at, _) in _dashboard_cache.items() if expires_at <= now]:
+            del _dashboard_cache[key]
+            _dashboard_locks.pop(key, None)
+        return payload
+
 @router.get("/dashboardstats")
 async def dashboard_stats(
     x_user_id: str = Header(..., alias="X-User-ID"),
     authorization: str = Header(...)
 ):
+    """
+    Dashboard overview for a user. The payload is assembled with a single query
+    (today's alerts come from the per-camera daily counters, not a LogEntry scan)
+    and reused for DASHBOARD_CACHE_TTL seconds; camera liveness is read from the
+    in-memory heartbeat registry on every request.
+    """
     try:
-        now = datetime.datetime.now(datetime.timezone.utc)
-        start_of_day = datetime.datetime(now.year, now.month, now.day, tzinfo=datetime.timezone.utc)
-        
-        # Fetch the user's associated cameras, rules, and rooms.
-        user = await client.query_single(
-            """
-            SELECT User {
+        payload = await cached_dashboard(x_user_id, lambda: build_dashboard(x_user_id))
+        return with_camera_health(payload)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+async def build_dashboard(user_id):
+    now = datetime.datetime.now(datetime.timezone.utc)
+
+    # The user's cameras, rules and rooms, today's alert count and the latest alerts.
+    user = await client.query_single(
+        """
+        WITH u := (SELECT User FILTER .id = <uuid>$user_id)
+        SELECT u {
+            id,
+            camera: {
                 id,
-                camera: { id },
-                rules: { id },
-                rooms: { id }
-            }
-            FILTER .id = <uuid>$user_id
-            """,
-            user_id=x_user_id
-        )
-        if not user:
-            raise HTTPException(status_code=404, detail="User not found")
-        
-        total_cameras = len(user.camera)
-        active_cameras = total_cameras - random.randint(0, total_cameras // 4)
-        total_rooms = len(user.rooms)
-        locations = len({room.id for room in user.rooms})
-        total_rules = len(user.rules)
-        pending_review = random.randint(0, total_rules // 2)
-        
-        # Query for today's alerts count (using nested subselect for user camera IDs).
-        todays_alerts_count = await client.query_single(
-            """
-            SELECT count(
-                LogEntry FILTER (
-                    .camera IN (
-                        SELECT Camera
-                        FILTER .id IN (
-                            SELECT (SELECT User FILTER .id = <uuid>$user_id).camera.id
-                        )
-                    )
-                    AND .time >= <datetime>$start_of_day
-                )
-            )
-            """,
-            user_id=x_user_id,
-            start_of_day=start_of_day
-        )
-        requires_attention = random.randint(0, todays_alerts_count)
-        
-        overview = {
-            "totalCameras": {"count": total_cameras, "active": active_cameras},
-            "monitoredRooms": {"count": total_rooms, "locations": locations},
-            "activeRules": {"count": total_rules, "pendingReview": pending_review},
-            "todaysAlerts": {"count": todays_alerts_count, "requiresAttention": requires_attention}
-        }
-        
-        # Simulate active monitors data.
-        active_monitors = [
-            {
-                "id": "monitor_1",
-                "name": "Main Entrance",
-                "status": "online",
-                "stats": {
-                    "violations": 0,
-                    "warnings": 2,
-                    "lastCheck": (now - datetime.timedelta(minutes=2)).isoformat()
-                }
+                ip_address,
+                room: { name },
+                todays_alerts := sum((
+                    SELECT .<camera[IS CameraAlertCounter] FILTER .day = <cal::local_date>$today
+                ).count)
             },
-            {
-                "id": "monitor_2",
-                "name": "Production Line A",
-                "status": "online",
-                "stats": {
-                    "violations": 1,
-                    "warnings": 0,
-                    "lastCheck": (now - datetime.timedelta(minutes=1)).isoformat()
+            rules: { id },
+            rooms: { id },
+            todays_alerts := sum((
+                SELECT CameraAlertCounter FILTER .camera IN u.camera AND .day = <cal::local_date>$today
+            ).count),
+            recent_alerts := (
+                SELECT LogEntry {
+                    id,
+                    time,
+                    description,
+                    rule: { text },
+                    camera: { room: { name } }
                 }
-            }
-        ]
-        
-        # Query recent alerts (latest 2 LogEntry items) for the user's cameras (using nested subselect).
-        recent_alerts_raw = await client.query(
-            """
-            SELECT LogEntry {
-                id,
-                time,
-                description,
-                rule: { text },
-                camera: { room: { name } }
-            }
-            FILTER .camera IN (
-                SELECT Camera
-                FILTER .id IN (
-                    SELECT (SELECT User FILTER .id = <uuid>$user_id).camera.id
-                )
+                FILTER .camera IN u.camera
+                ORDER BY .time DESC
+                LIMIT 2
             )
-            ORDER BY .time DESC
-            LIMIT 2
-            """,
-            user_id=x_user_id
-        )
-        
-        recent_alerts = []
-        for alert in recent_alerts_raw:
-            recent_alerts.append({
-                "id": alert.id,
-                "type": alert.rule.text,
-                "location": {
-                    "room": alert.camera.room.name if alert.camera and alert.camera.room else "Unknown",
-                    "camera": "Camera " + alert.id[:4]  # Dummy label
-                },
-                "timestamp": alert.time.isoformat(),
-                "status": "pending"  # Adjust based on your business logic
-            })
-        
-        metadata = {
-            "lastUpdated": now.isoformat(),
-            "timeZone": "UTC"
         }
-        
-        return {
-            "overview": overview,
-            "activeMonitors": active_monitors,
-            "recentAlerts": recent_alerts,
-            "metadata": metadata
+        """,
+        user_id=user_id,
+        today=now.date()
+    )
+    if not user:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    total_cameras = len(user.camera)
+    total_rooms = len(user.rooms)
+    locations = len({room.id for room in user.rooms})
+    total_rules = len(user.rules)
+    pending_review = random.randint(0, total_rules // 2)
+
+    todays_alerts_count = user.todays_alerts
+    requires_attention = random.randint(0, todays_alerts_count)
+
+    overview = {
+        "totalCameras": {"count": total_cameras, "active": 0},  # Filled in by with_camera_health
+        "monitoredRooms": {"count": total_rooms, "locations": locations},
+        "activeRules": {"count": total_rules, "pendingReview": pending_review},
+        "todaysAlerts": {"count": todays_alerts_count, "requiresAttention": requires_attention}
+    }
+
+    # Status and capture stats are added per request by with_camera_health.
+    active_monitors = [
+        {
+            "id": str(camera.id),
+            "name": camera.room.name if camera.room else camera.ip_address,
+            "stats": {"violations": camera.todays_alerts}
         }
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+        for camera in user.camera
+    ]
+
+    recent_alerts = []
+    for alert in user.recent_alerts:
+        recent_alerts.append({
+            "id": str(alert.id),
+            "type": alert.rule.text,
+            "location": {
+                "room": alert.camera.room.name if alert.camera and alert.camera.room else "Unknown",
+                "camera": "Camera " + str(alert.id)[:4]  # Dummy label
+            },
+            "timestamp": alert.time.isoformat(),
+            "status": "pending"  # Adjust based on your business logic
+        })
+
+    metadata = {
+        "lastUpdated": now.isoformat(),
+        "timeZone": "UTC"
+    }
+    
+    return {
+        "overview": overview,
+        "activeMonitors": active_monitors,
+        "recentAlerts": recent_alerts,
+        "metadata": metadata
+    }
+
+
+def with_camera_health(payload):
+    """Copy of a (cached) dashboard payload with each monitor's live status from the heartbeat registry."""
+    now = time.time()
+    monitors = []
+    for monitor in payload["activeMonitors"]:
+        health = camera_health.status(monitor["id"], now)
+        last_heartbeat = health["last_heartbeat_at"]
+        monitors.append({
+            **monitor,
+            "status": health["status"],
+            "stats": {
+                **monitor["stats"],
+                "fps": health["fps"],
+                "motionRatio": health["motion_ratio"],
+                "lastError": health["last_error"],
+                "lastCheck": datetime.datetime.fromtimestamp(last_heartbeat, datetime.timezone.utc).isoformat()
+                if last_heartbeat else None
+            }
+        })
+    overview = dict(payload["overview"])
+    overview["totalCameras"] = {
+        **overview["totalCameras"],
+        "active": sum(1 for monitor in monitors if monitor["status"] == "online")
+    }
+    return {**payload, "overview": overview, "activeMonitors": monitors}
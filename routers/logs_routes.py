@@ -1,94 +1,384 @@
+import asyncio
+import base64
+import csv
+import io
+import json
 import uuid
-from fastapi import APIRouter, HTTPException
-from datetime import datetime
+from typing import Literal
+from fastapi import APIRouter, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from datetime import datetime, timezone
 from ai.invision_ai.video_analyzer import VideoAnalyzer
 from ai.invision_ai.video_annotator import VideoAnnotator
 from db import client
+from tasks.annotation_cache import annotation_cache
+from tasks.job_runner import JobQueueFull, simulation_jobs
+from tasks.rule_index import effective_rules
+from tasks.segment_store import segment_store
 import edgedb
 
 router = APIRouter()
 
-@router.get("/rooms/{room_id}/logs")
-async def get_logs_for_room(room_id: str, start_time: str, end_time: str):
+LOG_PAGE_SIZE = 500
+LOG_MAX_PAGE_SIZE = 5000
+LOG_EXPORT_BATCH_SIZE = 1000
+NIL_UUID = "00000000-0000-0000-0000-000000000000"
+# LogEntry.time is when a breach was written, after its clip was recorded and
+# analysed, so its footage is looked up in a window (seconds) before that time.
+LOG_FOOTAGE_BEFORE = 300
+LOG_FOOTAGE_MAX_WINDOW = 24 * 3600
+# Simulations are annotated and analysed as this user, whichever user owns the camera.
+SIMULATION_USER_ID = "ba3197a8-f182-11ef-80e2-77fbe9534181"
+# The rules the analyzer applies in a simulation, to key the annotation cache on.
+SIMULATION_RULES_QUERY = '''
+SELECT {
+    rules := (SELECT User FILTER .id = <uuid>$user_id).rules { id, text, shared, rooms: { id } },
+    room_id := (SELECT Camera FILTER .id = <uuid>$camera_id).room.id
+}
+'''
+
+# Keyset page: entries strictly after the (time, id) cursor, in (time, id) order.
+# An empty limit returns every remaining entry.
+ROOM_LOGS_PAGE_QUERY = '''
+SELECT LogEntry {
+    id,
+    time,
+    description,
+    rule: { id, text },
+    camera: { id, ip_address }
+}
+FILTER .camera.room.id = <uuid>$room_id AND .time >= <datetime>$start AND .time <= <datetime>$end
+    AND (.time > <datetime>$after_time OR (.time = <datetime>$after_time AND .id > <uuid>$after_id))
+ORDER BY .time THEN .id
+LIMIT <optional int64>$limit
+'''
+
+
+def parse_time_range(start_time: str, end_time: str):
     try:
-        start = datetime.fromisoformat(start_time)
-        end = datetime.fromisoformat(end_time)
+        return datetime.fromisoformat(start_time), datetime.fromisoformat(end_time)
     except Exception:
         raise HTTPException(status_code=400, detail="Invalid datetime format. Use ISO format (YYYY-MM-DDTHH:MM:SS).")
-    
+
+
+def encode_cursor(entry):
+    raw = json.dumps([entry.time.isoformat(), str(entry.id)]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        time_str, entry_id = json.loads(raw)
+        return datetime.fromisoformat(time_str), str(uuid.UUID(entry_id))
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+async def fetch_room_logs_page(room_id, start, end, after_time, after_id, limit):
+    return await client.query(
+        ROOM_LOGS_PAGE_QUERY,
+        room_id=room_id,
+        start=start,
+        end=end,
+        after_time=after_time,
+        after_id=after_id,
+        limit=limit
+    )
+
+
+def log_entry_dict(entry):
+    return {
+        "id": str(entry.id),
+        "time": entry.time.isoformat(),
+        "description": entry.description,
+        "rule": {"id": str(entry.rule.id), "text": entry.rule.text},
+        "camera": {"id": str(entry.camera.id), "ip_address": entry.camera.ip_address},
+    }
+
+
+@router.get("/rooms/{room_id}/logs")
+async def get_logs_for_room(
+    room_id: str,
+    start_time: str,
+    end_time: str,
+    response: Response,
+    limit: int | None = Query(None, ge=1, le=LOG_MAX_PAGE_SIZE),
+    cursor: str | None = None,
+):
+    """
+    Log entries of a room in a time range, oldest first. Without `limit` and
+    `cursor` every entry in the range is returned at once (for large ranges,
+    prefer pages or /logs/export).
+
+    With `limit` (or a `cursor`, pages then hold LOG_PAGE_SIZE entries) one page
+    is returned at a time. When there are more entries the response carries an
+    X-Next-Cursor header; pass it back as `cursor` to get the next page.
+
+    Example curl:
+    curl -i "http://localhost:8000/rooms/ROOM_UUID/logs?start_time=2025-02-01T00:00:00&end_time=2025-03-01T00:00:00&limit=100"
+    """
+    start, end = parse_time_range(start_time, end_time)
+    if limit is None and cursor is None:
+        try:
+            return await fetch_room_logs_page(room_id, start, end, start, NIL_UUID, None)
+        except Exception as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    limit = limit or LOG_PAGE_SIZE
+    after_time, after_id = decode_cursor(cursor) if cursor else (start, NIL_UUID)
+
     try:
-        logs = await client.query(
+        # One extra row tells whether another page follows.
+        logs = await fetch_room_logs_page(room_id, start, end, after_time, after_id, limit + 1)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if len(logs) > limit:
+        logs = logs[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(logs[-1])
+    return logs
+
+
+@router.get("/rooms/{room_id}/logs/export")
+async def export_logs_for_room(room_id: str, start_time: str, end_time: str,
+                               format: Literal["ndjson", "csv"] = "ndjson"):
+    """
+    Stream every log entry of a room in a time range as NDJSON or CSV. Entries are
+    read from the database in keyset batches, so memory use does not grow with
+    the range.
+
+    Example curl:
+    curl -N "http://localhost:8000/rooms/ROOM_UUID/logs/export?start_time=2025-02-01T00:00:00&end_time=2025-03-01T00:00:00&format=csv"
+    """
+    start, end = parse_time_range(start_time, end_time)
+
+    async def rows():
+        if format == "csv":
+            yield csv_line(["id", "time", "description", "rule_id", "rule_text", "camera_id", "camera_ip_address"])
+        after_time, after_id = start, NIL_UUID
+        while True:
+            batch = await fetch_room_logs_page(room_id, start, end, after_time, after_id, LOG_EXPORT_BATCH_SIZE)
+            for entry in batch:
+                if format == "csv":
+                    yield csv_line([
+                        entry.id, entry.time.isoformat(), entry.description, entry.rule.id,
+                        entry.rule.text, entry.camera.id, entry.camera.ip_address,
+                    ])
+                else:
+                    yield json.dumps(log_entry_dict(entry)) + "\n"
+            if len(batch) < LOG_EXPORT_BATCH_SIZE:
+                break
+            after_time, after_id = batch[-1].time, str(batch[-1].id)
+
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    return StreamingResponse(rows(), media_type=media_type, headers={
+        "Content-Disposition": f'attachment; filename="room-{room_id}-logs.{format}"',
+    })
+
+
+@router.get("/logs/{log_id}/footage")
+async def get_log_footage(
+    log_id: str,
+    before: float = Query(LOG_FOOTAGE_BEFORE, ge=0, le=LOG_FOOTAGE_MAX_WINDOW),
+    after: float = Query(0, ge=0, le=LOG_FOOTAGE_MAX_WINDOW),
+):
+    """
+    Recorded segments of a log entry's camera from `before` seconds before the
+    entry's time to `after` seconds after it, oldest first. Looked up in the
+    segment store's index (see tasks.segment_store); footage already removed by
+    retention is not listed.
+
+    Example curl:
+    curl -X GET "http://localhost:8000/logs/LOG_UUID/footage?before=120"
+    """
+    try:
+        entry = await client.query_single(
             '''
-            SELECT LogEntry {
-                id,
-                time,
-                description,
-                rule: { id, text },
-                camera: { id, ip_address }
-            }
-            FILTER .camera.room.id = <uuid>$room_id AND .time >= <datetime>$start AND .time <= <datetime>$end
+            SELECT LogEntry { time, camera: { id } } FILTER .id = <uuid>$log_id
             ''',
-            room_id=room_id,
-            start=start,
-            end=end
+            log_id=log_id
         )
-        return logs
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
-    
-@router.get("/simulate")
-async def simulate_log_entry(camera_id: str, video_id: str):
+    if not entry:
+        raise HTTPException(status_code=404, detail="Log entry not found")
+
+    at = entry.time.timestamp()
+    try:
+        # A SQLite read; kept off the event loop.
+        segments = await run_in_threadpool(segment_store.segments_between, entry.camera.id, at - before, at + after)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Footage lookup failed: {e}")
+    return [
+        {
+            "camera_id": segment.camera_id,
+            "start": datetime.fromtimestamp(segment.start, timezone.utc).isoformat(),
+            "end": datetime.fromtimestamp(segment.end, timezone.utc).isoformat(),
+            "path": segment.path,
+            "size": segment.size,
+        }
+        for segment in segments
+    ]
+
 
+def csv_line(values):
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(values)
+    return buffer.getvalue()
+
+
+def run_simulation(camera_id: str, video_id: str):
+    """Annotate and analyse a stored video. Blocking: runs on the simulation job pool."""
     video_path = "./videos/" + video_id
-    user_id = "ba3197a8-f182-11ef-80e2-77fbe9534181"
+    user_id = SIMULATION_USER_ID
 
-    try:
-        client = edgedb.create_client()
-        print("Processing video: ", video_path, user_id, camera_id)
+    print("Processing video: ", video_path, user_id, camera_id)
 
+    def analyze():
         annotator = VideoAnnotator()
         # Run the analysis for a given camera and video file path
         annotations = annotator.run(camera_id=camera_id, user_id=user_id, video_file_path=video_path)
-        with open("annotations.json", "w") as f:
-            f.write(str(annotations))
         print("Video Annotations done")
-        
+
         # Now, initialize the VideoAnalyzer (OPENAI_API_KEY is loaded from .env if not passed)
         analyzer = VideoAnalyzer()
         # Analyze the annotations for potential code-of-conduct breaches
         breach_reports = analyzer.analyze(annotations, camera_id=camera_id, user_id=user_id)
+        return annotations, breach_reports
 
-        response = {
-            "simulation_id": str(uuid.uuid4()),
-            "timestamp": datetime.now().isoformat(),
-            "breaches": []
-        }
+    # A repeat simulation of the same video under the same rules is served from disk.
+    # The key uses the simulation user's rules for the camera (what the analyzer
+    # applies), not the camera owner's from the rule index.
+    simulation = _get_sync_client().query_single(SIMULATION_RULES_QUERY, user_id=user_id, camera_id=camera_id)
+    rules = effective_rules(simulation.rules, simulation.room_id)
+    annotations, breach_reports = annotation_cache.cached_analysis(video_path, rules, analyze, settings=[user_id])
 
-        print("\nBreach Reports:")
-        for report in breach_reports:
-            breach = {
-                "id": str(uuid.uuid4()),
-                "timestamp": datetime.now().isoformat(),
-                "description": report.description,
-                "rule_id": str(report.rule_id),
-                "severity": report.severity if hasattr(report, 'severity') else "medium",
-                "location": report.location if hasattr(report, 'location') else None,
-                "confidence": report.confidence if hasattr(report, 'confidence') else 0.85,
-                "metadata": {
-                    "frame_number": report.frame_number if hasattr(report, 'frame_number') else None,
-                    "zone": report.zone if hasattr(report, 'zone') else None,
-                    "additional_info": report.additional_info if hasattr(report, 'additional_info') else None
-                }
-            }
-            response["breaches"].append(breach)
+    response = {
+        "simulation_id": str(uuid.uuid4()),
+        "timestamp": datetime.now().isoformat(),
+        "breaches": []
+    }
 
-        # Add summary statistics
-        response["summary"] = {
-            "total_breaches": len(breach_reports),
+    print("\nBreach Reports:")
+    for report in breach_reports:
+        breach = {
+            "id": str(uuid.uuid4()),
             "timestamp": datetime.now().isoformat(),
-            "camera_id": str(camera_id)
+            "description": report.description,
+            "rule_id": str(report.rule_id),
+            "severity": report.severity if hasattr(report, 'severity') else "medium",
+            "location": report.location if hasattr(report, 'location') else None,
+            "confidence": report.confidence if hasattr(report, 'confidence') else 0.85,
+            "metadata": {
+                "frame_number": report.frame_number if hasattr(report, 'frame_number') else None,
+                "zone": report.zone if hasattr(report, 'zone') else None,
+                "additional_info": report.additional_info if hasattr(report, 'additional_info') else None
+            }
         }
+        response["breaches"].append(breach)
 
-        return response
-    except Exception as e:
-        raise HTTPException(status_code=400, detail=str(e))
+    # Add summary statistics
+    response["summary"] = {
+        "total_breaches": len(breach_reports),
+        "timestamp": datetime.now().isoformat(),
+        "camera_id": str(camera_id)
+    }
+
+    return response
+
+
+_sync_client = None
+
+
+def _get_sync_client():
+    """Shared sync client for the simulation job threads (they run off the event loop)."""
+    global _sync_client
+    if _sync_client is None:
+        _sync_client = edgedb.create_client()
+    return _sync_client
+
+
+def submit_simulation(camera_id: str, video_id: str):
+    try:
+        return simulation_jobs.submit("simulate", run_simulation, camera_id=camera_id, video_id=video_id)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=f"Too many simulations queued: {e}")
+
+
+class SimulationCreate(BaseModel):
+    camera_id: str
+    video_id: str
+
+
+@router.post("/simulations", status_code=202)
+async def create_simulation(simulation: SimulationCreate):
+    """
+    Queue a simulation and return its job id immediately; poll
+    GET /simulations/{job_id} or stream GET /simulations/{job_id}/events.
+
+    Example curl:
+    curl -X POST "http://localhost:8000/simulations" \
+      -H "Content-Type: application/json" \
+      -d '{"camera_id": "CAMERA_UUID", "video_id": "clip.mp4"}'
+    """
+    job = submit_simulation(simulation.camera_id, simulation.video_id)
+    return job.to_dict()
+
+
+@router.get("/simulations")
+async def list_simulations():
+    """Queued, running and recently finished simulations, newest first."""
+    return [job.to_dict() for job in simulation_jobs.list()]
+
+
+@router.get("/simulations/{job_id}")
+async def get_simulation(job_id: str):
+    """
+    Status of a simulation job, with its result once done.
+
+    Example curl:
+    curl -X GET "http://localhost:8000/simulations/JOB_ID"
+    """
+    job = simulation_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Simulation not found")
+    return job.to_dict()
+
+
+@router.get("/simulations/{job_id}/events")
+async def stream_simulation(job_id: str):
+    """
+    Stream a simulation job as newline-delimited JSON: its current state right
+    away, then the final state (with the result) when it finishes.
+
+    Example curl:
+    curl -N "http://localhost:8000/simulations/JOB_ID/events"
+    """
+    job = simulation_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Simulation not found")
+
+    async def events():
+        yield json.dumps(job.to_dict()) + "\n"
+        if not job.finished:
+            await asyncio.wrap_future(job.future)
+            yield json.dumps(job.to_dict()) + "\n"
+
+    return StreamingResponse(events(), media_type="application/x-ndjson")
+
+
+@router.get("/simulate")
+async def simulate_log_entry(camera_id: str, video_id: str):
+    """
+    Run a simulation and wait for its result. The work runs on the simulation job
+    pool, so other requests are served meanwhile.
+
+    Example curl:
+    curl -X GET "http://localhost:8000/simulate?camera_id=CAMERA_UUID&video_id=clip.mp4"
+    """
+    job = submit_simulation(camera_id, video_id)
+    await asyncio.wrap_future(job.future)
+    if job.status == "failed":
+        raise HTTPException(status_code=400, detail=job.error)
+    return job.result
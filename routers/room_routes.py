@@ -1,6 +1,9 @@
+import json
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from db import client
+from routers.bulk import bulk_response, check_batch_size, item_created, item_failed
+from tasks.rule_index import rule_index
 
 router = APIRouter()
 
@@ -30,61 +33,106 @@ curl -X POST "http://localhost:8000/rooms" \
 }
 '''
 
+# The user's rooms with their camera and rule counts; `{user}` selects the user.
+# The counts follow the Camera.room and Rule.rooms backlinks of each room instead
+# of scanning every Camera and Rule, so listing stays cheap for users with many rooms.
+ROOM_SUMMARY_QUERY = '''
+    WITH
+    u := ({user})
+    SELECT (
+    FOR r IN {{ u.rooms }}
+    UNION (
+        SELECT {{
+        uid := r.id,
+        name := r.name,
+        num_cameras := count(r.<room[IS Camera]),
+        num_rules := count(r.<rooms[IS Rule])
+        }}
+    )
+    )
+'''
+
+LIST_ROOMS_QUERY = ROOM_SUMMARY_QUERY.format(user="SELECT User FILTER .id = <uuid>$user_id")
+
+# Insert, link and list in one (implicitly transactional) query. The nested
+# INSERT runs once per matched user, so nothing is created for an unknown user.
+CREATE_ROOM_QUERY = ROOM_SUMMARY_QUERY.format(user='''
+        UPDATE User FILTER .id = <uuid>$user_id SET {
+            rooms += (INSERT Room { name := <str>$name })
+        }
+''')
+
 @router.post("/rooms")
 async def create_room(room: RoomCreate):
     try:
-        # Create the room using a CTE to return the inserted record.
-        room_obj = await client.query_single(
-            '''
-            WITH inserted := (
-                INSERT Room {
-                    name := <str>$name
-                }
-            )
-            SELECT inserted { id, name };
-            ''',
-            name=room.name
-        )
-        
-        # Update the User record to add this room to the user's rooms multi-link.
-        await client.query(
-            '''
-            UPDATE User FILTER .id = <uuid>$user_id SET {
-                rooms += (SELECT Room FILTER .id = <uuid>$room_id)
-            }
-            ''',
-            user_id=room.user_id,
-            room_id=room_obj.id
-        )
+        # Returns all of the user's rooms, including the new one.
+        rooms = await client.query(CREATE_ROOM_QUERY, user_id=room.user_id, name=room.name)
+        if not rooms:
+            raise HTTPException(status_code=404, detail="User not found")
 
-        # Get all rooms for the user.
-        rooms = await client.query(
-            '''
-            WITH 
-            u := (SELECT User FILTER .id = <uuid>$user_id),
-            user_rooms := (SELECT u.rooms)
-            SELECT (
-            FOR r IN { user_rooms }
+        return rooms
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+class RoomBulkCreate(BaseModel):
+    user_id: str  # The user's UUID to which all rooms are added
+    names: list[str]
+
+BULK_CREATE_ROOMS_QUERY = '''
+WITH
+    u := (SELECT User FILTER .id = <uuid>$user_id),
+    created := (
+        FOR owner IN u
+        UNION (
+            FOR item IN array_unpack(<array<json>>$items)
             UNION (
                 SELECT {
-                name := r.name,
-                uid := r.id,
-                num_cameras := (
-                    SELECT count(Camera FILTER .room.id = r.id)
-                ),
-                num_rules := (
-                    SELECT count(Rule FILTER r.id IN (.rooms.id))
-                )
+                    index := <int64>item['index'],
+                    room := (INSERT Room { name := <str>item['name'] })
                 }
             )
-            )
-            ''',
-            user_id=room.user_id
         )
+    ),
+    linked := (UPDATE u SET { rooms += created.room })
+SELECT {
+    user_found := EXISTS linked,
+    items := created { index, room: { id, name } }
+}
+'''
 
-        return rooms
+@router.post("/rooms/bulk")
+async def bulk_create_rooms(batch: RoomBulkCreate):
+    """
+    Create many rooms for one user in a single transaction. `results` has one
+    entry per name, in request order.
+
+    Example curl:
+    curl -X POST "http://localhost:8000/rooms/bulk" \
+      -H "Content-Type: application/json" \
+      -d '{"user_id": "USER_UUID", "names": ["Warehouse", "Loading Bay"]}'
+    """
+    check_batch_size(batch.names)
+    results = []
+    items = []
+    for index, name in enumerate(batch.names):
+        if not name.strip():
+            results.append(item_failed(index, "Room name is empty"))
+        else:
+            items.append(json.dumps({"index": index, "name": name}))
+
+    try:
+        outcome = await client.query_single(BULK_CREATE_ROOMS_QUERY, user_id=batch.user_id, items=items)
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
+    if not outcome.user_found:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    for item in outcome.items:
+        results.append(item_created(item.index, id=str(item.room.id), name=item.room.name))
+    return bulk_response(results)
 
 
 @router.delete("/rooms/{room_id}")
@@ -96,6 +144,8 @@ async def delete_room(room_id: str):
             ''',
             room_id=room_id
         )
+        # Rules linked to the room no longer apply to its cameras.
+        rule_index.invalidate()
         return {"status": "room deleted"}
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
@@ -108,27 +158,7 @@ async def get_rooms(user_id: str):
     Returns all rooms for the user, along with the camera count and rule count for each room.
     """
     try:
-        query = r'''
-        WITH 
-        u := (SELECT User FILTER .id = <uuid>$user_id),
-        user_rooms := (SELECT u.rooms)
-        SELECT (
-        FOR r IN { user_rooms }
-        UNION (
-            SELECT {
-            uid := r.id,
-            name := r.name,
-            num_cameras := (
-                SELECT count(Camera FILTER .room.id = r.id)
-            ),
-            num_rules := (
-                SELECT count(Rule FILTER r.id IN (.rooms.id))
-            )
-            }
-        )
-        )
-        '''
-        rooms = await client.query(query, user_id=user_id)
+        rooms = await client.query(LIST_ROOMS_QUERY, user_id=user_id)
         return rooms
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
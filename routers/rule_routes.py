@@ -1,6 +1,9 @@
+import json
 from fastapi import APIRouter, HTTPException
 from pydantic import BaseModel
 from db import client
+from routers.bulk import bulk_response, check_batch_size, is_uuid, item_created, item_failed
+from tasks.rule_index import rule_index
 
 router = APIRouter()
 
@@ -51,11 +54,93 @@ async def create_rule(rule: RuleCreate):
             user_id=rule.user_id,
             rule_id= rule_obj.id
         )
+        rule_index.invalidate()
         
         return rule_obj
     except Exception as e:
         raise HTTPException(status_code=400, detail=str(e))
     
+
+class RuleBulkItem(BaseModel):
+    text: str
+    shared: bool
+    rooms_ids: list[str] = []  # Optional list of Room UUIDs
+
+class RuleBulkCreate(BaseModel):
+    user_id: str  # The User's UUID to which all rules are added
+    rules: list[RuleBulkItem]
+
+# As in create_rule, room ids that match no Room are ignored.
+BULK_CREATE_RULES_QUERY = '''
+WITH
+    u := (SELECT User FILTER .id = <uuid>$user_id),
+    created := (
+        FOR owner IN u
+        UNION (
+            FOR item IN array_unpack(<array<json>>$items)
+            UNION (
+                SELECT {
+                    index := <int64>item['index'],
+                    rule := (
+                        INSERT Rule {
+                            text := <str>item['text'],
+                            shared := <bool>item['shared'],
+                            rooms := (SELECT Room FILTER .id IN <uuid>json_array_unpack(item['rooms_ids']))
+                        }
+                    )
+                }
+            )
+        )
+    ),
+    linked := (UPDATE u SET { rules += created.rule })
+SELECT {
+    user_found := EXISTS linked,
+    items := created { index, rule: { id, text, shared } }
+}
+'''
+
+# Example curl command to create several rules at once:
+#
+# curl -X POST "http://localhost:8000/rules/bulk" \
+#   -H "Content-Type: application/json" \
+#   -d '{
+#         "user_id": "USER_UUID",
+#         "rules": [
+#           {"text": "No one without a helmet", "shared": true},
+#           {"text": "Door stays closed", "shared": false, "rooms_ids": ["ROOM_UUID"]}
+#         ]
+#       }'
+
+@router.post("/rules/bulk")
+async def bulk_create_rules(batch: RuleBulkCreate):
+    """
+    Create many rules for one user in a single transaction; `results` has one
+    entry per rule, in request order. Rules with a malformed room id fail and the
+    rest are still created.
+    """
+    check_batch_size(batch.rules)
+    results = []
+    items = []
+    for index, rule in enumerate(batch.rules):
+        if not all(is_uuid(room_id) for room_id in rule.rooms_ids):
+            results.append(item_failed(index, "Invalid room id in rooms_ids"))
+        else:
+            items.append(json.dumps({"index": index, **rule.dict()}))
+
+    try:
+        outcome = await client.query_single(BULK_CREATE_RULES_QUERY, user_id=batch.user_id, items=items)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not outcome.user_found:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    for item in outcome.items:
+        results.append(item_created(item.index, id=str(item.rule.id), text=item.rule.text, shared=item.rule.shared))
+    if outcome.items:
+        rule_index.invalidate()
+
+    return bulk_response(results)
+
 @router.get("/rules")
 async def get_rules(user_id: str):
     try:
@@ -0,0 +1,104 @@
+import functools
+import logging
+import multiprocessing
+import os
+import signal
+import sys
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", 2))
+# How often (seconds) per-camera queue depth and wait times are logged.
+ANALYSIS_STATS_INTERVAL = float(os.getenv("ANALYSIS_STATS_INTERVAL", 60))
+
+
+def analysis_worker(queue, handler, shutdown=None):
+    """
+    Claim clips from `queue` forever and run `handler(clip, ack)` on each.
+
+    The handler calls `ack()` once the clip's results are durable, which may be
+    later and from another thread (see tasks.log_writer.BatchingLogWriter); a clip
+    that is never acked is handed out again when its lease expires. `shutdown()`
+    runs when the worker is terminated, e.g. to flush buffered results.
+    """
+    # terminate() sends SIGTERM; exit through the finally block instead of dying on the spot.
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        while True:
+            # Blocks until a capture worker enqueues a clip.
+            clip = queue.claim()
+            try:
+                handler(clip, functools.partial(queue.ack, clip.id))
+            except Exception as e:
+                logging.error(f"Processing clip {clip.path} failed: {e}")
+                queue.fail(clip.id, str(e))
+    finally:
+        if shutdown:
+            shutdown()
+
+
+class AnalysisPool:
+    """
+    A fixed-size pool of analysis worker processes sharing one clip queue.
+
+    Fairness and backpressure come from the queue itself (round-robin claims and a
+    per-camera backlog bound); the pool keeps the workers alive and reports the
+    queue's per-camera depth and wait times.
+    """
+
+    def __init__(self, queue, handler, workers=ANALYSIS_WORKERS, stats_interval=ANALYSIS_STATS_INTERVAL,
+                 shutdown=None):
+        self.queue = queue
+        self.handler = handler
+        self.shutdown = shutdown
+        self.size = workers
+        self.stats_interval = stats_interval
+        self.workers = []
+        self.running = False
+        self.stopped = threading.Event()
+
+    def run(self):
+        """Start the workers and supervise them until `stop` is called. Blocks the calling thread."""
+        self.running = True
+        self.workers = [self._spawn(i) for i in range(self.size)]
+        logging.info(f"Analysis pool started with {self.size} workers.")
+        while self.running:
+            for i, worker in enumerate(self.workers):
+                if not worker.is_alive():
+                    logging.warning(f"Analysis worker {i} exited ({worker.exitcode}), restarting.")
+                    self.workers[i] = self._spawn(i)
+            self.report()
+            try:
+                self.queue.prune_dead()
+            except Exception as e:
+                logging.error(f"Pruning dead clips failed: {e}")
+            self.stopped.wait(self.stats_interval)
+
+    def stop(self):
+        self.running = False
+        self.stopped.set()
+        for worker in self.workers:
+            worker.terminate()
+            worker.join(timeout=5)
+        logging.info("Analysis pool stopped.")
+
+    def report(self):
+        for camera_id, stats in self.queue.stats().items():
+            avg_wait = f"{stats['avg_wait']:.1f}s" if stats["avg_wait"] is not None else "-"
+            logging.info(
+                f"Camera {camera_id}: pending={stats['pending']} in_progress={stats['in_progress']} "
+                f"oldest_wait={stats['oldest_wait']:.1f}s avg_wait={avg_wait} dropped={stats['dropped']}"
+            )
+
+    def _spawn(self, index):
+        worker = multiprocessing.Process(
+            target=analysis_worker,
+            args=(self.queue, self.handler, self.shutdown),
+            name=f"analysis-{index}",
+            daemon=True,
+        )
+        worker.start()
+        return worker
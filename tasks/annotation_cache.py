@@ -0,0 +1,153 @@
+import hashlib
+import json
+import logging
+import os
+import pickle
+import tempfile
+import time
+
+from dotenv import load_dotenv
+
+from tasks.sqlite_util import LocalConnection, Transaction
+
+load_dotenv()
+
+TMP_FOLDER = os.getenv("TMP_FOLDER", "./tmp")
+ANNOTATION_CACHE_DIR = os.getenv("ANNOTATION_CACHE_DIR", os.path.join(TMP_FOLDER, "annotation_cache"))
+# Least recently used entries are evicted once the cached values take more than this.
+ANNOTATION_CACHE_MAX_BYTES = int(os.getenv("ANNOTATION_CACHE_MAX_BYTES", 256 * 1024 ** 2))
+# Bump to invalidate every entry, e.g. after changing the models, prompts or proxy settings.
+ANNOTATION_CACHE_VERSION = os.getenv("ANNOTATION_CACHE_VERSION", "1")
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    key TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    used_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS entries_by_use ON entries (used_at);
+'''
+
+
+def clip_hash(path, chunk_size=1024 * 1024):
+    """sha256 of a clip's content."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def rules_hash(rules):
+    """Order-independent hash of a rule set (anything with `id` and `text`)."""
+    canonical = sorted((str(rule.id), rule.text) for rule in rules)
+    return hashlib.sha256(json.dumps(canonical).encode()).hexdigest()
+
+
+class AnnotationCache:
+    """
+    Persistent cache of (annotations, breach reports) per clip and rule set.
+
+    The key is the clip's content hash plus a hash of the rules that apply to the
+    camera (see tasks.rule_index), so re-analysing the same footage against the
+    same rules is a disk read, while any rule change misses. Values are pickled
+    to one file each; a SQLite index tracks their size and last use for LRU
+    eviction within `max_bytes`.
+    """
+
+    def __init__(self, folder=ANNOTATION_CACHE_DIR, max_bytes=ANNOTATION_CACHE_MAX_BYTES,
+                 version=ANNOTATION_CACHE_VERSION):
+        self.folder = folder
+        self.max_bytes = max_bytes
+        self.version = version
+        os.makedirs(self.folder, exist_ok=True)
+        # The cache is used from the simulation job threads as well as the analysis workers.
+        self._connections = LocalConnection(os.path.join(self.folder, "index.sqlite3"), SCHEMA)
+
+    @property
+    def conn(self):
+        return self._connections.get()
+
+    def key(self, clip_path, rules, settings=None):
+        parts = (self.version, clip_hash(clip_path), rules_hash(rules))
+        if settings is not None:
+            # Anything else that changes the result, e.g. the camera's motion settings.
+            parts += (json.dumps(settings, sort_keys=True),)
+        return hashlib.sha256("\0".join(parts).encode()).hexdigest()
+
+    def get(self, key):
+        """Cached value for `key`, or None."""
+        try:
+            with open(self._path(key), "rb") as f:
+                value = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            logging.warning(f"Dropping unreadable annotation cache entry {key}: {e}")
+            self.delete(key)
+            return None
+        self.conn.execute("UPDATE entries SET used_at = ? WHERE key = ?", (time.time(), key))
+        return value
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partial entry.
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+        now = time.time()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO entries (key, size, created_at, used_at) VALUES (?, ?, ?, ?)",
+            (key, os.path.getsize(path), now, now),
+        )
+        self.evict()
+
+    def delete(self, key):
+        self.conn.execute("DELETE FROM entries WHERE key = ?", (key,))
+        self._remove_file(key)
+
+    def evict(self):
+        """Remove least recently used entries until the cache fits in `max_bytes`."""
+        with Transaction(self.conn) as conn:
+            total = conn.execute("SELECT coalesce(sum(size), 0) FROM entries").fetchone()[0]
+            evicted = []
+            if total > self.max_bytes:
+                for key, size in conn.execute("SELECT key, size FROM entries ORDER BY used_at"):
+                    if total <= self.max_bytes:
+                        break
+                    evicted.append(key)
+                    total -= size
+                conn.executemany("DELETE FROM entries WHERE key = ?", [(key,) for key in evicted])
+        for key in evicted:
+            self._remove_file(key)
+        return len(evicted)
+
+    def cached_analysis(self, clip_path, rules, analyze, settings=None):
+        """
+        `(annotations, breach_reports)` for a clip under a rule set, from the cache
+        or by calling `analyze()` (which must return that pair) and caching it.
+        `settings` (JSON-serialisable) is part of the key as well.
+        """
+        key = self.key(clip_path, rules, settings)
+        cached = self.get(key)
+        if cached is not None:
+            logging.info(f"Annotation cache hit for {clip_path}")
+            return cached
+        result = analyze()
+        self.put(key, result)
+        return result
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], f"{key}.pickle")
+
+    def _remove_file(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+
+annotation_cache = AnnotationCache()
@@ -0,0 +1,166 @@
+import collections
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+from motion_detection import create_motion_detector
+
+load_dotenv()
+
+# Seconds between the heartbeats a capture worker publishes.
+HEARTBEAT_INTERVAL = float(os.getenv("HEARTBEAT_INTERVAL", 5))
+# A camera whose worker is alive but recorded no frame for this many seconds is "stale".
+CAMERA_STALE_AFTER = float(os.getenv("CAMERA_STALE_AFTER", 15))
+# A camera whose worker sent no heartbeat for this many seconds is "offline".
+CAMERA_OFFLINE_AFTER = float(os.getenv("CAMERA_OFFLINE_AFTER", 30))
+# The motion ratio is the share of this many recent snapshots that showed motion.
+HEALTH_MOTION_WINDOW = int(os.getenv("HEALTH_MOTION_WINDOW", 30))
+HEARTBEAT_QUEUE_SIZE = int(os.getenv("HEARTBEAT_QUEUE_SIZE", 1024))
+
+Heartbeat = namedtuple("Heartbeat", [
+    "camera_id", "pid", "mode", "last_frame_at", "fps", "motion_ratio", "last_error", "sent_at",
+])
+
+
+class CameraHealthRegistry:
+    """
+    Latest heartbeat of every capture worker, kept in memory in the API process.
+
+    Workers `publish()` a `Heartbeat` every HEARTBEAT_INTERVAL seconds through a
+    process-shared queue and a thread in the API process keeps only the newest
+    per camera, so `status()` is a dict lookup: no query, no stream is opened.
+    """
+
+    def __init__(self, queue_size=HEARTBEAT_QUEUE_SIZE, stale_after=CAMERA_STALE_AFTER,
+                 offline_after=CAMERA_OFFLINE_AFTER):
+        # Created before the workers fork, so every process shares it.
+        self.queue = multiprocessing.Queue(maxsize=queue_size)
+        self.stale_after = stale_after
+        self.offline_after = offline_after
+        self.latest = {}  # camera_id -> Heartbeat
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def publish(self, heartbeat):
+        """Called from a capture worker. Drops the heartbeat if the API process is behind."""
+        try:
+            self.queue.put_nowait(heartbeat)
+        except queue.Full:
+            pass
+
+    def start(self):
+        """Start collecting published heartbeats (in the API process)."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._collect, name="camera-health", daemon=True)
+            self.thread.start()
+        return self
+
+    def update(self, heartbeat):
+        with self.lock:
+            self.latest[str(heartbeat.camera_id)] = heartbeat
+
+    def get(self, camera_id):
+        """Latest `Heartbeat` of a camera, or None if its worker never reported."""
+        with self.lock:
+            return self.latest.get(str(camera_id))
+
+    def remove(self, camera_id):
+        with self.lock:
+            self.latest.pop(str(camera_id), None)
+
+    def status(self, camera_id, now=None):
+        """Health of a camera as a JSON-ready dict; `status` is "online", "stale" or "offline"."""
+        heartbeat = self.get(camera_id)
+        now = now or time.time()
+        if heartbeat is None or now - heartbeat.sent_at > self.offline_after:
+            state = "offline"
+        elif heartbeat.last_frame_at is None or now - heartbeat.last_frame_at > self.stale_after:
+            state = "stale"
+        else:
+            state = "online"
+        return {
+            "camera_id": str(camera_id),
+            "status": state,
+            "last_frame_at": heartbeat.last_frame_at if heartbeat else None,
+            "fps": heartbeat.fps if heartbeat else None,
+            "motion_ratio": heartbeat.motion_ratio if heartbeat else None,
+            "last_error": heartbeat.last_error if heartbeat else None,
+            "last_heartbeat_at": heartbeat.sent_at if heartbeat else None,
+        }
+
+    def _collect(self):
+        while True:
+            try:
+                self.update(self.queue.get())
+            except Exception as e:
+                logging.error(f"Camera health registry: {e}")
+
+
+class HealthReporter:
+    """
+    Worker side of the registry: scores motion on the snapshots the recorder
+    already produces (so no extra decoding of the stream) and publishes a
+    heartbeat from the recorder's `stats` every `interval` seconds.
+
+    Motion is scored with the camera's `motion_backend`, inside its `motion_zones`.
+    """
+
+    def __init__(self, camera_id, registry, interval=HEARTBEAT_INTERVAL, window=HEALTH_MOTION_WINDOW,
+                 motion_backend=None, motion_zones=None):
+        self.camera_id = str(camera_id)
+        self.registry = registry
+        self.interval = interval
+        self.motion_backend = motion_backend
+        self.motion_zones = motion_zones
+        self.detector = self._detector()
+        self.motion = collections.deque(maxlen=window)
+
+    def observe_snapshot(self, jpeg):
+        frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_REDUCED_COLOR_4)
+        if frame is None:
+            return
+        if self.detector.size is not None and self.detector.size != (frame.shape[1], frame.shape[0]):
+            # The stream changed resolution (e.g. after a fallback to transcoding).
+            self.detector = self._detector()
+        score = self.detector.score(frame)
+        if score is not None:
+            self.motion.append(score > self.detector.threshold)
+
+    def _detector(self):
+        # Snapshots are decoded at a quarter size, which is the proxy resolution already.
+        return create_motion_detector(self.motion_backend, scale=1.0, zones=self.motion_zones)
+
+    def start(self, recorder):
+        threading.Thread(target=self._run, args=(recorder,), name="heartbeat", daemon=True).start()
+        return self
+
+    def _run(self, recorder):
+        frames, sent_at = recorder.stats["frames"], time.time()
+        while True:
+            time.sleep(self.interval)
+            now = time.time()
+            stats = dict(recorder.stats)
+            fps = (stats["frames"] - frames) / (now - sent_at)
+            frames, sent_at = stats["frames"], now
+            motion = list(self.motion)
+            self.registry.publish(Heartbeat(
+                camera_id=self.camera_id,
+                pid=os.getpid(),
+                mode=recorder.mode,
+                last_frame_at=stats["last_frame_at"],
+                fps=round(fps, 2),
+                motion_ratio=round(sum(motion) / len(motion), 3) if motion else None,
+                last_error=stats["last_error"],
+                sent_at=now,
+            ))
+
+
+camera_health = CameraHealthRegistry()
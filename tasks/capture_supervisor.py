@@ -0,0 +1,203 @@
+import json
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import namedtuple
+
+import edgedb
+from dotenv import load_dotenv
+
+from live_view import live_views
+from tasks.camera_health import HealthReporter, camera_health
+from tasks.clip_queue import clip_queue
+from tasks.segment_store import segment_store
+from tasks.snapshot_registry import snapshot_registry
+from video_recorder import VideoSnippetRecorder
+
+load_dotenv()
+
+TMP_FOLDER = os.getenv("TMP_FOLDER", "./tmp")
+SNIPPET_DURATION = int(os.getenv("SNIPPET_DURATION", 20))
+# How often (seconds) the supervisor reconciles its workers against the Camera table.
+SUPERVISOR_SYNC_INTERVAL = float(os.getenv("SUPERVISOR_SYNC_INTERVAL", 30))
+# Back-off (seconds) before a worker retries a camera that could not be opened.
+CAPTURE_RETRY_DELAY = float(os.getenv("CAPTURE_RETRY_DELAY", 5))
+# Most capture workers started per second, so a large batch of new cameras does
+# not fork thousands of processes at once.
+CAPTURE_START_RATE = int(os.getenv("CAPTURE_START_RATE", 20))
+
+# What a capture worker is started with; a worker is restarted when any of it changes.
+CameraConfig = namedtuple("CameraConfig", ["ip_address", "motion_backend", "motion_zones"])
+
+
+def camera_config(camera):
+    """`CameraConfig` of a Camera object with ip_address, motion_backend and motion_zones."""
+    zones = camera.motion_zones
+    if isinstance(zones, str):
+        # EdgeDB returns json properties as text; parse it so configs compare by value.
+        zones = json.loads(zones)
+    return CameraConfig(camera.ip_address, camera.motion_backend, zones)
+
+
+def capture_worker(camera_id, config):
+    """
+    Record snippets from a single camera forever and hand them to the analysis side.
+    Runs in its own process so capture of many cameras spreads across cores.
+    """
+    ip_address = config.ip_address
+    health = HealthReporter(camera_id, camera_health, motion_backend=config.motion_backend,
+                            motion_zones=config.motion_zones)
+
+    def on_snapshot(jpeg):
+        # Keeps GET /cameras/{id}/snapshot current without anyone opening the stream.
+        snapshot_registry.publish(camera_id, jpeg)
+        health.observe_snapshot(jpeg)
+        if recorder.mode == "copy":
+            # Copy mode decodes no other frames, so live viewers get the snapshots.
+            live_views.publish(camera_id, jpeg)
+
+    def on_frame(frame):
+        # GET /cameras/{id}/live; only encoded while someone is watching.
+        live_views.publish_frame(camera_id, frame)
+
+    recorder = VideoSnippetRecorder(
+        duration=SNIPPET_DURATION,
+        source=ip_address,
+        tmp_folder=os.path.join(TMP_FOLDER, camera_id),
+        on_snapshot=on_snapshot,
+        on_frame=on_frame,
+    )
+    # Heartbeats feed GET /cameras/status and the dashboard.
+    health.start(recorder)
+    logging.info(f"Capture worker started for camera {camera_id} ({ip_address})")
+    while True:
+        for snippet in recorder.record_segments():
+            # The store owns the file from here on; retention decides when it goes.
+            segment = segment_store.add(camera_id, snippet.path, snippet.start, snippet.end)
+            clip_queue.enqueue(camera_id, segment.path)
+        # The stream ended or could not be opened; back off before reconnecting.
+        time.sleep(CAPTURE_RETRY_DELAY)
+
+
+class CaptureSupervisor:
+    """
+    Keeps exactly one capture worker process alive per Camera row.
+
+    Cameras are registered either by the periodic sync against the database or
+    directly by the camera routes when cameras are created or deleted. Those calls
+    only record the desired state and wake the supervisor thread; starting and
+    stopping worker processes (fork, terminate, join) happens on that thread, so
+    the routes never block the event loop on it.
+    """
+
+    def __init__(self, sync_interval=SUPERVISOR_SYNC_INTERVAL, start_rate=CAPTURE_START_RATE):
+        self.sync_interval = sync_interval
+        self.start_rate = start_rate
+        self.cameras = {}  # camera_id -> CameraConfig (desired state)
+        self.workers = {}  # camera_id -> (multiprocessing.Process, CameraConfig it runs with); supervisor thread only
+        self.running = False
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+    def add_camera(self, camera_id, config):
+        """Register (or update) a camera; the supervisor thread starts or restarts its worker."""
+        self.add_cameras({camera_id: config})
+
+    def add_cameras(self, cameras):
+        """Register many cameras (camera_id -> CameraConfig) at once."""
+        with self.lock:
+            for camera_id, config in cameras.items():
+                self.cameras[str(camera_id)] = config
+        self.wakeup.set()
+
+    def remove_camera(self, camera_id):
+        """Forget a camera; the supervisor thread stops its worker."""
+        with self.lock:
+            self.cameras.pop(str(camera_id), None)
+        self.wakeup.set()
+
+    def sync(self, client):
+        """Replace the desired state with the Camera table."""
+        rows = client.query('SELECT Camera { id, ip_address, motion_backend, motion_zones }')
+        desired = {str(row.id): camera_config(row) for row in rows}
+        with self.lock:
+            self.cameras = desired
+
+    def run(self):
+        """Supervise workers until `stop` is called. Blocks the calling thread."""
+        client = edgedb.create_client()
+        self.running = True
+        logging.info("Capture supervisor started.")
+        next_sync = 0.0
+        while self.running:
+            if time.monotonic() >= next_sync:
+                try:
+                    self.sync(client)
+                except Exception as e:
+                    logging.error(f"Camera sync failed: {e}")
+                next_sync = time.monotonic() + self.sync_interval
+            backlog = self.reconcile()
+            # With workers still to start, come back as soon as the start rate allows.
+            self.wakeup.wait(1 if backlog else max(0.0, next_sync - time.monotonic()))
+            self.wakeup.clear()
+        self._stop_all()
+
+    def reconcile(self):
+        """
+        Stop workers of removed (or reconfigured) cameras and start missing or dead
+        ones, at most `start_rate` per call. Returns how many are still to start.
+        """
+        with self.lock:
+            desired = dict(self.cameras)
+        for camera_id, (worker, config) in list(self.workers.items()):
+            if desired.get(camera_id) != config:
+                self._stop_worker(camera_id)
+        missing = []
+        for camera_id, config in desired.items():
+            entry = self.workers.get(camera_id)
+            if entry is not None and entry[0].is_alive():
+                continue
+            if entry is not None:
+                # Crash, stream error, OOM...
+                logging.warning(f"Capture worker for camera {camera_id} exited ({entry[0].exitcode}), restarting.")
+                del self.workers[camera_id]
+            missing.append((camera_id, config))
+        for camera_id, config in missing[:self.start_rate]:
+            self._start_worker(camera_id, config)
+        return max(0, len(missing) - self.start_rate)
+
+    def stop(self):
+        self.running = False
+        self.wakeup.set()
+        logging.info("Capture supervisor stopping.")
+
+    def _start_worker(self, camera_id, config):
+        # Shared with the worker, so it must exist before the fork.
+        live_views.watch_flag(camera_id)
+        worker = multiprocessing.Process(
+            target=capture_worker,
+            args=(camera_id, config),
+            name=f"capture-{camera_id}",
+            daemon=True,
+        )
+        worker.start()
+        self.workers[camera_id] = (worker, config)
+
+    def _stop_worker(self, camera_id):
+        entry = self.workers.pop(camera_id, None)
+        if entry is None:
+            return
+        worker = entry[0]
+        worker.terminate()
+        worker.join(timeout=5)
+        logging.info(f"Capture worker for camera {camera_id} stopped.")
+
+    def _stop_all(self):
+        for camera_id in list(self.workers):
+            self._stop_worker(camera_id)
+        logging.info("Capture supervisor stopped.")
+
+
+supervisor = CaptureSupervisor()
@@ -0,0 +1,284 @@
+import logging
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+
+from dotenv import load_dotenv
+
+from tasks.sqlite_util import LocalConnection, Transaction
+
+load_dotenv()
+
+TMP_FOLDER = os.getenv("TMP_FOLDER", "./tmp")
+CLIP_QUEUE_PATH = os.getenv("CLIP_QUEUE_PATH", os.path.join(TMP_FOLDER, "clip_queue.sqlite3"))
+# A claimed clip that is not acked within this many seconds is handed out again
+# (the worker holding it is assumed dead).
+CLIP_LEASE_SECONDS = float(os.getenv("CLIP_LEASE_SECONDS", 900))
+CLIP_MAX_ATTEMPTS = int(os.getenv("CLIP_MAX_ATTEMPTS", 3))
+CLIP_RETRY_DELAY = float(os.getenv("CLIP_RETRY_DELAY", 30))
+# Dead clips (out of attempts) are kept this many seconds for inspection, then pruned.
+CLIP_DEAD_RETENTION = float(os.getenv("CLIP_DEAD_RETENTION", 7 * 24 * 3600))
+# Backpressure: at most this many pending clips per camera. When a camera is over
+# its bound, "drop_oldest" discards its oldest pending clip and "drop_newest"
+# rejects the incoming one.
+CLIP_QUEUE_MAX_PER_CAMERA = int(os.getenv("CLIP_QUEUE_MAX_PER_CAMERA", 10))
+CLIP_OVERLOAD_POLICY = os.getenv("CLIP_OVERLOAD_POLICY", "drop_oldest")
+OVERLOAD_POLICIES = ("drop_oldest", "drop_newest")
+
+Clip = namedtuple("Clip", ["id", "camera_id", "path", "attempts", "enqueued_at"])
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS clips (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    camera_id TEXT NOT NULL,
+    path TEXT NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    enqueued_at REAL NOT NULL,
+    available_at REAL NOT NULL,
+    claimed_at REAL,
+    last_error TEXT
+);
+CREATE INDEX IF NOT EXISTS clips_by_state ON clips (state, available_at, id);
+CREATE INDEX IF NOT EXISTS clips_by_camera ON clips (camera_id, state, id);
+CREATE TABLE IF NOT EXISTS camera_stats (
+    camera_id TEXT PRIMARY KEY,
+    last_claimed_at REAL NOT NULL DEFAULT 0,
+    claimed INTEGER NOT NULL DEFAULT 0,
+    dropped INTEGER NOT NULL DEFAULT 0,
+    total_wait REAL NOT NULL DEFAULT 0,
+    last_wait REAL
+);
+'''
+
+
+class ClipQueue:
+    """
+    Durable clip work queue between the capture workers and the analysis side.
+
+    Backed by a local SQLite database in WAL mode, so it needs no outside service,
+    survives restarts, and every operation touches a single row. A clip moves
+    pending -> claimed -> (acked and removed | pending again for retry | dead).
+    A clip whose lease runs out counts as a failed attempt, so one that keeps
+    crashing its worker also ends up dead. Dead clips are pruned by `prune_dead`.
+    Consumers block on a process-shared condition instead of polling.
+
+    Claims are round-robin across cameras (the camera served least recently goes
+    first) and each camera's backlog is bounded by `max_pending_per_camera`.
+    """
+
+    def __init__(self, path=CLIP_QUEUE_PATH, lease_seconds=CLIP_LEASE_SECONDS,
+                 max_attempts=CLIP_MAX_ATTEMPTS, retry_delay=CLIP_RETRY_DELAY,
+                 max_pending_per_camera=CLIP_QUEUE_MAX_PER_CAMERA,
+                 overload_policy=CLIP_OVERLOAD_POLICY, dead_retention=CLIP_DEAD_RETENTION):
+        if overload_policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload policy {overload_policy!r}, expected one of {OVERLOAD_POLICIES}")
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.max_pending_per_camera = max_pending_per_camera
+        self.overload_policy = overload_policy
+        self.dead_retention = dead_retention
+        # Created before the workers fork, so every process shares it.
+        self.cond = multiprocessing.Condition()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        # One connection per process and thread: clips can be acked from a log writer thread.
+        self._connections = LocalConnection(path, SCHEMA)
+
+    @property
+    def conn(self):
+        return self._connections.get()
+
+    def enqueue(self, camera_id, path):
+        """
+        Add a recorded clip to the queue and wake one waiting consumer.
+        Returns the clip id, or None if the overload policy rejected the clip.
+        """
+        camera_id = str(camera_id)
+        now = time.time()
+        dropped = []
+        with self._transaction() as conn:
+            pending = conn.execute(
+                "SELECT id, path FROM clips WHERE camera_id = ? AND state = 'pending' ORDER BY id",
+                (camera_id,),
+            ).fetchall()
+            overflow = len(pending) + 1 - self.max_pending_per_camera
+            if overflow > 0:
+                if self.overload_policy == "drop_newest":
+                    dropped = [(None, path)]
+                else:
+                    dropped = pending[:overflow]
+                    conn.executemany("DELETE FROM clips WHERE id = ?", [(row[0],) for row in dropped])
+                conn.execute(
+                    "INSERT INTO camera_stats (camera_id, dropped) VALUES (?, ?) "
+                    "ON CONFLICT (camera_id) DO UPDATE SET dropped = dropped + excluded.dropped",
+                    (camera_id, len(dropped)),
+                )
+            clip_id = None
+            if self.overload_policy != "drop_newest" or overflow <= 0:
+                clip_id = conn.execute(
+                    "INSERT INTO clips (camera_id, path, enqueued_at, available_at) VALUES (?, ?, ?, ?)",
+                    (camera_id, path, now, now),
+                ).lastrowid
+
+        for _, dropped_path in dropped:
+            # The footage stays in the segment store; only its analysis is skipped.
+            logging.warning(f"Camera {camera_id} is over its clip backlog, not analysing {dropped_path}")
+        if clip_id is not None:
+            with self.cond:
+                self.cond.notify()
+        return clip_id
+
+    def claim(self, timeout=None):
+        """
+        Take the next available clip (round-robin across cameras), blocking until one exists.
+        Returns a `Clip`, or None if `timeout` seconds pass without work.
+        """
+        deadline = None if timeout is None else time.time() + timeout
+        with self.cond:
+            while True:
+                clip = self._try_claim()
+                if clip is not None:
+                    return clip
+                wait = self._next_wakeup()
+                if deadline is not None:
+                    remaining = deadline - time.time()
+                    if remaining <= 0:
+                        return None
+                    wait = remaining if wait is None else min(wait, remaining)
+                self.cond.wait(wait)
+
+    def ack(self, clip_id):
+        """Mark a claimed clip as done; it is removed from the queue."""
+        self.conn.execute("DELETE FROM clips WHERE id = ?", (clip_id,))
+
+    def fail(self, clip_id, error=None):
+        """Release a claimed clip for a later retry, or park it as dead once out of attempts."""
+        now = time.time()
+        with self._transaction() as conn:
+            row = conn.execute("SELECT attempts FROM clips WHERE id = ?", (clip_id,)).fetchone()
+            if row is None:
+                return
+            if row[0] >= self.max_attempts:
+                # available_at of a dead clip is when it was given up on (see prune_dead).
+                conn.execute(
+                    "UPDATE clips SET state = 'dead', available_at = ?, last_error = ? WHERE id = ?",
+                    (now, error, clip_id),
+                )
+                logging.error(f"Clip {clip_id} failed {row[0]} times, giving up: {error}")
+                return
+            conn.execute(
+                "UPDATE clips SET state = 'pending', available_at = ?, claimed_at = NULL, last_error = ? WHERE id = ?",
+                (now + self.retry_delay * row[0], error, clip_id),
+            )
+        with self.cond:
+            self.cond.notify()
+
+    def prune_dead(self, max_age=None):
+        """Delete dead clips given up on more than `max_age` seconds ago. Returns how many."""
+        max_age = self.dead_retention if max_age is None else max_age
+        return self.conn.execute(
+            "DELETE FROM clips WHERE state = 'dead' AND available_at < ?",
+            (time.time() - max_age,),
+        ).rowcount
+
+    def queued_paths(self):
+        """Paths of the clips still waiting for (or in) analysis, so their files are kept."""
+        return {row[0] for row in self.conn.execute("SELECT path FROM clips WHERE state IN ('pending', 'claimed')")}
+
+    def pending_count(self):
+        return self.conn.execute("SELECT count(*) FROM clips WHERE state = 'pending'").fetchone()[0]
+
+    def stats(self):
+        """Per-camera queue depth and wait times (seconds), keyed by camera id."""
+        now = time.time()
+        stats = {}
+        for camera_id, claimed, dropped, total_wait, last_wait in self.conn.execute(
+            "SELECT camera_id, claimed, dropped, total_wait, last_wait FROM camera_stats"
+        ):
+            stats[camera_id] = {
+                "pending": 0,
+                "in_progress": 0,
+                "oldest_wait": 0.0,
+                "claimed": claimed,
+                "dropped": dropped,
+                "avg_wait": total_wait / claimed if claimed else None,
+                "last_wait": last_wait,
+            }
+        for camera_id, state, count, oldest in self.conn.execute(
+            "SELECT camera_id, state, count(*), min(enqueued_at) FROM clips "
+            "WHERE state IN ('pending', 'claimed') GROUP BY camera_id, state"
+        ):
+            entry = stats.setdefault(camera_id, {
+                "pending": 0, "in_progress": 0, "oldest_wait": 0.0, "claimed": 0,
+                "dropped": 0, "avg_wait": None, "last_wait": None,
+            })
+            if state == "pending":
+                entry["pending"] = count
+                entry["oldest_wait"] = now - oldest
+            else:
+                entry["in_progress"] = count
+        return stats
+
+    def _try_claim(self):
+        now = time.time()
+        with self._transaction() as conn:
+            # Leases that ran out belong to crashed workers: hand them out again,
+            # unless the clip is out of attempts (it may be what crashed them).
+            for clip_id, attempts in conn.execute(
+                "SELECT id, attempts FROM clips WHERE state = 'claimed' AND claimed_at < ?",
+                (now - self.lease_seconds,),
+            ).fetchall():
+                if attempts >= self.max_attempts:
+                    logging.error(f"Clip {clip_id} lease expired after {attempts} attempts, giving up.")
+                    conn.execute(
+                        "UPDATE clips SET state = 'dead', available_at = ?, last_error = 'lease expired' WHERE id = ?",
+                        (now, clip_id),
+                    )
+                else:
+                    conn.execute("UPDATE clips SET state = 'pending', claimed_at = NULL WHERE id = ?", (clip_id,))
+            # Oldest clip of the camera that was served least recently.
+            row = conn.execute(
+                "SELECT c.id, c.camera_id, c.path, c.attempts, c.enqueued_at FROM clips c "
+                "LEFT JOIN camera_stats s ON s.camera_id = c.camera_id "
+                "WHERE c.state = 'pending' AND c.available_at <= ? "
+                "ORDER BY coalesce(s.last_claimed_at, 0), c.id LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute(
+                "UPDATE clips SET state = 'claimed', claimed_at = ?, attempts = attempts + 1 WHERE id = ?",
+                (now, row[0]),
+            )
+            wait = now - row[4]
+            conn.execute(
+                "INSERT INTO camera_stats (camera_id, last_claimed_at, claimed, total_wait, last_wait) "
+                "VALUES (?, ?, 1, ?, ?) ON CONFLICT (camera_id) DO UPDATE SET "
+                "last_claimed_at = excluded.last_claimed_at, claimed = claimed + 1, "
+                "total_wait = total_wait + excluded.total_wait, last_wait = excluded.last_wait",
+                (row[1], now, wait, wait),
+            )
+        return Clip(row[0], row[1], row[2], row[3] + 1, row[4])
+
+    def _next_wakeup(self):
+        """Seconds until a delayed retry or an expiring lease makes work available, if any."""
+        now = time.time()
+        row = self.conn.execute(
+            "SELECT min(t) FROM ("
+            "  SELECT min(available_at) AS t FROM clips WHERE state = 'pending'"
+            "  UNION ALL SELECT min(claimed_at) + ? FROM clips WHERE state = 'claimed'"
+            ")",
+            (self.lease_seconds,),
+        ).fetchone()
+        if row[0] is None:
+            return None
+        return max(row[0] - now, 0.01)
+
+    def _transaction(self):
+        return Transaction(self.conn)
+
+
+clip_queue = ClipQueue()
@@ -0,0 +1,108 @@
+import collections
+import logging
+import os
+import threading
+import time
+import traceback
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Simulations call the annotation and analysis models; keep few running at once.
+SIMULATION_CONCURRENCY = int(os.getenv("SIMULATION_CONCURRENCY", 2))
+SIMULATION_MAX_PENDING = int(os.getenv("SIMULATION_MAX_PENDING", 20))
+
+
+class JobQueueFull(Exception):
+    """Raised by `JobRunner.submit` when too many jobs are already waiting."""
+
+
+class Job:
+    def __init__(self, kind, params):
+        self.id = str(uuid.uuid4())
+        self.kind = kind
+        self.params = params
+        self.status = "queued"  # queued -> running -> done | failed
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.error = None
+        self.future = None
+
+    @property
+    def finished(self):
+        return self.status in ("done", "failed")
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "kind": self.kind,
+            "params": self.params,
+            "status": self.status,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class JobRunner:
+    """
+    Runs blocking work (model calls, sync database clients) on a bounded thread
+    pool so async routes can hand it off and return a job id straight away.
+
+    At most `max_workers` jobs run at once and at most `max_pending` wait;
+    the last `history` finished jobs are kept for polling.
+    """
+
+    def __init__(self, name, max_workers, max_pending, history=100):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self.max_pending = max_pending
+        self.history = history
+        self.jobs = {}
+        self.finished = collections.deque()
+        self.lock = threading.Lock()
+
+    def submit(self, kind, fn, **params):
+        """Queue `fn(**params)`; its return value becomes the job result. Returns the `Job`."""
+        job = Job(kind, params)
+        with self.lock:
+            pending = sum(1 for j in self.jobs.values() if j.status == "queued")
+            if pending >= self.max_pending:
+                raise JobQueueFull(f"{pending} jobs are already waiting")
+            self.jobs[job.id] = job
+        job.future = self.executor.submit(self._run, job, fn)
+        return job
+
+    def get(self, job_id):
+        with self.lock:
+            return self.jobs.get(job_id)
+
+    def list(self):
+        with self.lock:
+            return sorted(self.jobs.values(), key=lambda job: job.created_at, reverse=True)
+
+    def _run(self, job, fn):
+        job.status = "running"
+        job.started_at = time.time()
+        try:
+            job.result = fn(**job.params)
+            job.status = "done"
+        except Exception as e:
+            logging.error(f"Job {job.id} ({job.kind}) failed: {e}\n{traceback.format_exc()}")
+            job.error = str(e)
+            job.status = "failed"
+        job.finished_at = time.time()
+        with self.lock:
+            self.finished.append(job.id)
+            while len(self.finished) > self.history:
+                self.jobs.pop(self.finished.popleft(), None)
+        return job
+
+
+simulation_jobs = JobRunner("simulate", SIMULATION_CONCURRENCY, SIMULATION_MAX_PENDING)
@@ -0,0 +1,236 @@
+import collections
+import datetime
+import json
+import logging
+import os
+import threading
+
+import edgedb
+from edgedb.errors import tags as edgedb_tags
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# When > 0, LogEntry inserts from several clips are merged for up to this many
+# seconds and written together; 0 writes each clip's reports immediately.
+LOG_BATCH_WINDOW = float(os.getenv("LOG_BATCH_WINDOW", 0))
+LOG_BATCH_MAX_SIZE = int(os.getenv("LOG_BATCH_MAX_SIZE", 500))
+# Flushes a batch gets through transient errors before its clips are left unacked (and retried by the queue).
+LOG_WRITE_MAX_RETRIES = int(os.getenv("LOG_WRITE_MAX_RETRIES", 5))
+TMP_FOLDER = os.getenv("TMP_FOLDER", "./tmp")
+# Entries the database rejects for good (unknown or deleted rule, ...) end up here.
+LOG_DEAD_LETTER_PATH = os.getenv("LOG_DEAD_LETTER_PATH", os.path.join(TMP_FOLDER, "log_dead_letter.jsonl"))
+
+# Entries are (camera_id, rule_id, description, time) tuples and counts are
+# (camera_id, UTC day, number of entries) tuples. The whole batch is one query,
+# hence one transaction, whatever the number of reports.
+INSERT_LOG_ENTRIES_QUERY = '''
+    WITH
+        inserted := (
+            FOR entry IN array_unpack(<array<tuple<uuid, uuid, str, datetime>>>$entries)
+            UNION (
+                INSERT LogEntry {
+                    camera := (SELECT Camera FILTER .id = entry.0),
+                    rule := (SELECT Rule FILTER .id = entry.1),
+                    description := entry.2,
+                    time := entry.3,
+                }
+            )
+        ),
+        counted := (
+            FOR c IN array_unpack(<array<tuple<uuid, cal::local_date, int64>>>$counts)
+            UNION (
+                INSERT CameraAlertCounter {
+                    camera := (SELECT Camera FILTER .id = c.0),
+                    day := c.1,
+                    count := c.2,
+                }
+                UNLESS CONFLICT ON (.camera, .day)
+                ELSE (
+                    UPDATE CameraAlertCounter SET { count := .count + c.2 }
+                )
+            )
+        )
+    SELECT (count(inserted), count(counted))
+'''
+
+
+def daily_counts(entries):
+    """Per (camera, UTC day) totals of LogEntry insert tuples, for the alert counters."""
+    counts = collections.Counter(
+        (camera_id, time.astimezone(datetime.timezone.utc).date()) for camera_id, _, _, time in entries
+    )
+    return [(camera_id, day, n) for (camera_id, day), n in counts.items()]
+
+
+def breach_entries(camera_id, breach_reports):
+    """Turn the analyzer's breach reports for one clip into LogEntry insert tuples."""
+    now = datetime.datetime.now(datetime.timezone.utc)
+    return [(str(camera_id), str(report.rule_id), report.description, now) for report in breach_reports]
+
+
+def insert_log_entries(client, entries):
+    if entries:
+        client.query(INSERT_LOG_ENTRIES_QUERY, entries=entries, counts=daily_counts(entries))
+
+
+def is_transient(error):
+    """True for errors worth retrying as is (lost connection, serialization conflict...)."""
+    if isinstance(error, (edgedb.ClientConnectionError, ConnectionError)):
+        return True
+    return isinstance(error, edgedb.EdgeDBError) and (
+        error.has_tag(edgedb_tags.SHOULD_RETRY) or error.has_tag(edgedb_tags.SHOULD_RECONNECT)
+    )
+
+
+def dead_letter(entries, error, path=None):
+    """Append entries that cannot be inserted (e.g. their rule was deleted) to a JSON-lines file."""
+    path = path or LOG_DEAD_LETTER_PATH
+    logging.error(f"Dropping {len(entries)} log entries that cannot be written: {error}")
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    with open(path, "a") as f:
+        for camera_id, rule_id, description, time in entries:
+            f.write(json.dumps({
+                "camera_id": camera_id, "rule_id": rule_id, "description": description,
+                "time": time.isoformat(), "error": str(error),
+            }) + "\n")
+
+
+def insert_or_dead_letter(client, entries):
+    """
+    Insert `entries` in one query. If that fails for a non-transient reason, insert
+    them one by one so a single bad entry only costs itself, and dead-letter the
+    ones that still fail. Transient errors are raised for the caller to retry.
+    """
+    try:
+        insert_log_entries(client, entries)
+        return
+    except Exception as e:
+        if is_transient(e):
+            raise
+        if len(entries) == 1:
+            dead_letter(entries, e)
+            return
+        logging.warning(f"Writing {len(entries)} log entries failed ({e}), retrying them one by one.")
+    for entry in entries:
+        try:
+            insert_log_entries(client, [entry])
+        except Exception as e:
+            if is_transient(e):
+                raise
+            dead_letter([entry], e)
+
+
+class LogWriter:
+    """Writes each clip's breach reports in a single round trip."""
+
+    def __init__(self, client=None):
+        self.client = client or edgedb.create_client()
+
+    def write(self, camera_id, breach_reports, on_commit=None):
+        """
+        Write a clip's breach reports. `on_commit()` is called once they are stored
+        (or dead-lettered), which is when the clip may be acked.
+        """
+        insert_or_dead_letter(self.client, breach_entries(camera_id, breach_reports))
+        if on_commit:
+            on_commit()
+
+    def flush(self):
+        pass
+
+
+class BatchingLogWriter(LogWriter):
+    """
+    Buffers breach reports from many clips and writes them together every `window`
+    seconds (or as soon as `max_size` entries are waiting), so DB write latency no
+    longer grows with the number of reports.
+
+    A clip's `on_commit` only runs after its entries are committed, so an ack never
+    gets ahead of the data. A batch that keeps failing with transient errors is
+    given up after `max_retries` flushes without running its callbacks: its clips
+    are not acked, and the clip queue hands them out again once their lease expires.
+    """
+
+    def __init__(self, client=None, window=LOG_BATCH_WINDOW, max_size=LOG_BATCH_MAX_SIZE,
+                 max_retries=LOG_WRITE_MAX_RETRIES):
+        super().__init__(client)
+        self.window = window
+        self.max_size = max_size
+        self.max_retries = max_retries
+        self.pending = []  # [entries, on_commit, failed attempts] per write
+        self.pending_entries = 0
+        self.cond = threading.Condition()
+        self.flush_lock = threading.Lock()
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def write(self, camera_id, breach_reports, on_commit=None):
+        entries = breach_entries(camera_id, breach_reports)
+        with self.cond:
+            self.pending.append([entries, on_commit, 0])
+            self.pending_entries += len(entries)
+            if self.pending_entries >= self.max_size:
+                self.cond.notify()
+
+    def flush(self):
+        """Write everything buffered now. Also call this before the process exits."""
+        with self.flush_lock:
+            with self.cond:
+                batch, self.pending, self.pending_entries = self.pending, [], 0
+            if not batch:
+                return
+            entries = [entry for item in batch for entry in item[0]]
+            try:
+                insert_or_dead_letter(self.client, entries)
+            except Exception as e:
+                self._retry_later(batch, e)
+                return
+            for _, on_commit, _ in batch:
+                if on_commit:
+                    try:
+                        on_commit()
+                    except Exception as e:
+                        logging.error(f"Log writer commit callback failed: {e}")
+
+    def _retry_later(self, batch, error):
+        retry = []
+        for item in batch:
+            item[2] += 1
+            if item[2] < self.max_retries:
+                retry.append(item)
+        given_up = sum(len(item[0]) for item in batch if item[2] >= self.max_retries)
+        logging.error(
+            f"Writing {sum(len(item[0]) for item in batch)} log entries failed: {error}. "
+            f"Retrying {len(retry)} clips" + (f", giving up on {given_up} entries (their clips stay unacked)"
+                                              if given_up else "")
+        )
+        with self.cond:
+            self.pending[:0] = retry
+            self.pending_entries += sum(len(item[0]) for item in retry)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending_entries >= self.max_size, timeout=self.window)
+            self.flush()
+
+
+_writer = None
+_writer_pid = None
+
+
+def get_log_writer():
+    """The log writer for this process, batching if LOG_BATCH_WINDOW is set."""
+    global _writer, _writer_pid
+    # Threads do not survive a fork, so each worker process builds its own writer.
+    if _writer is None or _writer_pid != os.getpid():
+        _writer = BatchingLogWriter() if LOG_BATCH_WINDOW > 0 else LogWriter()
+        _writer_pid = os.getpid()
+    return _writer
+
+
+def flush_log_writer():
+    """Flush this process's log writer, if it has one (worker shutdown path)."""
+    if _writer is not None and _writer_pid == os.getpid():
+        _writer.flush()
@@ -1,131 +1,138 @@
-import json
-import multiprocessing
+import logging
 import os
+import threading
 import edgedb
-from video_processor import VideoProcessor
-from video_recorder import VideoSnippetRecorder
+from analysis_proxy import build_analysis_proxy, remap_timestamps
+from live_view import live_views
+from tasks.analysis_pool import AnalysisPool
+from tasks.annotation_cache import annotation_cache
+from tasks.camera_health import camera_health
+from tasks.capture_supervisor import supervisor
+from tasks.clip_queue import clip_queue
+from tasks.segment_store import segment_store
+from tasks.log_writer import flush_log_writer, get_log_writer
+from tasks.rule_index import rule_index
+from tasks.snapshot_registry import snapshot_registry
 
 from ai.invision_ai.video_analyzer import VideoAnalyzer
 from ai.invision_ai.video_annotator import VideoAnnotator
 
-processor = VideoProcessor()
-
-def fetch_video_task():
-    recorder = VideoSnippetRecorder()
-    client = edgedb.create_client()
-    print("Starting to sync camera")
-    while True:
-        if len(client.query('select Camera')) == 0:
-            continue
-
-        video_path = recorder.record_snippet()
-        current_chunks = json.loads(client.query_json('''
-            SELECT Camera {
-                chunks,
-                id
-            };
-        '''))[0]['chunks']
-        current_chunks.append(video_path)
-        client.query_json('''
-            UPDATE Camera 
-            SET {
-                chunks := <array<str>>%s,
-            }
-        ''' % json.dumps(current_chunks))
-            
-def process_video(video_path, user_id, camera_id):
-    client = edgedb.create_client()
-    print("Processing video: ", video_path, user_id, camera_id)
+# Send the annotator a downscaled, low-fps proxy with static stretches cut out.
+USE_ANALYSIS_PROXY = os.getenv("ANALYSIS_PROXY", "True").lower() == "true"
+
+def annotate_and_analyze(video_path, user_id, camera_id, motion_backend=None, motion_zones=None):
+    """
+    Run the annotator and the analyzer on a clip. Returns `(annotations, breach_reports)`.
+    The proxy's static cut uses the camera's `motion_backend` and `motion_zones`.
+    """
+    proxy_path, time_map = (
+        build_analysis_proxy(video_path, motion_backend=motion_backend, motion_zones=motion_zones)
+        if USE_ANALYSIS_PROXY else (None, None)
+    )
 
     annotator = VideoAnnotator()
     # Run the analysis for a given camera and video file path
-    annotations = annotator.run(camera_id=camera_id, video_file_path=video_path)
+    try:
+        annotations = annotator.run(camera_id=camera_id, video_file_path=proxy_path or video_path)
+    finally:
+        if proxy_path:
+            os.remove(proxy_path)
+    # Times the annotator reports are proxy times; map them back onto the recording.
+    annotations = remap_timestamps(annotations, time_map)
     print("Video Annotations done")
     
     # Now, initialize the VideoAnalyzer (OPENAI_API_KEY is loaded from .env if not passed)
     analyzer = VideoAnalyzer()
     # Analyze the annotations for potential code-of-conduct breaches
     breach_reports = analyzer.analyze(annotations, camera_id=camera_id, user_id=user_id)
+    return annotations, breach_reports
+
+
+def process_video(video_path, user_id, camera_id, rules=None, on_commit=None, motion_backend=None,
+                  motion_zones=None):
+    """
+    Analyse a clip and log its breaches. With `rules` (the rules applicable to the
+    camera) the result is served from / stored in the annotation cache.
+    `on_commit()` runs once the breaches are stored (see tasks.log_writer).
+    """
+    print("Processing video: ", video_path, user_id, camera_id)
+
+    def analyze():
+        return annotate_and_analyze(video_path, user_id, camera_id, motion_backend, motion_zones)
+
+    if rules is None:
+        _, breach_reports = analyze()
+    else:
+        # The motion settings shape the proxy, so a change to them misses the cache.
+        _, breach_reports = annotation_cache.cached_analysis(
+            video_path, rules, analyze, settings=[motion_backend, motion_zones]
+        )
 
     print("\nBreach Reports:")
     if breach_reports:
-        for report in breach_reports:
-            client.query_json('''
-                with cam := (SELECT Camera FILTER .id = <uuid>$camera_id)
-                UPDATE Camera
-                FILTER .id = <uuid>$camera_id
-                SET {
-                    logs += (select (INSERT LogEntry {
-                        description := <str>$description,
-                        camera := cam,
-                        time := <datetime>datetime_current(),
-                        rule := (SELECT Rule FILTER .id = <uuid>$rule_id),
-                    }))
-                }
-            ''', description=report.description, camera_id=camera_id, rule_id=report.rule_id)
+        # All reports of the clip go out in one query (or one merged batch).
+        get_log_writer().write(camera_id, breach_reports, on_commit=on_commit)
     else:
         print("No breaches detected.")
+        if on_commit:
+            on_commit()
     
 
-def process_video_task():
-    client = edgedb.create_client()
-    while True:
-        if len(client.query('select Camera')) == 0:
-            continue
-
-        result = json.loads(client.query_json('''
-            SELECT Camera {
-                id,
-                chunks
-            };
-        '''))
-        chunks = result[0]['chunks']
-        camera_id = result[0]['id']
-        user_id = json.loads(client.query_json('''
-            SELECT User {
-                id,
-                camera: {
-                    id
-                }
-            } FILTER .camera.id = <uuid>$camera_id;
-        ''', camera_id=camera_id))[0]['id']
-
-        if len(chunks) > 0:
-            print("Processing video")
-            process_video(chunks.pop(0), user_id, camera_id)
-            client.query_json('''
-                UPDATE Camera 
-                SET {
-                    chunks := <array<str>>%s,
-                }
-            ''' % json.dumps(chunks))
+def process_clip(clip, ack):
+    """
+    Analysis handler for one queued clip; runs inside an analysis pool worker.
+    The clip is acked only once its breach reports are committed.
+    """
+    if not os.path.exists(clip.path):
+        # Removed from the segment store before it was analysed; nothing left to do.
+        logging.warning(f"Clip {clip.path} of camera {clip.camera_id} no longer exists, skipping it.")
+        ack()
+        return
+    client = _get_client()
+    # Owner and rules come from the in-memory rule index, not a query per clip.
+    camera_rules = rule_index.get(client, clip.camera_id)
+    if camera_rules is None:
+        # Camera was deleted (or never assigned) since the clip was recorded.
+        ack()
+        return
+
+    print("Processing video")
+    # The clip stays in the segment store as footage after analysis.
+    process_video(clip.path, camera_rules.owner_id, clip.camera_id, rules=camera_rules.rules, on_commit=ack,
+                  motion_backend=camera_rules.motion_backend, motion_zones=camera_rules.motion_zones)
+
+
+_client = None
+_client_pid = None
+
+
+def _get_client():
+    """One sync EdgeDB client per worker process."""
+    global _client, _client_pid
+    if _client is None or _client_pid != os.getpid():
+        _client = edgedb.create_client()
+        _client_pid = os.getpid()
+    return _client
 
 def spawn_processes():
-    init_loop()
-    
-    # Spawn two separate processes
-    p1 = multiprocessing.Process(target=fetch_video_task, daemon=True)
-    p2 = multiprocessing.Process(target=process_video_task, daemon=True)
-    
-    p1.start()
-    p2.start()
-
-    # Keep the background loop alive (not necessary if main thread stays active)
-    p1.join()
-    p2.join()
-
-def init_loop():
-    client = edgedb.create_client()
-    # Clear all chunks
-    os.system('rm -rf ./tmp/*')
-    client.query_json('''
-        UPDATE Camera 
-        SET {
-            chunks := <array<str>>[],
-        }
-    ''')
+    # Latest frames published by the capture workers, served by the snapshot route.
+    snapshot_registry.start()
+    # Capture worker heartbeats, read by GET /cameras/status and the dashboard.
+    camera_health.start()
+    # Frames of watched cameras from the capture workers, served by the live view route.
+    live_views.start()
+    # One capture worker process per camera, managed by the supervisor.
+    threading.Thread(target=supervisor.run, daemon=True).start()
+    # Keeps recorded footage within its disk budget and max age, except clips still queued.
+    threading.Thread(target=segment_store.run_retention, kwargs={"protected": clip_queue.queued_paths},
+                     daemon=True).start()
+
+    # A pool of analysis workers drains the clip queue concurrently.
+    # Workers flush buffered log entries when they are stopped.
+    AnalysisPool(clip_queue, process_clip, shutdown=flush_log_writer).run()
 
 def background_loop_manager():
-    return
-    init_loop()
-    spawn_processes()
\ No newline at end of file
+    if os.getenv("ENABLE_BACKGROUND_TASKS", "False").lower() != "true":
+        return
+    # Clips still queued from a previous run are picked up where they were left.
+    spawn_processes()
@@ -0,0 +1,108 @@
+import logging
+import multiprocessing
+import os
+import threading
+import time
+from collections import namedtuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# A camera missing from the index triggers a rebuild at most this often (seconds),
+# in case it was created without going through the camera routes.
+RULE_INDEX_MISS_REFRESH = float(os.getenv("RULE_INDEX_MISS_REFRESH", 30))
+
+Rule = namedtuple("Rule", ["id", "text"])
+# The user owning a camera and the rules that apply to it, ready for prompt building,
+# plus the camera's motion settings used when building its analysis proxy.
+CameraRules = namedtuple("CameraRules", ["owner_id", "rules", "motion_backend", "motion_zones"])
+
+RULE_INDEX_QUERY = '''
+SELECT User {
+    id,
+    camera: { id, motion_backend, motion_zones, room: { id } },
+    rules: { id, text, shared, rooms: { id } }
+}
+'''
+
+
+def effective_rules(user_rules, room_id):
+    """A user's rules that apply to a camera in `room_id`: shared ones and those linked to the room."""
+    return tuple(
+        Rule(str(rule.id), rule.text)
+        for rule in user_rules
+        if rule.shared or any(room.id == room_id for room in rule.rooms)
+    )
+
+
+def build_camera_rules(users):
+    """
+    Effective rules per camera id from `RULE_INDEX_QUERY` rows: an owner's shared
+    rules apply to all of their cameras, other rules only to cameras in the
+    rule's rooms.
+    """
+    index = {}
+    for user in users:
+        for camera in user.camera:
+            camera_id = str(camera.id)
+            if camera_id in index:
+                continue  # First owner wins, like the old per-clip owner lookup.
+            room_id = camera.room.id if camera.room else None
+            rules = effective_rules(user.rules, room_id)
+            index[camera_id] = CameraRules(str(user.id), rules, camera.motion_backend, camera.motion_zones)
+    return index
+
+
+class RuleIndex:
+    """
+    In-memory camera -> (owner, effective rules, motion settings) index for the analysis path.
+
+    Each process builds it once with a single query and keeps it until the shared
+    version counter moves. The routes that change rules, rooms or cameras call
+    `invalidate()`, so analysis workers (forked from the API process) notice on
+    their next lookup without querying the database per clip.
+    """
+
+    def __init__(self, miss_refresh=RULE_INDEX_MISS_REFRESH):
+        self.miss_refresh = miss_refresh
+        # Created before the workers fork, so every process shares it.
+        self.version = multiprocessing.Value("Q", 0)
+        self.lock = threading.Lock()
+        self._cameras = None
+        self._loaded_version = None
+        self._loaded_at = 0.0
+
+    def invalidate(self):
+        with self.version.get_lock():
+            self.version.value += 1
+
+    def get(self, client, camera_id):
+        """`CameraRules` for a camera, or None if no user owns it. `client` is a sync EdgeDB client."""
+        camera_id = str(camera_id)
+        with self.lock:
+            if self._cameras is None or self._loaded_version != self.version.value:
+                self._rebuild(client)
+            elif camera_id not in self._cameras and time.time() - self._loaded_at > self.miss_refresh:
+                self._rebuild(client)
+            return self._cameras.get(camera_id)
+
+    def _rebuild(self, client):
+        # Read the version first: a change made while the query runs triggers another rebuild.
+        version = self.version.value
+        self._cameras = build_camera_rules(client.query(RULE_INDEX_QUERY))
+        self._loaded_version = version
+        self._loaded_at = time.time()
+        logging.info(f"Rule index rebuilt for {len(self._cameras)} cameras (version {version}).")
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.lock = threading.Lock()
+
+
+rule_index = RuleIndex()
@@ -0,0 +1,192 @@
+import datetime
+import logging
+import os
+import shutil
+import threading
+import time
+from collections import namedtuple
+
+from dotenv import load_dotenv
+
+from tasks.sqlite_util import LocalConnection, Transaction
+
+load_dotenv()
+
+TMP_FOLDER = os.getenv("TMP_FOLDER", "./tmp")
+SEGMENT_ROOT = os.getenv("SEGMENT_ROOT", os.path.join(TMP_FOLDER, "segments"))
+SEGMENT_INDEX_PATH = os.getenv("SEGMENT_INDEX_PATH", os.path.join(SEGMENT_ROOT, "index.sqlite3"))
+# Retention: the oldest segments are deleted once all of them together take more
+# than SEGMENT_MAX_BYTES, and any segment older than SEGMENT_MAX_AGE seconds goes.
+SEGMENT_MAX_BYTES = int(os.getenv("SEGMENT_MAX_BYTES", 20 * 1024 ** 3))
+SEGMENT_MAX_AGE = float(os.getenv("SEGMENT_MAX_AGE", 7 * 24 * 3600))
+SEGMENT_RETENTION_INTERVAL = float(os.getenv("SEGMENT_RETENTION_INTERVAL", 60))
+
+Segment = namedtuple("Segment", ["camera_id", "start", "end", "path", "size"])
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS segments (
+    camera_id TEXT NOT NULL,
+    start_at REAL NOT NULL,
+    end_at REAL NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    PRIMARY KEY (camera_id, start_at)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS segments_by_start ON segments (start_at);
+'''
+
+
+def _timestamp(value):
+    """Epoch seconds for a datetime (e.g. `LogEntry.time`) or a number."""
+    if isinstance(value, datetime.datetime):
+        return value.timestamp()
+    return float(value)
+
+
+class SegmentStore:
+    """
+    Recorded footage, laid out as `<root>/<camera_id>/<YYYY-MM-DD>/<HH>/<start_ms><ext>`
+    (UTC buckets) and indexed in a small SQLite table keyed by (camera, start time).
+
+    Segments of one camera do not overlap, so the segments covering a time range
+    are found with one index seek plus a range scan, without listing directories.
+    Retention drops the oldest footage first when the store is over its disk
+    budget, and anything older than the maximum age, but never a segment that is
+    still queued for analysis (see `protected`).
+    """
+
+    def __init__(self, root=SEGMENT_ROOT, index_path=SEGMENT_INDEX_PATH,
+                 max_bytes=SEGMENT_MAX_BYTES, max_age=SEGMENT_MAX_AGE):
+        self.root = root
+        self.index_path = index_path
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.stopped = threading.Event()
+        os.makedirs(self.root, exist_ok=True)
+        os.makedirs(os.path.dirname(os.path.abspath(index_path)), exist_ok=True)
+        # Used from the capture workers, the retention thread and the API's threadpool.
+        self._connections = LocalConnection(index_path, SCHEMA)
+
+    @property
+    def conn(self):
+        return self._connections.get()
+
+    def add(self, camera_id, path, start, end):
+        """Move a finished recording into the store and index it. Returns the stored `Segment`."""
+        camera_id = str(camera_id)
+        start, end = _timestamp(start), _timestamp(end)
+        relative = self._relative_path(camera_id, start, os.path.splitext(path)[1])
+        destination = os.path.join(self.root, relative)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        shutil.move(path, destination)
+        size = os.path.getsize(destination)
+        self.conn.execute(
+            "INSERT OR REPLACE INTO segments (camera_id, start_at, end_at, path, size) VALUES (?, ?, ?, ?, ?)",
+            (camera_id, start, end, relative, size),
+        )
+        return Segment(camera_id, start, end, destination, size)
+
+    def segments_between(self, camera_id, start, end):
+        """
+        Segments of a camera overlapping [start, end), oldest first. Accepts datetimes
+        or epoch seconds. O(log n) in the number of indexed segments.
+        """
+        camera_id = str(camera_id)
+        start, end = _timestamp(start), _timestamp(end)
+        # The last segment starting at or before `start` may still cover it; from
+        # there on every segment starting before `end` overlaps the range.
+        rows = self.conn.execute(
+            "SELECT start_at, end_at, path, size FROM segments WHERE camera_id = ? AND start_at >= "
+            "coalesce((SELECT max(start_at) FROM segments WHERE camera_id = ? AND start_at <= ?), ?) "
+            "AND start_at < ? ORDER BY start_at",
+            (camera_id, camera_id, start, start, end),
+        ).fetchall()
+        return [
+            Segment(camera_id, seg_start, seg_end, os.path.join(self.root, path), size)
+            for seg_start, seg_end, path, size in rows
+            if seg_end > start
+        ]
+
+    def usage(self):
+        """Total (segment count, bytes) in the store."""
+        count, size = self.conn.execute("SELECT count(*), coalesce(sum(size), 0) FROM segments").fetchone()
+        return count, size
+
+    def enforce_retention(self, protected=()):
+        """
+        Delete segments past the max age, then the oldest ones until under the disk
+        budget. Segments whose path is in `protected` (e.g. clips not analysed yet)
+        are skipped; they go on a later pass.
+        """
+        protected = set(protected)
+
+        def removable(row):
+            return os.path.join(self.root, row[2]) not in protected
+
+        with Transaction(self.conn) as conn:
+            expired = [row for row in conn.execute(
+                "SELECT camera_id, start_at, path, size FROM segments WHERE start_at < ?",
+                (time.time() - self.max_age,),
+            ).fetchall() if removable(row)]
+            total = conn.execute("SELECT coalesce(sum(size), 0) FROM segments").fetchone()[0]
+            total -= sum(row[3] for row in expired)
+            over_budget = []
+            if total > self.max_bytes:
+                expired_keys = {(row[0], row[1]) for row in expired}
+                for row in conn.execute("SELECT camera_id, start_at, path, size FROM segments ORDER BY start_at"):
+                    if total <= self.max_bytes:
+                        break
+                    if (row[0], row[1]) in expired_keys or not removable(row):
+                        continue
+                    over_budget.append(row)
+                    total -= row[3]
+            removed = expired + over_budget
+            conn.executemany(
+                "DELETE FROM segments WHERE camera_id = ? AND start_at = ?",
+                [(row[0], row[1]) for row in removed],
+            )
+
+        for _, _, path, _ in removed:
+            self._remove_file(path)
+        if removed:
+            logging.info(f"Segment retention removed {len(removed)} segments "
+                         f"({len(expired)} expired, {len(over_budget)} over budget).")
+        return len(removed)
+
+    def run_retention(self, interval=SEGMENT_RETENTION_INTERVAL, protected=None):
+        """
+        Enforce retention every `interval` seconds until `stop` is called. Blocks the
+        calling thread. `protected()` returns the paths to keep on each pass.
+        """
+        self.stopped.clear()
+        while not self.stopped.is_set():
+            try:
+                self.enforce_retention(protected() if protected else ())
+            except Exception as e:
+                logging.error(f"Segment retention failed: {e}")
+            self.stopped.wait(interval)
+
+    def stop(self):
+        self.stopped.set()
+
+    def _relative_path(self, camera_id, start, extension):
+        bucket = datetime.datetime.fromtimestamp(start, tz=datetime.timezone.utc)
+        return os.path.join(camera_id, bucket.strftime("%Y-%m-%d"), bucket.strftime("%H"),
+                            f"{int(start * 1000)}{extension}")
+
+    def _remove_file(self, relative):
+        try:
+            os.remove(os.path.join(self.root, relative))
+        except FileNotFoundError:
+            pass
+        # Drop the hour and day buckets once they are empty.
+        directory = os.path.dirname(relative)
+        for _ in range(2):
+            try:
+                os.rmdir(os.path.join(self.root, directory))
+            except OSError:
+                break
+            directory = os.path.dirname(directory)
+
+
+segment_store = SegmentStore()
@@ -0,0 +1,114 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import namedtuple
+
+import cv2
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+SNAPSHOT_QUALITY = int(os.getenv("SNAPSHOT_QUALITY", 80))
+# Snapshots waiting to be picked up by the API process before new ones are dropped.
+SNAPSHOT_QUEUE_SIZE = int(os.getenv("SNAPSHOT_QUEUE_SIZE", 256))
+
+Snapshot = namedtuple("Snapshot", ["jpeg", "etag", "captured_at"])
+
+
+class SnapshotRegistry:
+    """
+    Latest JPEG of every camera, kept in memory in the API process.
+
+    Capture workers `publish()` a frame every few seconds through a
+    process-shared queue; a thread in the API process keeps only the newest per
+    camera, so serving a snapshot never touches a stream or the database.
+    Downscaled variants are encoded on first request and reused until the next
+    frame arrives, which drops them.
+    """
+
+    def __init__(self, queue_size=SNAPSHOT_QUEUE_SIZE, quality=SNAPSHOT_QUALITY):
+        # Created before the workers fork, so every process shares it.
+        self.queue = multiprocessing.Queue(maxsize=queue_size)
+        self.quality = quality
+        self.latest = {}  # camera_id -> Snapshot
+        self.resized = {}  # (camera_id, width) -> Snapshot
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def publish(self, camera_id, jpeg):
+        """Called from a capture worker. Drops the frame if the API process is behind."""
+        try:
+            self.queue.put_nowait((str(camera_id), jpeg, time.time()))
+        except queue.Full:
+            pass
+
+    def start(self):
+        """Start collecting published snapshots (in the API process)."""
+        if self.thread is None:
+            self.thread = threading.Thread(target=self._collect, name="snapshot-registry", daemon=True)
+            self.thread.start()
+        return self
+
+    def update(self, camera_id, jpeg, captured_at=None):
+        etag = '"' + hashlib.md5(jpeg).hexdigest() + '"'
+        camera_id = str(camera_id)
+        with self.lock:
+            self.latest[camera_id] = Snapshot(jpeg, etag, captured_at or time.time())
+            self._drop_resized(camera_id)
+
+    def get(self, camera_id, width=None):
+        """Latest `Snapshot` of a camera, optionally downscaled to `width` pixels; None if there is none."""
+        camera_id = str(camera_id)
+        with self.lock:
+            snapshot = self.latest.get(camera_id)
+            if snapshot is None or not width:
+                return snapshot
+            cached = self.resized.get((camera_id, width))
+            if cached is not None and cached.captured_at == snapshot.captured_at:
+                return cached
+        resized = self._resize(snapshot, width)
+        with self.lock:
+            # Not if a newer frame arrived meanwhile: nothing would drop it again.
+            if self.latest.get(camera_id) is snapshot:
+                self.resized[(camera_id, width)] = resized
+        return resized
+
+    def remove(self, camera_id):
+        camera_id = str(camera_id)
+        with self.lock:
+            self.latest.pop(camera_id, None)
+            self._drop_resized(camera_id)
+
+    def _drop_resized(self, camera_id):
+        # Called with the lock held.
+        for key in [key for key in self.resized if key[0] == camera_id]:
+            del self.resized[key]
+
+    def _resize(self, snapshot, width):
+        frame = cv2.imdecode(np.frombuffer(snapshot.jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if frame is None or width >= frame.shape[1]:
+            return snapshot
+        height = max(1, round(frame.shape[0] * width / frame.shape[1]))
+        small = cv2.resize(frame, (width, height), interpolation=cv2.INTER_AREA)
+        ok, buffer = cv2.imencode(".jpg", small, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if not ok:
+            return snapshot
+        jpeg = buffer.tobytes()
+        # Derived from the source ETag so it changes exactly when the frame does.
+        return Snapshot(jpeg, f'"{snapshot.etag.strip(chr(34))}-{width}"', snapshot.captured_at)
+
+    def _collect(self):
+        while True:
+            try:
+                camera_id, jpeg, captured_at = self.queue.get()
+                self.update(camera_id, jpeg, captured_at)
+            except Exception as e:
+                logging.error(f"Snapshot registry: {e}")
+
+
+snapshot_registry = SnapshotRegistry()
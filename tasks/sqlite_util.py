@@ -0,0 +1,59 @@
+import os
+import sqlite3
+import threading
+
+
+def connect(path, schema):
+    """
+    Open a SQLite database in autocommit mode with WAL journaling (readers never
+    block the writer) and create its tables if needed.
+    """
+    conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(schema)
+    return conn
+
+
+class LocalConnection:
+    """
+    Lazily opened connection to one database, one per process and thread: sqlite3
+    connections may not be shared between threads, nor survive a fork. Safe to
+    pickle (each process reopens its own).
+    """
+
+    def __init__(self, path, schema):
+        self.path = path
+        self.schema = schema
+        self._local = threading.local()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state["_local"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    def get(self):
+        local = self._local
+        if getattr(local, "pid", None) != os.getpid():
+            local.conn = connect(self.path, self.schema)
+            local.pid = os.getpid()
+        return local.conn
+
+
+class Transaction:
+    """`BEGIN IMMEDIATE` ... `COMMIT` (or `ROLLBACK` on error), so concurrent writers never interleave."""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
@@ -0,0 +1,8 @@
+import pytest
+
+from fakes import FakeClient
+
+
+@pytest.fixture
+def fake_db():
+    return FakeClient()
@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+
+
+class Record(SimpleNamespace):
+    """Stand-in for an EdgeDB result object: attribute and item access."""
+
+    def __getitem__(self, name):
+        return getattr(self, name)
+
+
+class FakeClient:
+    """
+    Async EdgeDB client double for route tests. `respond(fragment, result)` answers
+    every query containing `fragment` with `result` (a value, an exception to
+    raise, or a callable given the query arguments); calls are kept in `calls`.
+    """
+
+    def __init__(self):
+        self.results = []
+        self.calls = []
+
+    def respond(self, fragment, result):
+        self.results.insert(0, (fragment, result))
+
+    def _answer(self, query, params):
+        self.calls.append((query, params))
+        for fragment, result in self.results:
+            if fragment in query:
+                if isinstance(result, Exception):
+                    raise result
+                return result(**params) if callable(result) else result
+        raise AssertionError(f"Unexpected query: {query}")
+
+    async def query(self, query, **params):
+        return self._answer(query, params)
+
+    async def query_single(self, query, **params):
+        return self._answer(query, params)
+
+    def queries(self, fragment):
+        return [params for query, params in self.calls if fragment in query]
+
+
+def route_test_client(router):
+    """TestClient for a single router, without the app's startup tasks."""
+    from fastapi import FastAPI
+    from fastapi.testclient import TestClient
+
+    app = FastAPI()
+    app.include_router(router)
+    return TestClient(app)
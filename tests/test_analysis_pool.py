@@ -0,0 +1,77 @@
+import multiprocessing
+import threading
+import time
+
+from tasks.analysis_pool import analysis_worker
+from tasks.clip_queue import ClipQueue
+
+
+def deferred_ack_handler(handled, release):
+    """Fails bad.mp4; acks other clips later from another thread, like the batching log writer."""
+    def handler(clip, ack):
+        if clip.path == "bad.mp4":
+            raise RuntimeError("model error")
+        handled.set()
+        threading.Thread(target=lambda: release.wait(5) and ack()).start()
+    return handler
+
+
+def _flag_shutdown(path):
+    with open(path, "w") as f:
+        f.write("flushed")
+
+
+def clip_states(queue):
+    return dict(queue.conn.execute("SELECT path, state FROM clips"))
+
+
+def last_error(queue):
+    row = queue.conn.execute("SELECT last_error FROM clips WHERE path = 'bad.mp4'").fetchone()
+    return row[0] if row else None
+
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def test_worker_acks_through_callback_and_fails_on_error(tmp_path):
+    queue = ClipQueue(path=str(tmp_path / "clips.sqlite3"), retry_delay=60)
+    queue.enqueue("cam", "ok.mp4")
+    queue.enqueue("cam", "bad.mp4")
+    handled, release = multiprocessing.Event(), multiprocessing.Event()
+    worker = multiprocessing.Process(target=analysis_worker, args=(queue, deferred_ack_handler(handled, release)))
+    worker.start()
+    try:
+        assert handled.wait(5)
+        wait_until(lambda: last_error(queue) == "model error")
+        # ok.mp4 stays claimed until its deferred ack; bad.mp4 went back for a retry.
+        assert clip_states(queue) == {"ok.mp4": "claimed", "bad.mp4": "pending"}
+        release.set()
+        wait_until(lambda: "ok.mp4" not in clip_states(queue))
+        assert clip_states(queue) == {"bad.mp4": "pending"}
+    finally:
+        worker.terminate()
+        worker.join(timeout=5)
+
+
+def test_terminated_worker_runs_shutdown(tmp_path):
+    queue = ClipQueue(path=str(tmp_path / "clips.sqlite3"))
+    queue.enqueue("cam", "ok.mp4")
+    handled, release = multiprocessing.Event(), multiprocessing.Event()
+    release.set()
+    flag = tmp_path / "flag"
+    worker = multiprocessing.Process(
+        target=analysis_worker,
+        args=(queue, deferred_ack_handler(handled, release), lambda: _flag_shutdown(flag)),
+    )
+    worker.start()
+    # Past its first clip, the worker is running (and back in claim() on the empty queue).
+    assert handled.wait(5)
+    worker.terminate()
+    worker.join(timeout=5)
+
+    assert worker.exitcode == 0
+    assert flag.read_text() == "flushed"
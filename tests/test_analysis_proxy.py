@@ -0,0 +1,81 @@
+import cv2
+import numpy as np
+import pytest
+
+from analysis_proxy import TimeMap, build_analysis_proxy, remap_timestamps
+
+
+def time_map(fps, source_times):
+    mapping = TimeMap(fps)
+    for source_time in source_times:
+        mapping.append(source_time)
+    return mapping
+
+
+def test_time_map_stores_one_run_per_cut():
+    # 1 fps proxy of frames at 0-4 s, then (after a cut) 60-62 s.
+    mapping = time_map(1, [0, 1, 2, 3, 4, 60, 61, 62])
+    assert mapping.runs == [(0.0, 0), (5.0, 60)]
+    assert [mapping.to_source(t) for t in (0, 3, 4.5, 5, 7)] == [0, 3, 4.5, 60, 62]
+
+
+def test_time_map_without_frames_is_the_identity():
+    assert TimeMap(5).to_source(12) == 12
+
+
+def test_remap_rewrites_annotator_timestamps_only():
+    mapping = time_map(1, [0, 1, 2, 90, 91, 92])
+    text = "*   **0:01** enters. *   **0:04** leaves at 12:30 pm; see [0:05] and 1:05."
+    assert remap_timestamps(text, mapping) == (
+        "*   **0:01** enters. *   **1:31** leaves at 12:30 pm; see [1:32] and 1:05."
+    )
+
+
+def test_remap_keeps_the_hour_format_and_walks_containers():
+    mapping = time_map(1, [3600 + i for i in range(10)])
+    annotations = {"events": ["[0:00:03] sits", {"at": "**0:04**"}], "count": 2}
+    assert remap_timestamps(annotations, mapping) == {
+        "events": ["[1:00:03] sits", {"at": "**1:00:04**"}], "count": 2,
+    }
+    assert remap_timestamps("**0:04**", None) == "**0:04**"
+
+
+@pytest.fixture
+def video(tmp_path):
+    """10 s at 10 fps, 320x240: motion for 2 s, static for 6 s, motion again for 2 s."""
+    path = str(tmp_path / "source.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (320, 240))
+    for i in range(100):
+        frame = np.zeros((240, 320, 3), dtype=np.uint8)
+        if i < 20 or i >= 80:
+            x = (i * 12) % 240
+            frame[60:180, x:x + 80] = 255
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def test_proxy_cuts_static_stretches_and_maps_back(video, tmp_path):
+    dest = str(tmp_path / "proxy.mp4")
+    proxy_path, mapping = build_analysis_proxy(video, dest, width=160, fps=5, max_static=1)
+    assert proxy_path == dest
+
+    cap = cv2.VideoCapture(proxy_path)
+    frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    assert int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) == 160
+    cap.release()
+    # Every kept frame is in the file, so the map matches it frame for frame.
+    assert frames == mapping.frames
+    assert frames < 40
+    assert len(mapping.runs) == 2
+    # The last proxy frame is the last sampled source frame.
+    assert mapping.to_source((frames - 1) / 5) == pytest.approx(9.8)
+
+
+def test_proxy_ignores_malformed_stored_zones(video, tmp_path):
+    # Zones saved before they were validated must not break the proxy build.
+    dest = str(tmp_path / "proxy.mp4")
+    proxy_path, mapping = build_analysis_proxy(video, dest, width=160, fps=5, max_static=1,
+                                               motion_zones={"include": [[[0.1, 0.2, 0.3]]]})
+    assert proxy_path == dest
+    assert len(mapping.runs) == 2
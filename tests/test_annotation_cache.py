@@ -0,0 +1,96 @@
+import itertools
+import os
+from types import SimpleNamespace
+
+import pytest
+
+from tasks import annotation_cache
+from tasks.annotation_cache import AnnotationCache
+from tasks.rule_index import Rule
+
+RULES = [Rule("r1", "no running"), Rule("r2", "no food")]
+
+
+@pytest.fixture(autouse=True)
+def clock(monkeypatch):
+    """One tick per call, so last-use order never depends on the timer resolution."""
+    ticks = itertools.count(1000)
+    monkeypatch.setattr(annotation_cache, "time", SimpleNamespace(time=lambda: float(next(ticks))))
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnnotationCache(folder=str(tmp_path / "cache"), max_bytes=10_000)
+
+
+@pytest.fixture
+def clip(tmp_path):
+    path = tmp_path / "clip.mp4"
+    path.write_bytes(b"frames")
+    return str(path)
+
+
+def test_keys_are_stable_and_cover_clip_rules_and_settings(tmp_path, cache, clip):
+    key = cache.key(clip, RULES, settings=["mog2", None])
+    # Rule order and a copy of the clip elsewhere do not matter.
+    copy = tmp_path / "copy.mp4"
+    copy.write_bytes(b"frames")
+    assert cache.key(str(copy), list(reversed(RULES)), settings=["mog2", None]) == key
+    assert AnnotationCache(folder=cache.folder).key(clip, RULES, settings=["mog2", None]) == key
+
+    assert cache.key(clip, RULES[:1], settings=["mog2", None]) != key
+    assert cache.key(clip, [Rule("r1", "no walking"), RULES[1]], settings=["mog2", None]) != key
+    assert cache.key(clip, RULES, settings=["knn", None]) != key
+    assert cache.key(clip, RULES) != key
+    assert AnnotationCache(folder=cache.folder, version="2").key(clip, RULES, settings=["mog2", None]) != key
+    copy.write_bytes(b"other frames")
+    assert cache.key(str(copy), RULES, settings=["mog2", None]) != key
+
+
+def test_cached_analysis_runs_once_per_key(cache, clip):
+    calls = []
+
+    def analyze():
+        calls.append(1)
+        return "annotations", ["breach"]
+
+    assert cache.cached_analysis(clip, RULES, analyze) == ("annotations", ["breach"])
+    assert cache.cached_analysis(clip, RULES, analyze) == ("annotations", ["breach"])
+    assert len(calls) == 1
+    cache.cached_analysis(clip, RULES[:1], analyze)
+    assert len(calls) == 2
+
+
+def entry_size(cache):
+    cache.put("probe", b"x" * 3000)
+    size = cache.conn.execute("SELECT size FROM entries WHERE key = 'probe'").fetchone()[0]
+    cache.delete("probe")
+    return size
+
+
+def test_eviction_keeps_the_most_recently_used_entries_within_max_bytes(cache):
+    size = entry_size(cache)
+    cache.max_bytes = 3 * size
+    for key in ("a1", "b2", "c3"):
+        cache.put(key, b"x" * 3000)
+    # Reading "a1" makes "b2" the least recently used.
+    assert cache.get("a1") == b"x" * 3000
+    cache.put("d4", b"x" * 3000)
+
+    assert cache.get("b2") is None
+    assert all(cache.get(key) is not None for key in ("a1", "c3", "d4"))
+    assert not os.path.exists(cache._path("b2"))
+    total = cache.conn.execute("SELECT sum(size) FROM entries").fetchone()[0]
+    assert total <= cache.max_bytes
+
+
+def test_a_corrupt_entry_is_dropped_and_recomputed(cache, clip):
+    key = cache.key(clip, RULES)
+    cache.put(key, ("annotations", []))
+    with open(cache._path(key), "wb") as f:
+        f.write(b"not a pickle")
+
+    assert cache.get(key) is None
+    assert not os.path.exists(cache._path(key))
+    assert cache.conn.execute("SELECT count(*) FROM entries").fetchone()[0] == 0
+    assert cache.cached_analysis(clip, RULES, lambda: ("fresh", [])) == ("fresh", [])
@@ -0,0 +1,69 @@
+import json
+
+import cv2
+import numpy as np
+
+from benchmarks.run import compare, main
+from benchmarks.synthetic_video import generate_video
+from motion_detection import create_motion_detector
+
+
+def read_frames(path):
+    cap = cv2.VideoCapture(path)
+    frames = []
+    while True:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(frame)
+    cap.release()
+    return frames
+
+
+def motion_scores(frames):
+    detector = create_motion_detector()
+    return [detector.score(frame) or 0 for frame in frames]
+
+
+def test_synthetic_video_has_the_requested_size_and_motion(tmp_path):
+    moving = str(tmp_path / "moving.avi")
+    assert generate_video(moving, width=160, height=120, fps=10, duration=2, static_ratio=0) == 20
+    frames = read_frames(moving)
+    assert len(frames) == 20 and frames[0].shape == (120, 160, 3)
+    assert sum(score > 0.05 for score in motion_scores(frames)) >= 15
+
+    static = str(tmp_path / "static.avi")
+    generate_video(static, width=160, height=120, fps=10, duration=2, static_ratio=1)
+    # Only sensor-like noise: nothing a detector counts as motion.
+    assert max(motion_scores(read_frames(static))) == 0
+
+
+def result(name, fps_per_core, **extra):
+    return {"name": name, "fps_per_core": fps_per_core, **extra}
+
+
+def test_compare_flags_drops_beyond_the_tolerance_only():
+    baseline = {"results": [result("a", 100), result("b", 100), result("c", 100), result("d", 100)]}
+    results = [
+        result("a", 95),  # within 10%
+        result("b", 80),
+        result("c", None, error="exited with code 1"),
+        {"name": "d", "skipped": "ffmpeg not found"},
+        result("new", 1),
+    ]
+    assert compare(results, baseline, tolerance=0.10) == ["b"]
+
+
+def test_run_writes_results_and_fails_on_a_regression(tmp_path):
+    out = tmp_path / "bench.json"
+    args = ["--resolution", "160x120", "--fps", "10", "--duration", "1", "--only", "capture_and_detect_motion"]
+    assert main(args + ["--out", str(out)]) == 0
+    report = json.loads(out.read_text())
+    [measured] = report["results"]
+    assert measured["name"] == "capture_and_detect_motion" and measured["frames"] == 10
+    assert measured["fps_per_core"] > 0 and report["video"]["width"] == 160
+
+    baseline = tmp_path / "baseline.json"
+    measured["fps_per_core"] *= 100
+    baseline.write_text(json.dumps(report))
+    assert main(args + ["--out", str(tmp_path / "again.json"), "--baseline", str(baseline)]) == 1
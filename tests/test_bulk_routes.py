@@ -0,0 +1,157 @@
+import json
+import uuid
+
+import pytest
+
+# The routers package imports the annotation models.
+pytest.importorskip("ai.invision_ai.video_annotator")
+
+from routers import bulk, camera_routes, room_routes, rule_routes  # noqa: E402
+from fakes import Record, route_test_client  # noqa: E402
+
+USER_ID = "6b5a4a46-0000-4000-8000-0000000000b1"
+ROOM_ID = "6b5a4a46-0000-4000-8000-0000000000a1"
+UNKNOWN_ROOM_ID = "6b5a4a46-0000-4000-8000-0000000000a9"
+EXISTING_IP = "10.0.0.9"
+
+
+def new_id(index):
+    return uuid.UUID(int=index + 1)
+
+
+def create_cameras(user_id, items):
+    """What BULK_CREATE_CAMERAS_QUERY returns for ROOM_ID as the only room and EXISTING_IP taken."""
+    created = []
+    for item in map(json.loads, items):
+        room_found = item["room_id"] == ROOM_ID
+        camera = None
+        if room_found and item["ip_address"] != EXISTING_IP:
+            camera = Record(id=new_id(item["index"]), ip_address=item["ip_address"],
+                            motion_backend=item.get("motion_backend"), motion_zones=item.get("motion_zones"))
+        created.append(Record(index=item["index"], room_found=room_found, camera=camera))
+    return Record(user_found=user_id == USER_ID, items=created if user_id == USER_ID else [])
+
+
+def create_rooms(user_id, items):
+    return Record(user_found=True, items=[
+        Record(index=item["index"], room=Record(id=new_id(item["index"]), name=item["name"]))
+        for item in map(json.loads, items)
+    ])
+
+
+def create_rules(user_id, items):
+    return Record(user_found=True, items=[
+        Record(index=item["index"], rule=Record(id=new_id(item["index"]), text=item["text"], shared=item["shared"]))
+        for item in map(json.loads, items)
+    ])
+
+
+class FakeSupervisor:
+    def __init__(self):
+        self.registrations = []
+
+    def add_cameras(self, configs):
+        self.registrations.append(configs)
+
+
+@pytest.fixture
+def invalidations(monkeypatch):
+    calls = []
+    monkeypatch.setattr(camera_routes.rule_index, "invalidate", lambda: calls.append(1))
+    return calls
+
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    supervisor = FakeSupervisor()
+    monkeypatch.setattr(camera_routes, "supervisor", supervisor)
+    return supervisor
+
+
+@pytest.fixture
+def fake_db(fake_db, monkeypatch):
+    fake_db.respond("INSERT Camera", create_cameras)
+    fake_db.respond("INSERT Room", create_rooms)
+    fake_db.respond("INSERT Rule", create_rules)
+    for module in (camera_routes, room_routes, rule_routes):
+        monkeypatch.setattr(module, "client", fake_db)
+    return fake_db
+
+
+@pytest.fixture
+def cameras_api(fake_db, invalidations, supervisor):
+    return route_test_client(camera_routes.router)
+
+
+@pytest.fixture
+def rooms_api(fake_db, invalidations):
+    return route_test_client(room_routes.router)
+
+
+@pytest.fixture
+def rules_api(fake_db, invalidations):
+    return route_test_client(rule_routes.router)
+
+
+def test_cameras_are_created_in_one_query_with_a_result_per_item(cameras_api, fake_db, supervisor, invalidations):
+    response = cameras_api.post("/cameras/bulk", json={"user_id": USER_ID, "cameras": [
+        {"ip_address": "10.0.0.1", "room_id": ROOM_ID, "motion_backend": "mog2"},
+        {"ip_address": "10.0.0.2", "room_id": "not-a-uuid"},
+        {"ip_address": "10.0.0.1", "room_id": ROOM_ID},
+        {"ip_address": "10.0.0.3", "room_id": UNKNOWN_ROOM_ID},
+        {"ip_address": EXISTING_IP, "room_id": ROOM_ID},
+        {"ip_address": "10.0.0.4", "room_id": ROOM_ID},
+    ]})
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["created"], body["failed"]) == (2, 4)
+    assert [(r["index"], r["status"], r.get("error")) for r in body["results"]] == [
+        (0, "created", None),
+        (1, "failed", "Invalid room_id"),
+        (2, "failed", "Duplicate ip_address in this request"),
+        (3, "failed", "Room not found"),
+        (4, "failed", "A camera with this ip_address already exists"),
+        (5, "created", None),
+    ]
+    assert len(fake_db.calls) == 1
+    # One registration with the supervisor for the whole batch.
+    [configs] = supervisor.registrations
+    assert {camera_id: config.motion_backend for camera_id, config in configs.items()} == {
+        str(new_id(0)): "mog2", str(new_id(5)): None,
+    }
+    assert invalidations == [1]
+
+
+def test_bulk_create_for_an_unknown_user_is_404(cameras_api, supervisor):
+    other_user = "6b5a4a46-0000-4000-8000-0000000000b2"
+    response = cameras_api.post("/cameras/bulk", json={"user_id": other_user, "cameras": [
+        {"ip_address": "10.0.0.1", "room_id": ROOM_ID},
+    ]})
+    assert response.status_code == 404 and supervisor.registrations == []
+
+
+def test_batches_over_the_limit_are_rejected(rooms_api, fake_db, monkeypatch):
+    monkeypatch.setattr(bulk, "BULK_MAX_ITEMS", 2)
+    response = rooms_api.post("/rooms/bulk", json={"user_id": USER_ID, "names": ["a", "b", "c"]})
+    assert response.status_code == 413 and fake_db.calls == []
+
+
+def test_rooms_with_an_empty_name_fail_and_the_rest_are_created(rooms_api, fake_db):
+    response = rooms_api.post("/rooms/bulk", json={"user_id": USER_ID, "names": ["Warehouse", " ", "Loading Bay"]})
+    body = response.json()
+    assert (body["created"], body["failed"]) == (2, 1)
+    assert [r.get("name") for r in body["results"]] == ["Warehouse", None, "Loading Bay"]
+    assert len(fake_db.calls) == 1
+
+
+def test_rules_with_a_bad_room_id_fail_and_the_index_is_invalidated(rules_api, fake_db, invalidations):
+    response = rules_api.post("/rules/bulk", json={"user_id": USER_ID, "rules": [
+        {"text": "No helmets off", "shared": True},
+        {"text": "Door stays closed", "shared": False, "rooms_ids": ["kitchen"]},
+        {"text": "No food", "shared": False, "rooms_ids": [ROOM_ID]},
+    ]})
+    body = response.json()
+    assert [r["status"] for r in body["results"]] == ["created", "failed", "created"]
+    [params] = fake_db.queries("INSERT Rule")
+    assert [json.loads(item)["index"] for item in params["items"]] == [0, 2]
+    assert invalidations == [1]
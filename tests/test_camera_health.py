@@ -0,0 +1,65 @@
+import time
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+import pytest
+
+from tasks.camera_health import CameraHealthRegistry, HealthReporter, Heartbeat
+
+
+def heartbeat(camera_id="cam", last_frame_at=None, sent_at=None, **fields):
+    now = time.time()
+    values = dict(pid=1, mode="transcode", fps=10.0, motion_ratio=None, last_error=None)
+    values.update(fields)
+    return Heartbeat(camera_id, last_frame_at=last_frame_at, sent_at=sent_at or now, **values)
+
+
+@pytest.fixture
+def registry():
+    return CameraHealthRegistry(queue_size=8, stale_after=15, offline_after=30)
+
+
+def test_status_follows_heartbeats_and_frames(registry):
+    now = 1_000_000.0
+    assert registry.status("cam", now)["status"] == "offline"
+    registry.update(heartbeat(last_frame_at=now - 1, sent_at=now - 2))
+    assert registry.status("cam", now)["status"] == "online"
+    # The worker is alive but the camera sends nothing.
+    assert registry.status("cam", now + 20)["status"] == "stale"
+    assert registry.status("cam", now + 40)["status"] == "offline"
+    registry.update(heartbeat(last_frame_at=None, sent_at=now, last_error="Failed to grab frame"))
+    status = registry.status("cam", now)
+    assert status["status"] == "stale" and status["last_error"] == "Failed to grab frame"
+    registry.remove("cam")
+    assert registry.get("cam") is None
+
+
+def test_published_heartbeats_are_collected(registry):
+    registry.start()
+    registry.publish(heartbeat(fps=1.0))
+    registry.publish(heartbeat(fps=2.0))
+    deadline = time.monotonic() + 5
+    while (registry.get("cam") is None or registry.get("cam").fps != 2.0) and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert registry.get("cam").fps == 2.0
+
+
+def snapshot(x):
+    frame = np.zeros((240, 320, 3), dtype=np.uint8)
+    frame[80:160, x:x + 80] = 255
+    return cv2.imencode(".jpg", frame)[1].tobytes()
+
+
+def test_reporter_scores_motion_on_snapshots_and_reports_recorder_stats(registry):
+    reporter = HealthReporter("cam", registry, interval=0.05, window=4)
+    for x in (0, 0, 60, 120, 180):
+        reporter.observe_snapshot(snapshot(x))
+    assert list(reporter.motion) == [False, True, True, True]
+
+    recorder = SimpleNamespace(mode="copy", stats={"frames": 0, "last_frame_at": time.time(), "last_error": None})
+    reporter.start(recorder)
+    beat = registry.queue.get(timeout=5)
+    assert beat.camera_id == "cam" and beat.mode == "copy"
+    assert beat.motion_ratio == 0.75
+    assert beat.last_frame_at == recorder.stats["last_frame_at"]
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+
+# The routers package imports the annotation models.
+pytest.importorskip("ai.invision_ai.video_annotator")
+
+from routers import camera_routes  # noqa: E402
+from tasks.camera_health import CameraHealthRegistry, Heartbeat  # noqa: E402
+from fakes import Record, route_test_client  # noqa: E402
+
+CAMERA_ID = "6b5a4a46-0000-4000-8000-0000000000c1"
+ROOM_ID = "6b5a4a46-0000-4000-8000-0000000000a1"
+USER_ID = "6b5a4a46-0000-4000-8000-0000000000b1"
+TOP_STRIP = [[0, 0], [1, 0], [1, 0.2], [0, 0.2]]
+
+BAD_ZONES = [
+    {"include": [[[0.1, 0.2, 0.3]]]},
+    {"include": [[]]},
+    {"include": [[[0, 0], [1, 0], [1, 1.5]]]},
+    {"exclude": [[[0, 0], [0.5, 0.5], [1, 1]]]},
+    {"exclude": [[[0, 0], [1, 0]]]},
+]
+
+
+class FakeSupervisor:
+    def __init__(self):
+        self.added = {}
+        self.cameras = {}
+
+    def add_camera(self, camera_id, config):
+        self.added[camera_id] = config
+
+    def add_cameras(self, configs):
+        self.added.update(configs)
+
+
+@pytest.fixture
+def supervisor(monkeypatch):
+    supervisor = FakeSupervisor()
+    monkeypatch.setattr(camera_routes, "supervisor", supervisor)
+    monkeypatch.setattr(camera_routes.rule_index, "invalidate", lambda: None)
+    return supervisor
+
+
+@pytest.fixture
+def api(fake_db, supervisor, monkeypatch):
+    monkeypatch.setattr(camera_routes, "client", fake_db)
+    return route_test_client(camera_routes.router)
+
+
+@pytest.mark.parametrize("zones", BAD_ZONES)
+def test_malformed_zones_are_rejected_with_422(api, fake_db, supervisor, zones):
+    assert api.put(f"/cameras/{CAMERA_ID}/zones", json=zones).status_code == 422
+    created = api.post("/cameras", json={
+        "ip_address": "10.0.0.1", "room_id": ROOM_ID, "user_id": USER_ID, "motion_zones": zones,
+    })
+    assert created.status_code == 422
+    bulk = api.post("/cameras/bulk", json={
+        "user_id": USER_ID,
+        "cameras": [{"ip_address": "10.0.0.1", "room_id": ROOM_ID, "motion_zones": zones}],
+    })
+    assert bulk.status_code == 422
+    # Nothing reached the database or the capture workers.
+    assert fake_db.calls == [] and supervisor.added == {}
+
+
+def test_valid_zones_are_stored_and_applied(api, fake_db, supervisor):
+    fake_db.respond("motion_zones := <json>$motion_zones", lambda **params: Record(
+        ip_address="10.0.0.1", motion_backend=None, motion_zones=params["motion_zones"],
+    ))
+    response = api.put(f"/cameras/{CAMERA_ID}/zones", json={"exclude": [TOP_STRIP]})
+    assert response.status_code == 200
+    assert supervisor.added[CAMERA_ID].motion_zones == {"include": [], "exclude": [TOP_STRIP]}
+
+
+def test_status_reports_every_supervised_camera_from_memory(api, fake_db, supervisor, monkeypatch):
+    health = CameraHealthRegistry(queue_size=4)
+    monkeypatch.setattr(camera_routes, "camera_health", health)
+    supervisor.cameras = {"cam-1": None, "cam-2": None}
+    now = time.time()
+    health.update(Heartbeat("cam-1", 1, "transcode", now, 25.0, 0.2, None, now))
+
+    response = api.get("/cameras/status")
+    assert response.status_code == 200
+    assert [(s["camera_id"], s["status"], s["fps"]) for s in response.json()] == [
+        ("cam-1", "online", 25.0), ("cam-2", "offline", None),
+    ]
+    assert fake_db.calls == []
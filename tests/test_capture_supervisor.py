@@ -0,0 +1,77 @@
+from types import SimpleNamespace
+
+from tasks.capture_supervisor import CameraConfig, CaptureSupervisor
+
+ZONES = {"include": [], "exclude": [[[0.0, 0.0], [1.0, 0.0], [1.0, 0.2], [0.0, 0.2]]]}
+
+
+class FakeWorker:
+    def __init__(self):
+        self.alive = True
+        self.exitcode = None
+
+    def is_alive(self):
+        return self.alive
+
+
+def supervisor_with_fake_workers(start_rate=20):
+    supervisor = CaptureSupervisor(start_rate=start_rate)
+    supervisor.events = []
+
+    def start(camera_id, config):
+        supervisor.events.append(("start", camera_id, config))
+        supervisor.workers[camera_id] = (FakeWorker(), config)
+
+    def stop(camera_id):
+        supervisor.events.append(("stop", camera_id))
+        supervisor.workers.pop(camera_id, None)
+
+    supervisor._start_worker = start
+    supervisor._stop_worker = stop
+    return supervisor
+
+
+def camera_row(camera_id, motion_backend=None, motion_zones=None):
+    return SimpleNamespace(id=camera_id, ip_address=f"rtsp://{camera_id}", motion_backend=motion_backend,
+                           motion_zones=motion_zones)
+
+
+def sync(supervisor, *rows):
+    supervisor.sync(SimpleNamespace(query=lambda query: list(rows)))
+
+
+def test_workers_get_the_camera_motion_settings():
+    supervisor = supervisor_with_fake_workers()
+    supervisor.add_camera("a", CameraConfig("rtsp://a", "mog2", ZONES))
+    supervisor.reconcile()
+    assert supervisor.events == [("start", "a", CameraConfig("rtsp://a", "mog2", ZONES))]
+
+
+def test_sync_restarts_only_reconfigured_workers():
+    supervisor = supervisor_with_fake_workers()
+    supervisor.add_camera("a", CameraConfig("rtsp://a", "mog2", ZONES))
+    supervisor.reconcile()
+
+    # Same settings, with the zones as the JSON text EdgeDB returns: nothing to do.
+    sync(supervisor, camera_row("a", "mog2", '{"include": [], "exclude": [[[0, 0], [1, 0], [1, 0.2], [0, 0.2]]]}'))
+    supervisor.reconcile()
+    assert len(supervisor.events) == 1
+
+    sync(supervisor, camera_row("a", "knn", None))
+    supervisor.reconcile()
+    assert supervisor.events[1:] == [("stop", "a"), ("start", "a", CameraConfig("rtsp://a", "knn", None))]
+
+
+def test_reconcile_starts_at_most_start_rate_and_restarts_dead_workers():
+    supervisor = supervisor_with_fake_workers(start_rate=2)
+    sync(supervisor, *(camera_row(str(i)) for i in range(5)))
+
+    assert supervisor.reconcile() == 3
+    assert supervisor.reconcile() == 1
+    assert supervisor.reconcile() == 0
+    assert len(supervisor.workers) == 5
+
+    supervisor.workers["0"][0].alive = False
+    supervisor.remove_camera("1")
+    supervisor.reconcile()
+    assert supervisor.events[-2:] == [("stop", "1"), ("start", "0", CameraConfig("rtsp://0", None, None))]
@@ -0,0 +1,108 @@
+import time
+
+import pytest
+
+from tasks.clip_queue import ClipQueue
+
+
+@pytest.fixture
+def make_queue(tmp_path):
+    def make(**kwargs):
+        kwargs.setdefault("retry_delay", 0)
+        return ClipQueue(path=str(tmp_path / "clips.sqlite3"), **kwargs)
+    return make
+
+
+def states(queue):
+    return dict(queue.conn.execute("SELECT id, state FROM clips"))
+
+
+def test_claim_and_ack(make_queue):
+    queue = make_queue()
+    clip_id = queue.enqueue("cam", "/clips/a.mp4")
+
+    clip = queue.claim(timeout=0)
+    assert (clip.id, clip.camera_id, clip.path, clip.attempts) == (clip_id, "cam", "/clips/a.mp4", 1)
+    assert queue.claim(timeout=0) is None
+
+    queue.ack(clip.id)
+    assert states(queue) == {}
+
+
+def test_claims_round_robin_across_cameras(make_queue):
+    queue = make_queue()
+    for path in ("a1", "a2", "a3"):
+        queue.enqueue("a", path)
+    queue.enqueue("b", "b1")
+
+    claimed = [queue.claim(timeout=0).camera_id for _ in range(3)]
+    assert claimed == ["a", "b", "a"]
+
+
+def test_failed_clip_is_retried_then_dead(make_queue):
+    queue = make_queue(max_attempts=2)
+    clip_id = queue.enqueue("cam", "a.mp4")
+
+    queue.fail(queue.claim(timeout=0).id, "boom")
+    assert states(queue) == {clip_id: "pending"}
+
+    clip = queue.claim(timeout=0)
+    assert clip.attempts == 2
+    queue.fail(clip.id, "boom again")
+    assert states(queue) == {clip_id: "dead"}
+    assert queue.claim(timeout=0) is None
+
+
+def test_expired_lease_is_handed_out_again(make_queue):
+    queue = make_queue(lease_seconds=0.05, max_attempts=3)
+    clip_id = queue.enqueue("cam", "a.mp4")
+    queue.claim(timeout=0)
+    time.sleep(0.1)
+
+    clip = queue.claim(timeout=0)
+    assert (clip.id, clip.attempts) == (clip_id, 2)
+
+
+def test_expired_lease_out_of_attempts_goes_dead(make_queue):
+    queue = make_queue(lease_seconds=0.05, max_attempts=2)
+    clip_id = queue.enqueue("cam", "a.mp4")
+    for _ in range(2):
+        assert queue.claim(timeout=0).id == clip_id
+        time.sleep(0.1)
+
+    assert queue.claim(timeout=0) is None
+    assert states(queue) == {clip_id: "dead"}
+
+
+def test_prune_dead_removes_only_old_dead_clips(make_queue):
+    queue = make_queue(max_attempts=1)
+    dead_id = queue.enqueue("cam", "a.mp4")
+    queue.fail(queue.claim(timeout=0).id, "boom")
+    pending_id = queue.enqueue("cam", "b.mp4")
+
+    assert queue.prune_dead(max_age=60) == 0
+    assert queue.prune_dead(max_age=0) == 1
+    assert states(queue) == {pending_id: "pending"}
+    assert dead_id not in states(queue)
+
+
+@pytest.mark.parametrize("policy, kept", [("drop_oldest", ["b", "c"]), ("drop_newest", ["a", "b"])])
+def test_backlog_bound_per_camera(make_queue, policy, kept):
+    queue = make_queue(max_pending_per_camera=2, overload_policy=policy)
+    for path in ("a", "b", "c"):
+        queue.enqueue("cam", path)
+
+    paths = [row[0] for row in queue.conn.execute("SELECT path FROM clips ORDER BY id")]
+    assert paths == kept
+    assert queue.stats()["cam"]["dropped"] == 1
+
+
+def test_queued_paths_cover_pending_and_claimed_clips(make_queue):
+    queue = make_queue()
+    for path in ("a", "b", "c"):
+        queue.enqueue("cam", path)
+    done = queue.claim(timeout=0)
+    queue.ack(done.id)
+    queue.claim(timeout=0)
+
+    assert queue.queued_paths() == {"b", "c"}
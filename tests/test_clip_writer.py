@@ -0,0 +1,95 @@
+import threading
+
+import cv2
+import numpy as np
+
+from clip_writer import AsyncClipWriter, open_clip_writer
+
+
+class SlowEncoder:
+    """Encoder that blocks every write until `proceed` is set."""
+
+    def __init__(self):
+        self.proceed = threading.Event()
+        self.frames = []
+        self.released = False
+
+    def isOpened(self):
+        return True
+
+    def write(self, frame):
+        self.proceed.wait()
+        self.frames.append(frame)
+
+    def release(self):
+        self.released = True
+
+
+def frame(value=0, size=(4, 4)):
+    return np.full((*size, 3), value, dtype=np.uint8)
+
+
+def test_finish_does_not_wait_for_the_encoder():
+    encoder = SlowEncoder()
+    writer = AsyncClipWriter(encoder, path="clip.avi")
+    writer.write(frame())
+    done = writer.finish()
+    assert not done.done() and not encoder.released
+
+    encoder.proceed.set()
+    assert done.result(timeout=5) == "clip.avi"
+    assert encoder.released and writer.written == 1
+
+
+def test_frames_beyond_the_byte_budget_are_dropped():
+    encoder = SlowEncoder()
+    writer = AsyncClipWriter(encoder, path="clip.avi", max_bytes=3 * frame().nbytes)
+    for value in range(6):
+        writer.write(frame(value))
+    encoder.proceed.set()
+    writer.release()
+
+    # The first frame may already be with the encoder, freeing its share of the budget.
+    assert writer.written + writer.dropped == 6
+    assert 3 <= writer.written <= 4
+    assert [int(f[0, 0, 0]) for f in encoder.frames] == list(range(writer.written))
+
+
+def test_frames_beyond_the_queue_size_are_dropped():
+    encoder = SlowEncoder()
+    writer = AsyncClipWriter(encoder, queue_size=2)
+    for value in range(6):
+        writer.write(frame(value))
+    encoder.proceed.set()
+    writer.release()
+    assert writer.dropped >= 3
+
+
+def test_a_clip_without_frames_is_removed(tmp_path):
+    path = str(tmp_path / "empty.avi")
+    writer = open_clip_writer(path, 10, (16, 16), fourcc="MJPG", backend="opencv")
+    assert writer.release() is None
+    assert not (tmp_path / "empty.avi").exists()
+
+
+def test_finished_clip_is_readable(tmp_path):
+    path = str(tmp_path / "clip.avi")
+    writer = open_clip_writer(path, 10, (16, 16), fourcc="MJPG", backend="opencv")
+    for value in range(5):
+        writer.write(frame(value * 50, size=(16, 16)))
+    assert writer.finish().result(timeout=10) == path
+
+    cap = cv2.VideoCapture(path)
+    assert int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) == 5
+    cap.release()
+
+
+def test_blocking_writer_waits_instead_of_dropping():
+    encoder = SlowEncoder()
+    writer = AsyncClipWriter(encoder, queue_size=1, block=True)
+    threading.Timer(0.2, encoder.proceed.set).start()
+    for value in range(5):
+        writer.write(frame(value))
+    writer.release()
+    assert writer.dropped == 0
+    assert [int(f[0, 0, 0]) for f in encoder.frames] == list(range(5))
@@ -0,0 +1,107 @@
+import asyncio
+import datetime
+import time
+import uuid
+
+import pytest
+
+# The routers package imports the annotation models.
+pytest.importorskip("ai.invision_ai.video_annotator")
+
+from routers import dashboard_routes  # noqa: E402
+from tasks.camera_health import CameraHealthRegistry, Heartbeat  # noqa: E402
+from fakes import Record, route_test_client  # noqa: E402
+
+USER_ID = "6b5a4a46-0000-4000-8000-0000000000b1"
+CAMERA_ID = uuid.UUID(int=1)
+HEADERS = {"X-User-ID": USER_ID, "Authorization": "Bearer token"}
+
+
+def user(todays_alerts=3):
+    return Record(
+        id=USER_ID,
+        camera=[
+            Record(id=CAMERA_ID, ip_address="10.0.0.1", room=Record(name="Kitchen"), todays_alerts=todays_alerts),
+            Record(id=uuid.UUID(int=2), ip_address="10.0.0.2", room=None, todays_alerts=0),
+        ],
+        rules=[Record(id=1), Record(id=2)],
+        rooms=[Record(id="kitchen")],
+        todays_alerts=todays_alerts,
+        recent_alerts=[Record(
+            id=uuid.UUID(int=9), time=datetime.datetime(2025, 2, 1, tzinfo=datetime.timezone.utc),
+            description="ran", rule=Record(text="no running"), camera=Record(room=Record(name="Kitchen")),
+        )],
+    )
+
+
+@pytest.fixture
+def health(monkeypatch):
+    registry = CameraHealthRegistry(queue_size=4)
+    monkeypatch.setattr(dashboard_routes, "camera_health", registry)
+    return registry
+
+
+@pytest.fixture
+def api(fake_db, health, monkeypatch):
+    monkeypatch.setattr(dashboard_routes, "client", fake_db)
+    monkeypatch.setattr(dashboard_routes, "_dashboard_cache", {})
+    monkeypatch.setattr(dashboard_routes, "_dashboard_locks", {})
+    fake_db.respond("CameraAlertCounter", user())
+    return route_test_client(dashboard_routes.router)
+
+
+def test_dashboard_is_built_from_one_query_and_the_counters(api, fake_db):
+    response = api.get("/dashboardstats", headers=HEADERS)
+    assert response.status_code == 200
+    payload = response.json()
+    assert payload["overview"]["totalCameras"] == {"count": 2, "active": 0}
+    assert payload["overview"]["todaysAlerts"]["count"] == 3
+    assert [monitor["name"] for monitor in payload["activeMonitors"]] == ["Kitchen", "10.0.0.2"]
+    assert payload["activeMonitors"][0]["stats"]["violations"] == 3
+    assert payload["recentAlerts"][0]["type"] == "no running"
+    [params] = fake_db.queries("CameraAlertCounter")
+    assert params["today"] == datetime.datetime.now(datetime.timezone.utc).date()
+
+
+def test_payload_is_cached_but_camera_health_is_live(api, fake_db, health):
+    api.get("/dashboardstats", headers=HEADERS)
+    health.update(Heartbeat(str(CAMERA_ID), 1, "copy", time.time(), 12.5, 0.1, None, time.time()))
+    fake_db.respond("CameraAlertCounter", user(todays_alerts=4))
+
+    payload = api.get("/dashboardstats", headers=HEADERS).json()
+    assert len(fake_db.queries("CameraAlertCounter")) == 1
+    assert payload["overview"]["todaysAlerts"]["count"] == 3
+    assert payload["overview"]["totalCameras"]["active"] == 1
+    monitor = payload["activeMonitors"][0]
+    assert monitor["status"] == "online" and monitor["stats"]["fps"] == 12.5
+
+
+def test_payload_is_rebuilt_after_the_ttl(api, fake_db, monkeypatch):
+    monkeypatch.setattr(dashboard_routes, "DASHBOARD_CACHE_TTL", 0)
+    api.get("/dashboardstats", headers=HEADERS)
+    fake_db.respond("CameraAlertCounter", user(todays_alerts=4))
+    payload = api.get("/dashboardstats", headers=HEADERS).json()
+    assert payload["overview"]["todaysAlerts"]["count"] == 4
+
+
+def test_unknown_user_is_404(api, fake_db):
+    fake_db.respond("CameraAlertCounter", None)
+    other = {**HEADERS, "X-User-ID": "6b5a4a46-0000-4000-8000-0000000000b2"}
+    assert api.get("/dashboardstats", headers=other).status_code == 404
+
+
+def test_concurrent_requests_share_one_build(monkeypatch):
+    monkeypatch.setattr(dashboard_routes, "_dashboard_cache", {})
+    monkeypatch.setattr(dashboard_routes, "_dashboard_locks", {})
+    builds = []
+
+    async def build():
+        builds.append(1)
+        await asyncio.sleep(0.01)
+        return {"built": len(builds)}
+
+    async def tabs():
+        return await asyncio.gather(*(dashboard_routes.cached_dashboard("u", build) for _ in range(5)))
+
+    assert asyncio.run(tabs()) == [{"built": 1}] * 5
+    assert builds == [1]
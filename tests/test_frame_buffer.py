@@ -0,0 +1,105 @@
+import cv2
+import numpy as np
+import pytest
+
+from frame_buffer import FrameRingBuffer
+from frame_grabber import FrameGrabber
+from video_processing import buffer_capacity, capture_and_detect_motion
+
+
+def push(buffer, value):
+    buffer.next_slot()[:] = value
+    buffer.commit()
+
+
+def values(frames):
+    return [int(frame[0, 0, 0]) for frame in frames]
+
+
+@pytest.fixture
+def video(tmp_path):
+    """40 frames of 160x120 with a bright square moving across (so there is motion)."""
+    path = str(tmp_path / "moving.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 20, (160, 120))
+    for i in range(40):
+        frame = np.zeros((120, 160, 3), dtype=np.uint8)
+        x = (i * 8) % 120
+        frame[30:90, x:x + 40] = 255
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def test_ring_keeps_the_latest_frames_in_order_after_wrapping():
+    buffer = FrameRingBuffer(3, 2, 2)
+    for value in range(5):
+        push(buffer, value)
+
+    assert len(buffer) == 3
+    assert [values(segment) for segment in buffer.segments()] == [[2], [3, 4]]
+    assert values(buffer) == [2, 3, 4]
+    assert values(buffer.view()) == [2, 3, 4]
+    assert int(buffer[0][0, 0, 0]) == 2 and int(buffer[-1][0, 0, 0]) == 4
+    with pytest.raises(IndexError):
+        buffer[3]
+
+
+def test_ring_views_share_the_preallocated_memory():
+    buffer = FrameRingBuffer(4, 2, 2)
+    for value in range(3):
+        push(buffer, value)
+
+    [segment] = buffer.segments()
+    assert np.shares_memory(segment, buffer.frames)
+    assert np.shares_memory(buffer.view(), buffer.frames)
+
+    buffer.clear()
+    assert len(buffer) == 0 and values(buffer) == []
+
+
+def test_read_from_decodes_into_the_slot(video):
+    cap = cv2.VideoCapture(video)
+    buffer = FrameRingBuffer(2, 120, 160)
+    frames = [buffer.read_from(cap) for _ in range(3)]
+    cap.release()
+
+    assert all(np.shares_memory(frame, buffer.frames) for frame in frames)
+    assert len(buffer) == 2
+
+
+def test_buffer_capacity_is_bounded_by_count_or_bytes():
+    frame_shape = (1080, 1920, 3)
+    assert buffer_capacity(30, 30, frame_shape, max_buffer_frames=100) == 100
+    assert buffer_capacity(30, 30, frame_shape, max_bytes=1920 * 1080 * 3 * 50) == 50
+    assert buffer_capacity(1, 10, (2, 2, 3), max_bytes=1 << 30) == 10
+
+
+def test_grabber_decodes_into_the_buffer_and_pauses(video):
+    cap = cv2.VideoCapture(video)
+    buffer = FrameRingBuffer(8, 120, 160)
+    grabber = FrameGrabber(cap, queue_size=4, buffer=buffer).start()
+    frame, _ = grabber.read(timeout=5)
+    assert np.shares_memory(frame, buffer.frames)
+
+    grabber.pause()
+    snapshot = buffer.frames.copy()
+    grabber.thread.join(timeout=5)  # Drains the rest of the file with grab() only.
+    assert grabber.stats["skipped"] > 0
+    assert np.array_equal(buffer.frames, snapshot)
+    grabber.resume()
+    assert len(buffer) == 0 and grabber.read(timeout=1) is None
+    grabber.stop()
+    cap.release()
+
+    with pytest.raises(ValueError):
+        FrameGrabber(None, queue_size=8, buffer=FrameRingBuffer(8, 2, 2))
+
+
+@pytest.mark.parametrize("threaded", [False, True])
+def test_chunks_are_views_of_one_buffer(video, threaded):
+    buffers = set()
+    for chunk in capture_and_detect_motion(video, chunk_duration=0, wait_duration=0, min_motion_frames=1,
+                                           threaded=threaded, queue_size=4):
+        assert len(chunk) > 0
+        buffers.add(id(chunk.frames))
+    assert len(buffers) == 1
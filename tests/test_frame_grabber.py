@@ -0,0 +1,74 @@
+import numpy as np
+
+from frame_grabber import FrameGrabber
+
+
+class FakeCapture:
+    """`count` 8x8 frames whose pixels hold their index."""
+
+    def __init__(self, count):
+        self.count = count
+        self.position = 0
+        self.decoded = 0
+
+    def grab(self):
+        if self.position >= self.count:
+            return False
+        self.position += 1
+        return True
+
+    def read(self, image=None):
+        if not self.grab():
+            return False, None
+        self.decoded += 1
+        return True, np.full((8, 8, 3), self.position - 1, dtype=np.uint8)
+
+
+def read_all(grabber):
+    values = []
+    while (item := grabber.read(timeout=5)) is not None:
+        values.append(int(item[0][0, 0, 0]))
+    return values
+
+
+def wait_finished(grabber):
+    with grabber.cond:
+        assert grabber.cond.wait_for(lambda: grabber.finished, timeout=5)
+
+
+def test_frames_are_delivered_in_order_until_the_stream_ends():
+    grabber = FrameGrabber(FakeCapture(10), queue_size=16).start()
+    assert read_all(grabber) == list(range(10))
+    assert grabber.read(timeout=0.1) is None
+    grabber.stop()
+    assert grabber.stats["grabbed"] == grabber.stats["delivered"] == 10
+    assert grabber.stats["dropped"] == 0
+
+
+def test_a_slow_consumer_drops_the_oldest_frames_not_the_stream():
+    capture = FakeCapture(20)
+    grabber = FrameGrabber(capture, queue_size=4).start()
+    # The consumer reads nothing until the whole stream has been grabbed.
+    wait_finished(grabber)
+    assert capture.position == 20
+    assert read_all(grabber) == [16, 17, 18, 19]
+    assert grabber.stats["dropped"] == 16
+
+
+def test_paused_grabber_drains_the_stream_without_decoding():
+    capture = FakeCapture(10)
+    grabber = FrameGrabber(capture, queue_size=16)
+    grabber.pause()
+    grabber.start()
+    wait_finished(grabber)
+    assert capture.position == 10 and capture.decoded == 0
+    assert grabber.stats["skipped"] == 10
+    grabber.resume()
+    assert grabber.read(timeout=0.1) is None
+
+
+def test_frames_read_long_after_the_grab_count_as_late():
+    grabber = FrameGrabber(FakeCapture(3), queue_size=8, late_after=0).start()
+    wait_finished(grabber)
+    read_all(grabber)
+    assert grabber.stats["late"] == 3
@@ -0,0 +1,67 @@
+import threading
+
+import pytest
+
+from tasks.annotation_cache import AnnotationCache
+from tasks.job_runner import JobQueueFull, JobRunner
+from tasks.rule_index import Rule
+
+
+def test_job_result_and_failure_are_recorded():
+    runner = JobRunner("test", max_workers=1, max_pending=5)
+    done = runner.submit("add", lambda a, b: a + b, a=1, b=2)
+    failed = runner.submit("fail", lambda: 1 / 0)
+    done.future.result(timeout=5)
+    failed.future.result(timeout=5)
+
+    assert done.to_dict()["status"] == "done" and done.result == 3
+    assert failed.status == "failed" and "division by zero" in failed.error
+    assert runner.get(done.id) is done
+    assert [job.id for job in runner.list()] == [failed.id, done.id]
+
+
+def test_submit_refuses_jobs_beyond_max_pending():
+    runner = JobRunner("test", max_workers=1, max_pending=1)
+    release = threading.Event()
+    started = threading.Event()
+
+    def block():
+        started.set()
+        release.wait(5)
+
+    running = runner.submit("block", block)
+    started.wait(5)
+    queued = runner.submit("block", block)
+    with pytest.raises(JobQueueFull):
+        runner.submit("block", block)
+    release.set()
+    for job in (running, queued):
+        job.future.result(timeout=5)
+
+
+def test_concurrent_simulations_share_the_annotation_cache(tmp_path):
+    """Two job threads analyse and cache at once (each thread needs its own SQLite connection)."""
+    cache = AnnotationCache(folder=str(tmp_path / "cache"))
+    runner = JobRunner("simulate", max_workers=2, max_pending=10)
+    clip = tmp_path / "clip.mp4"
+    clip.write_bytes(b"frames")
+    both_running = threading.Barrier(2, timeout=5)
+    calls = []
+
+    def simulate(rule_text):
+        def analyze():
+            calls.append(rule_text)
+            both_running.wait()  # Both threads are inside the cache at the same time.
+            return f"annotations for {rule_text}", [rule_text]
+        return cache.cached_analysis(str(clip), [Rule("r", rule_text)], analyze)
+
+    jobs = [runner.submit("simulate", simulate, rule_text=text) for text in ("no running", "no food")]
+    for job in jobs:
+        job.future.result(timeout=5)
+    assert [job.status for job in jobs] == ["done", "done"], [job.error for job in jobs]
+
+    # A repeat is served from the cache, from yet another thread.
+    again = runner.submit("simulate", simulate, rule_text="no food")
+    again.future.result(timeout=5)
+    assert again.result == ("annotations for no food", ["no food"])
+    assert sorted(calls) == ["no food", "no running"]
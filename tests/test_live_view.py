@@ -0,0 +1,96 @@
+import asyncio
+import multiprocessing
+import queue
+import time
+
+import cv2
+import numpy as np
+import pytest
+
+from live_view import LiveViewHub
+
+
+def frame(value):
+    return np.full((60, 80, 3), value, dtype=np.uint8)
+
+
+@pytest.fixture
+def hub():
+    return LiveViewHub(queue_size=8, max_fps=0, idle_timeout=5)
+
+
+def capture_worker(hub, camera_id, count):
+    # Decodes frames regardless; they only reach the hub once a viewer is watching.
+    deadline = time.monotonic() + 5
+    while not hub.watched(camera_id) and time.monotonic() < deadline:
+        hub.publish_frame(camera_id, frame(0))
+        time.sleep(0.01)
+    for value in range(1, count + 1):
+        hub.publish_frame(camera_id, frame(value * 20))
+        time.sleep(0.05)
+
+
+async def first_frames(stream, count):
+    received = []
+    async for jpeg in stream.frames():
+        received.append(jpeg)
+        if len(received) == count:
+            return received
+
+
+def test_unwatched_cameras_are_not_encoded(hub):
+    hub.watch_flag("cam")
+    hub.publish_frame("cam", frame(10))
+    hub.publish("cam", b"jpeg")
+    with pytest.raises(queue.Empty):
+        hub.queue.get(timeout=0.2)
+    assert hub.last_encoded == {}
+
+
+def test_viewers_get_the_frames_of_a_forked_capture_worker(hub):
+    # As in the supervisor: the flag exists before the worker forks.
+    hub.watch_flag("cam")
+    worker = multiprocessing.get_context("fork").Process(target=capture_worker, args=(hub, "cam", 3))
+    worker.start()
+    hub.start()
+    try:
+        stream = hub.stream("cam")
+        received = asyncio.run(asyncio.wait_for(first_frames(stream, 2), timeout=5))
+    finally:
+        worker.join(timeout=5)
+    values = [cv2.imdecode(np.frombuffer(jpeg, np.uint8), cv2.IMREAD_COLOR).mean() for jpeg in received]
+    assert all(value > 10 for value in values)
+
+
+def test_idle_streams_stop_the_encoding(hub):
+    stream = hub.stream("cam")
+
+    async def watch_once():
+        viewer = stream.frames()
+        pending = asyncio.ensure_future(viewer.__anext__())
+        await asyncio.sleep(0)
+        assert hub.watched("cam")
+        stream._publish(b"jpeg")
+        assert await pending == b"jpeg"
+        await viewer.aclose()
+
+    asyncio.run(watch_once())
+    assert hub.watched("cam")
+    hub.close_idle(now=time.monotonic() + 1)
+    assert hub.watched("cam") and hub.streams["cam"] is stream
+    hub.close_idle(now=time.monotonic() + 10)
+    assert not hub.watched("cam") and "cam" not in hub.streams
+    assert hub.stream("cam") is not stream
+
+
+def test_removing_a_camera_ends_its_viewers(hub):
+    stream = hub.stream("cam")
+
+    async def watch():
+        viewer = asyncio.ensure_future(first_frames(stream, 1))
+        await asyncio.sleep(0)
+        hub.remove("cam")
+        return await asyncio.wait_for(viewer, timeout=5)
+
+    assert asyncio.run(watch()) is None
+    assert not hub.watched("cam")
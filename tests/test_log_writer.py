@@ -0,0 +1,170 @@
+import datetime
+import json
+from types import SimpleNamespace
+
+import edgedb
+import pytest
+
+from tasks import log_writer
+from tasks.log_writer import BatchingLogWriter, LogWriter, daily_counts
+
+BAD_RULE = "00000000-0000-0000-0000-00000000dead"
+
+
+class FakeClient:
+    """Records inserted entries; entries of BAD_RULE are rejected like a missing required link."""
+
+    def __init__(self, transient_failures=0):
+        self.inserted = []
+        self.calls = 0
+        self.queries = []
+        self.transient_failures = transient_failures
+
+    def query(self, query, entries, counts):
+        self.calls += 1
+        self.queries.append(query)
+        if self.transient_failures:
+            self.transient_failures -= 1
+            raise edgedb.ClientConnectionFailedError("connection lost")
+        if any(rule_id == BAD_RULE for _, rule_id, _, _ in entries):
+            raise edgedb.MissingRequiredError("missing value for required link 'rule'")
+        self.inserted.extend(entries)
+
+
+def reports(*rule_ids):
+    return [SimpleNamespace(rule_id=rule_id, description=f"breach of {rule_id}") for rule_id in rule_ids]
+
+
+@pytest.fixture(autouse=True)
+def dead_letter_path(tmp_path, monkeypatch):
+    path = tmp_path / "dead_letter.jsonl"
+    monkeypatch.setattr(log_writer, "LOG_DEAD_LETTER_PATH", str(path))
+    return path
+
+
+def make_batching_writer(client, **kwargs):
+    # A long window keeps the background thread out of the way; the tests flush explicitly.
+    return BatchingLogWriter(client, window=3600, max_size=10_000, **kwargs)
+
+
+def test_batching_writer_acks_only_after_flush():
+    client = FakeClient()
+    writer = make_batching_writer(client)
+    acked = []
+
+    writer.write("cam", reports("r1", "r2"), on_commit=lambda: acked.append("clip-1"))
+    writer.write("cam", reports("r3"), on_commit=lambda: acked.append("clip-2"))
+    assert acked == [] and client.inserted == []
+
+    writer.flush()
+    assert client.calls == 1
+    assert [entry[1] for entry in client.inserted] == ["r1", "r2", "r3"]
+    assert acked == ["clip-1", "clip-2"]
+    assert writer.pending == []
+
+
+def test_bad_entry_is_dead_lettered_without_blocking_the_batch(dead_letter_path):
+    client = FakeClient()
+    writer = make_batching_writer(client)
+    acked = []
+
+    writer.write("cam", reports("r1", BAD_RULE), on_commit=lambda: acked.append("clip-1"))
+    writer.write("cam", reports("r2"), on_commit=lambda: acked.append("clip-2"))
+    writer.flush()
+
+    assert [entry[1] for entry in client.inserted] == ["r1", "r2"]
+    assert acked == ["clip-1", "clip-2"]
+    assert writer.pending == []
+    [line] = dead_letter_path.read_text().splitlines()
+    assert json.loads(line)["rule_id"] == BAD_RULE
+
+
+def test_transient_failure_is_retried_then_given_up_unacked():
+    client = FakeClient(transient_failures=10)
+    writer = make_batching_writer(client, max_retries=3)
+    acked = []
+    writer.write("cam", reports("r1"), on_commit=lambda: acked.append("clip-1"))
+
+    writer.flush()
+    writer.flush()
+    assert len(writer.pending) == 1  # Still waiting for the database to come back.
+
+    writer.flush()
+    assert writer.pending == [] and writer.pending_entries == 0
+    assert acked == [] and client.inserted == []
+
+
+def test_transient_failure_then_success():
+    client = FakeClient(transient_failures=1)
+    writer = make_batching_writer(client)
+    acked = []
+    writer.write("cam", reports("r1"), on_commit=lambda: acked.append("clip-1"))
+
+    writer.flush()
+    assert acked == []
+    writer.flush()
+    assert acked == ["clip-1"] and len(client.inserted) == 1
+
+
+def test_unbatched_writer_commits_before_ack(dead_letter_path):
+    client = FakeClient()
+    writer = LogWriter(client)
+    acked = []
+
+    writer.write("cam", reports("r1", BAD_RULE), on_commit=lambda: acked.append("clip"))
+    assert [entry[1] for entry in client.inserted] == ["r1"]
+    assert acked == ["clip"]
+    assert dead_letter_path.exists()
+
+
+def test_unbatched_writer_raises_transient_errors():
+    writer = LogWriter(FakeClient(transient_failures=1))
+    acked = []
+    with pytest.raises(edgedb.ClientConnectionFailedError):
+        writer.write("cam", reports("r1"), on_commit=lambda: acked.append("clip"))
+    assert acked == []
+
+
+def test_a_clips_reports_are_inserted_directly_in_one_query():
+    client = FakeClient()
+    LogWriter(client).write("cam", reports("r1", "r2", "r3"))
+    assert client.calls == 1
+    # LogEntry rows only: Camera.logs is a backlink, so no second write per entry.
+    assert "INSERT LogEntry" in client.queries[0] and "UPDATE Camera " not in client.queries[0]
+    assert [(camera_id, rule_id) for camera_id, rule_id, _, _ in client.inserted] == \
+        [("cam", "r1"), ("cam", "r2"), ("cam", "r3")]
+    assert all(time.tzinfo is not None for _, _, _, time in client.inserted)
+
+
+def test_clips_without_breaches_do_not_query():
+    client = FakeClient()
+    acked = []
+    LogWriter(client).write("cam", [], on_commit=lambda: acked.append("clip"))
+    assert client.calls == 0 and acked == ["clip"]
+
+
+def test_alert_counters_are_per_camera_and_utc_day():
+    utc = datetime.timezone.utc
+    late = datetime.datetime(2025, 2, 1, 23, 30, tzinfo=utc)
+    # 00:30 in UTC+2 is still the 1st in UTC.
+    early_local = datetime.datetime(2025, 2, 2, 0, 30, tzinfo=datetime.timezone(datetime.timedelta(hours=2)))
+    entries = [
+        ("cam-1", "r1", "a", late),
+        ("cam-1", "r2", "b", early_local),
+        ("cam-1", "r1", "c", late + datetime.timedelta(hours=1)),
+        ("cam-2", "r1", "d", late),
+    ]
+    assert sorted(daily_counts(entries)) == [
+        ("cam-1", datetime.date(2025, 2, 1), 2),
+        ("cam-1", datetime.date(2025, 2, 2), 1),
+        ("cam-2", datetime.date(2025, 2, 1), 1),
+    ]
+
+
+def test_counters_are_bumped_in_the_insert_query():
+    client = FakeClient()
+    calls = []
+    client.query = lambda query, entries, counts: calls.append(counts)
+    LogWriter(client).write("cam", reports("r1", "r2"))
+    [counts] = calls
+    assert [(camera_id, n) for camera_id, _, n in counts] == [("cam", 2)]
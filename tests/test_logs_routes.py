@@ -0,0 +1,117 @@
+import datetime
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+# The routers package imports the annotation models.
+pytest.importorskip("ai.invision_ai.video_annotator")
+
+from routers import logs_routes  # noqa: E402
+from tasks.annotation_cache import AnnotationCache  # noqa: E402
+from tasks.segment_store import SegmentStore  # noqa: E402
+from fakes import Record, route_test_client  # noqa: E402
+
+LOG_ID = "6b5a4a46-0000-4000-8000-000000000001"
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    store = SegmentStore(root=str(tmp_path / "segments"), index_path=str(tmp_path / "index.sqlite3"))
+    monkeypatch.setattr(logs_routes, "segment_store", store)
+    return store
+
+
+@pytest.fixture
+def api(fake_db, monkeypatch):
+    monkeypatch.setattr(logs_routes, "client", fake_db)
+    return route_test_client(logs_routes.router)
+
+
+def add_segment(store, tmp_path, start, end):
+    path = tmp_path / f"recording-{start}.mkv"
+    path.write_bytes(b"x" * 10)
+    return store.add("cam", str(path), start, end)
+
+
+def iso(at, offset):
+    return (at + datetime.timedelta(seconds=offset)).isoformat()
+
+
+def test_footage_lists_the_segments_before_the_entry(api, fake_db, store, tmp_path):
+    # Recent, so the retention pass below keeps it.
+    at = datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0) - datetime.timedelta(hours=1)
+    for offset in (-400, -200, -100, 100):
+        add_segment(store, tmp_path, at.timestamp() + offset, at.timestamp() + offset + 90)
+    fake_db.respond("SELECT LogEntry", Record(time=at, camera=Record(id="cam")))
+
+    # The retention thread opened its connection first; the route must not reuse it.
+    retention = threading.Thread(target=store.enforce_retention)
+    retention.start()
+    retention.join()
+
+    response = api.get(f"/logs/{LOG_ID}/footage", params={"before": 250})
+    assert response.status_code == 200
+    assert [segment["start"] for segment in response.json()] == [
+        iso(at, -200), iso(at, -100),
+    ]
+    assert fake_db.queries("SELECT LogEntry") == [{"log_id": LOG_ID}]
+
+    response = api.get(f"/logs/{LOG_ID}/footage", params={"before": 0, "after": 150})
+    assert [segment["end"] for segment in response.json()] == [iso(at, 190)]
+
+
+def test_footage_of_an_unknown_entry_is_404(api, fake_db, store):
+    fake_db.respond("SELECT LogEntry", None)
+    assert api.get(f"/logs/{LOG_ID}/footage").status_code == 404
+
+
+class Simulation:
+    """Stands in for the annotator, the analyzer and the sync client of run_simulation."""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.runs = []
+
+    def query_single(self, query, **params):
+        assert params["user_id"] == logs_routes.SIMULATION_USER_ID
+        return Record(rules=self.rules, room_id="room-1")
+
+    def annotator(self):
+        return SimpleNamespace(run=lambda **kwargs: self.runs.append(kwargs) or "annotations")
+
+    def analyzer(self):
+        return SimpleNamespace(analyze=lambda annotations, camera_id, user_id: [
+            SimpleNamespace(description=f"breach of {rule.text}", rule_id=rule.id) for rule in self.rules
+        ])
+
+
+@pytest.fixture
+def simulation(tmp_path, monkeypatch):
+    rule = Record(id="r1", text="no running", shared=True, rooms=[])
+    simulation = Simulation([rule])
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "videos").mkdir()
+    (tmp_path / "videos" / "clip.mp4").write_bytes(b"frames")
+    monkeypatch.setattr(logs_routes, "_get_sync_client", lambda: simulation)
+    monkeypatch.setattr(logs_routes, "VideoAnnotator", simulation.annotator)
+    monkeypatch.setattr(logs_routes, "VideoAnalyzer", simulation.analyzer)
+    monkeypatch.setattr(logs_routes, "annotation_cache", AnnotationCache(folder=str(tmp_path / "cache")))
+    return simulation
+
+
+def test_simulation_runs_as_the_simulation_user_and_is_cached(simulation):
+    first = logs_routes.run_simulation("cam", "clip.mp4")
+    assert [run["user_id"] for run in simulation.runs] == [logs_routes.SIMULATION_USER_ID]
+    assert [breach["description"] for breach in first["breaches"]] == ["breach of no running"]
+
+    # Same video, same rules: served from the cache.
+    again = logs_routes.run_simulation("cam", "clip.mp4")
+    assert len(simulation.runs) == 1
+    assert again["breaches"][0]["description"] == "breach of no running"
+
+    # A rule of the simulation user changed: analysed again.
+    simulation.rules = [Record(id="r1", text="no food", shared=True, rooms=[])]
+    changed = logs_routes.run_simulation("cam", "clip.mp4")
+    assert len(simulation.runs) == 2
+    assert changed["breaches"][0]["description"] == "breach of no food"
@@ -0,0 +1,121 @@
+import cv2
+import numpy as np
+import pytest
+
+from motion_detection import MOTION_BACKENDS, create_motion_detector, validate_zones, zone_mask
+import video_processing
+from video_processing import capture_and_detect_motion
+
+TOP_STRIP = [[0, 0], [1, 0], [1, 0.2], [0, 0.2]]
+
+
+def frame_with_square(x, y, size=40, shape=(240, 320)):
+    frame = np.zeros((*shape, 3), dtype=np.uint8)
+    frame[y:y + size, x:x + size] = 255
+    return frame
+
+
+def scores(detector, frames):
+    return [detector.score(frame) for frame in frames]
+
+
+@pytest.mark.parametrize("zones", [
+    None,
+    {},
+    {"include": [TOP_STRIP], "exclude": []},
+    '{"include": [], "exclude": [[[0, 0], [1, 0], [1, 0.2], [0, 0.2]]]}',
+])
+def test_valid_zones(zones):
+    assert isinstance(validate_zones(zones), dict)
+
+
+@pytest.mark.parametrize("zones, message", [
+    ({"include": [[[0.1, 0.2, 0.3]]]}, "at least 3 points"),
+    ({"include": [[]]}, "at least 3 points"),
+    ({"include": [[[0.1, 0.2, 0.3], [0, 0], [1, 1]]]}, "[x, y]"),
+    ({"exclude": [[[0, 0], [1.5, 0], [1, 1]]]}, "0 <= x, y <= 1"),
+    ({"include": [[[0, 0], [0.5, 0.5], [1, 1]]]}, "enclose an area"),
+    ({"include": "everywhere"}, "list of polygons"),
+    ("{not json", "not valid JSON"),
+])
+def test_malformed_zones_are_rejected(zones, message):
+    with pytest.raises(ValueError, match=message.replace("[", r"\[").replace("]", r"\]")):
+        validate_zones(zones)
+
+
+def test_zone_mask_covers_include_minus_exclude():
+    mask = zone_mask({"include": [[[0, 0], [1, 0], [1, 1], [0, 1]]], "exclude": [TOP_STRIP]}, 100, 50)
+    assert mask.shape == (50, 100)
+    assert mask[:9].max() == 0 and mask[11:].min() == 255
+    assert zone_mask(None, 10, 10).min() == 255
+
+
+def test_motion_outside_the_zones_is_ignored():
+    # The square only moves inside the top strip, which is excluded.
+    frames = [frame_with_square(20 + 10 * i, 0) for i in range(4)]
+    masked = create_motion_detector(zones={"exclude": [TOP_STRIP]})
+    unmasked = create_motion_detector()
+    assert max(scores(masked, frames)[1:]) == 0
+    assert max(scores(unmasked, frames)[1:]) > unmasked.threshold
+
+
+def test_motion_is_scored_on_a_downscaled_proxy():
+    detector = create_motion_detector(scale=0.25)
+    detector.score(frame_with_square(0, 100))
+    assert detector.size == (80, 60)
+
+
+def test_invalid_stored_zones_fall_back_to_the_whole_frame():
+    # Malformed zones stored before validation must not crash the capture worker.
+    detector = create_motion_detector(zones={"include": [[[0.1, 0.2, 0.3]]]})
+    frames = [frame_with_square(20 + 10 * i, 100) for i in range(3)]
+    assert detector.zones is None
+    assert scores(detector, frames)[-1] > detector.threshold
+
+
+@pytest.mark.parametrize("backend", sorted(MOTION_BACKENDS))
+def test_every_backend_sees_a_moving_square_but_not_a_static_scene(backend):
+    detector = create_motion_detector(backend)
+    static = [frame_with_square(100, 100) for _ in range(10)]
+    assert not any(detector.detect(frame) for frame in static)
+    moving = [frame_with_square(100 + 20 * i, 100) for i in range(1, 8)]
+    assert any(detector.detect(frame) for frame in moving)
+
+
+def test_unknown_backend_is_rejected_and_none_means_frame_diff():
+    with pytest.raises(ValueError, match="Unknown motion backend"):
+        create_motion_detector("optical_flow")
+    assert create_motion_detector(None).name == "frame_diff"
+
+
+def test_reset_forgets_the_previous_frame():
+    detector = create_motion_detector("frame_diff")
+    detector.score(frame_with_square(0, 0))
+    detector.reset()
+    # Nothing to compare with after a gap in the stream.
+    assert detector.score(frame_with_square(200, 150)) is None
+
+
+def write_video(path):
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 20, (320, 240))
+    for i in range(10):
+        writer.write(frame_with_square(20 + 20 * i, 100))
+    writer.release()
+    return path
+
+
+@pytest.mark.parametrize("threaded", [False, True])
+def test_capture_path_builds_the_cameras_detector(tmp_path, monkeypatch, threaded):
+    built = []
+
+    def spy(backend, **kwargs):
+        built.append((backend, kwargs["zones"]))
+        return create_motion_detector(backend, **kwargs)
+
+    monkeypatch.setattr(video_processing, "create_motion_detector", spy)
+    chunks = capture_and_detect_motion(
+        write_video(str(tmp_path / "moving.avi")), chunk_duration=0, wait_duration=0, min_motion_frames=1,
+        threaded=threaded, queue_size=4, motion_backend="block_sum", motion_zones={"exclude": [TOP_STRIP]},
+    )
+    assert sum(1 for _ in chunks) > 0
+    assert built == [("block_sum", {"exclude": [TOP_STRIP]})]
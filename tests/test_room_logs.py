@@ -0,0 +1,97 @@
+import datetime
+import json
+import uuid
+
+import pytest
+
+# The routers package imports the annotation models.
+pytest.importorskip("ai.invision_ai.video_annotator")
+
+from routers import logs_routes  # noqa: E402
+from fakes import Record, route_test_client  # noqa: E402
+
+ROOM_ID = "6b5a4a46-0000-4000-8000-0000000000a1"
+START = datetime.datetime(2025, 2, 1, tzinfo=datetime.timezone.utc)
+RANGE = {"start_time": "2025-02-01T00:00:00+00:00", "end_time": "2025-02-02T00:00:00+00:00"}
+
+
+def entry(minute, n):
+    return Record(
+        id=uuid.UUID(int=n),
+        time=START + datetime.timedelta(minutes=minute),
+        description=f"entry {n}",
+        rule=Record(id=uuid.UUID(int=1000), text="no running"),
+        camera=Record(id=uuid.UUID(int=2000), ip_address="10.0.0.1"),
+    )
+
+
+# Entries 2, 3 and 4 share a timestamp, so only the id orders them.
+ENTRIES = [entry(0, 1), entry(5, 3), entry(5, 2), entry(5, 4), entry(9, 5), entry(60 * 25, 6)]
+
+
+def keyset_page(room_id, start, end, after_time, after_id, limit):
+    """What ROOM_LOGS_PAGE_QUERY returns, over ENTRIES."""
+    rows = sorted((e for e in ENTRIES if start <= e.time <= end
+                   and (e.time > after_time or (e.time == after_time and str(e.id) > after_id))),
+                  key=lambda e: (e.time, str(e.id)))
+    return rows if limit is None else rows[:limit]
+
+
+@pytest.fixture
+def api(fake_db, monkeypatch):
+    fake_db.respond("ORDER BY .time THEN .id", keyset_page)
+    monkeypatch.setattr(logs_routes, "client", fake_db)
+    return route_test_client(logs_routes.router)
+
+
+def descriptions(rows):
+    return [row["description"] for row in rows]
+
+
+IN_RANGE = ["entry 1", "entry 2", "entry 3", "entry 4", "entry 5"]
+
+
+def test_without_a_limit_every_entry_is_returned(api, fake_db):
+    response = api.get(f"/rooms/{ROOM_ID}/logs", params=RANGE)
+    assert response.status_code == 200
+    assert descriptions(response.json()) == IN_RANGE
+    assert "X-Next-Cursor" not in response.headers
+    assert fake_db.queries("ORDER BY")[0]["limit"] is None
+
+
+def test_pages_follow_the_cursor_through_equal_timestamps(api):
+    pages, cursor = [], None
+    while True:
+        params = {**RANGE, "limit": 2, **({"cursor": cursor} if cursor else {})}
+        response = api.get(f"/rooms/{ROOM_ID}/logs", params=params)
+        assert response.status_code == 200
+        pages.append(descriptions(response.json()))
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert pages == [["entry 1", "entry 2"], ["entry 3", "entry 4"], ["entry 5"]]
+
+
+@pytest.mark.parametrize("params, status", [
+    ({"cursor": "not-a-cursor"}, 400),
+    ({"limit": 0}, 422),
+    ({"start_time": "yesterday"}, 400),
+])
+def test_bad_paging_parameters_are_rejected(api, params, status):
+    assert api.get(f"/rooms/{ROOM_ID}/logs", params={**RANGE, **params}).status_code == status
+
+
+def test_export_streams_every_batch_as_ndjson_or_csv(api, fake_db, monkeypatch):
+    monkeypatch.setattr(logs_routes, "LOG_EXPORT_BATCH_SIZE", 2)
+    response = api.get(f"/rooms/{ROOM_ID}/logs/export", params=RANGE)
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    rows = [json.loads(line) for line in response.text.splitlines()]
+    assert descriptions(rows) == IN_RANGE
+    assert rows[0]["rule"] == {"id": str(uuid.UUID(int=1000)), "text": "no running"}
+    # Three batches of at most 2 rows, each starting after the previous one.
+    assert [params["limit"] for params in fake_db.queries("ORDER BY")] == [2, 2, 2]
+
+    response = api.get(f"/rooms/{ROOM_ID}/logs/export", params={**RANGE, "format": "csv"})
+    lines = response.text.splitlines()
+    assert lines[0].startswith("id,time,description")
+    assert [line.split(",")[2] for line in lines[1:]] == IN_RANGE
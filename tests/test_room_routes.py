@@ -0,0 +1,52 @@
+import pytest
+
+# The routers package imports the annotation models.
+pytest.importorskip("ai.invision_ai.video_annotator")
+
+from routers import room_routes  # noqa: E402
+from fakes import Record, route_test_client  # noqa: E402
+
+USER_ID = "6b5a4a46-0000-4000-8000-0000000000b1"
+ROOMS = [
+    Record(uid="6b5a4a46-0000-4000-8000-0000000000a1", name="Kitchen", num_cameras=2, num_rules=3),
+    Record(uid="6b5a4a46-0000-4000-8000-0000000000a2", name="Hall", num_cameras=0, num_rules=1),
+]
+
+
+@pytest.fixture
+def api(fake_db, monkeypatch):
+    monkeypatch.setattr(room_routes, "client", fake_db)
+    monkeypatch.setattr(room_routes.rule_index, "invalidate", lambda: None)
+    return route_test_client(room_routes.router)
+
+
+def test_queries_count_through_the_room_backlinks():
+    for query in (room_routes.LIST_ROOMS_QUERY, room_routes.CREATE_ROOM_QUERY):
+        assert "count(r.<room[IS Camera])" in query and "count(r.<rooms[IS Rule])" in query
+        assert "{{" not in query
+    assert "INSERT Room" in room_routes.CREATE_ROOM_QUERY
+
+
+def test_rooms_are_listed_with_their_counts_in_one_query(api, fake_db):
+    fake_db.respond("num_cameras", ROOMS)
+    response = api.get("/rooms", params={"user_id": USER_ID})
+    assert response.status_code == 200
+    assert [(room["name"], room["num_cameras"], room["num_rules"]) for room in response.json()] == [
+        ("Kitchen", 2, 3), ("Hall", 0, 1),
+    ]
+    assert len(fake_db.calls) == 1
+
+
+def test_create_returns_the_users_rooms_from_one_round_trip(api, fake_db):
+    fake_db.respond("INSERT Room", ROOMS)
+    response = api.post("/rooms", json={"name": "Hall", "user_id": USER_ID})
+    assert response.status_code == 200 and len(response.json()) == 2
+    assert fake_db.queries("INSERT Room") == [{"user_id": USER_ID, "name": "Hall"}]
+    assert len(fake_db.calls) == 1
+
+
+def test_create_for_an_unknown_user_is_404(api, fake_db):
+    fake_db.respond("INSERT Room", [])
+    assert api.post("/rooms", json={"name": "Hall", "user_id": USER_ID}).status_code == 404
+    fake_db.respond("INSERT Room", ValueError("invalid uuid"))
+    assert api.post("/rooms", json={"name": "Hall", "user_id": "nope"}).status_code == 400
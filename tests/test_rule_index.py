@@ -0,0 +1,69 @@
+import pytest
+
+from fakes import Record
+from tasks.rule_index import Rule, RuleIndex, build_camera_rules
+
+
+def room(room_id):
+    return Record(id=room_id)
+
+
+def rule(rule_id, text, shared=False, rooms=()):
+    return Record(id=rule_id, text=text, shared=shared, rooms=[room(r) for r in rooms])
+
+
+def camera(camera_id, room_id, backend=None, zones=None):
+    return Record(id=camera_id, room=room(room_id) if room_id else None, motion_backend=backend, motion_zones=zones)
+
+
+OWNER = Record(
+    id="u1",
+    camera=[camera("c1", "kitchen", backend="mog2"), camera("c2", "hall"), camera("c3", None)],
+    rules=[
+        rule("r1", "no running", shared=True),
+        rule("r2", "no food", rooms=["kitchen"]),
+        rule("r3", "no shoes", rooms=["hall", "kitchen"]),
+    ],
+)
+
+
+class SyncClient:
+    def __init__(self, users):
+        self.users = users
+        self.queries = 0
+
+    def query(self, query):
+        self.queries += 1
+        return self.users
+
+
+def test_effective_rules_per_camera():
+    other = Record(id="u2", camera=[camera("c1", "kitchen")], rules=[rule("r9", "other user's rule", shared=True)])
+    index = build_camera_rules([OWNER, other])
+    assert index["c1"].owner_id == "u1" and index["c1"].motion_backend == "mog2"
+    assert index["c1"].rules == (Rule("r1", "no running"), Rule("r2", "no food"), Rule("r3", "no shoes"))
+    assert index["c2"].rules == (Rule("r1", "no running"), Rule("r3", "no shoes"))
+    # A camera without a room only gets the shared rules.
+    assert index["c3"].rules == (Rule("r1", "no running"),)
+
+
+def test_index_is_built_once_until_invalidated():
+    client = SyncClient([OWNER])
+    rules = RuleIndex(miss_refresh=60)
+    assert rules.get(client, "c1").owner_id == "u1"
+    assert rules.get(client, "c2") is not None
+    assert client.queries == 1
+
+    client.users = [Record(id="u1", camera=OWNER.camera, rules=[rule("r1", "walk", shared=True)])]
+    rules.invalidate()
+    assert rules.get(client, "c1").rules == (Rule("r1", "walk"),)
+    assert client.queries == 2
+
+
+@pytest.mark.parametrize("miss_refresh, queries", [(60, 1), (0, 2)])
+def test_unknown_cameras_rebuild_at_most_every_miss_refresh(miss_refresh, queries):
+    client = SyncClient([OWNER])
+    rules = RuleIndex(miss_refresh=miss_refresh)
+    rules.get(client, "c1")
+    assert rules.get(client, "unknown") is None
+    assert client.queries == queries
@@ -0,0 +1,103 @@
+import datetime
+import os
+import threading
+import time
+
+import pytest
+
+from tasks.segment_store import SegmentStore
+
+
+@pytest.fixture
+def store(tmp_path):
+    return SegmentStore(root=str(tmp_path / "segments"), index_path=str(tmp_path / "segments" / "index.sqlite3"),
+                        max_bytes=10 ** 9, max_age=3600)
+
+
+@pytest.fixture
+def record(tmp_path):
+    """Add a recording of `size` bytes covering [start, end) to the store."""
+    def add(store, camera_id, start, end, size=10):
+        path = tmp_path / f"recording-{camera_id}-{start}.mkv"
+        path.write_bytes(b"x" * size)
+        return store.add(camera_id, str(path), start, end)
+    return add
+
+
+def starts(segments):
+    return [segment.start for segment in segments]
+
+
+def test_add_moves_the_file_into_a_dated_bucket(store, record):
+    start = datetime.datetime(2025, 2, 1, 13, 5, tzinfo=datetime.timezone.utc).timestamp()
+    segment = record(store, "cam", start, start + 20)
+
+    assert os.path.exists(segment.path)
+    assert segment.path == os.path.join(store.root, "cam", "2025-02-01", "13", f"{int(start * 1000)}.mkv")
+    assert store.usage() == (1, 10)
+
+
+def test_segments_between_returns_overlapping_segments_of_the_camera(store, record):
+    now = time.time()
+    for start in (0, 20, 40, 60):
+        record(store, "cam", now + start, now + start + 20)
+    record(store, "other", now + 25, now + 45)
+
+    assert starts(store.segments_between("cam", now + 25, now + 45)) == [now + 20, now + 40]
+    # A range inside a single segment still finds it.
+    assert starts(store.segments_between("cam", now + 21, now + 22)) == [now + 20]
+    # The end is exclusive and segments ending at the start do not overlap.
+    assert starts(store.segments_between("cam", now + 40, now + 60)) == [now + 40]
+    assert store.segments_between("cam", now + 100, now + 200) == []
+    assert starts(store.segments_between(
+        "cam", datetime.datetime.fromtimestamp(now + 65), datetime.datetime.fromtimestamp(now + 70)
+    )) == [now + 60]
+
+
+def test_retention_removes_expired_segments_and_empty_buckets(store, record):
+    old = record(store, "cam", time.time() - 2 * 3600, time.time() - 2 * 3600 + 20)
+    fresh = record(store, "cam", time.time(), time.time() + 20)
+
+    assert store.enforce_retention() == 1
+    assert not os.path.exists(old.path)
+    assert not os.path.exists(os.path.dirname(old.path))
+    assert os.path.exists(fresh.path)
+    assert store.usage() == (1, 10)
+
+
+def test_retention_drops_the_oldest_segments_over_the_budget(store, record):
+    store.max_bytes = 25
+    now = time.time()
+    segments = [record(store, "cam", now + i * 20, now + (i + 1) * 20) for i in range(4)]
+
+    assert store.enforce_retention() == 2
+    assert [os.path.exists(segment.path) for segment in segments] == [False, False, True, True]
+
+
+def test_retention_keeps_protected_segments(store, record):
+    store.max_bytes = 15
+    now = time.time()
+    expired = record(store, "cam", now - 2 * 3600, now - 2 * 3600 + 20)
+    queued = record(store, "cam", now, now + 20)
+    newest = record(store, "cam", now + 20, now + 40)
+
+    # Neither the expired nor the oldest in-budget segment goes while it is still queued.
+    assert store.enforce_retention(protected={expired.path, queued.path}) == 1
+    assert [os.path.exists(s.path) for s in (expired, queued, newest)] == [True, True, False]
+
+    assert store.enforce_retention() == 1
+    assert [os.path.exists(s.path) for s in (expired, queued)] == [False, True]
+
+
+def test_store_is_usable_from_several_threads(store, record):
+    segment = record(store, "cam", time.time(), time.time() + 20)
+    # Like the retention thread, which opens the first connection in the API process.
+    retention = threading.Thread(target=store.enforce_retention)
+    retention.start()
+    retention.join()
+
+    found = []
+    lookup = threading.Thread(target=lambda: found.extend(store.segments_between("cam", 0, time.time() + 60)))
+    lookup.start()
+    lookup.join()
+    assert found == [segment] == store.segments_between("cam", 0, time.time() + 60)
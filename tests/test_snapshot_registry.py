@@ -0,0 +1,56 @@
+import cv2
+import numpy as np
+import pytest
+
+from tasks.snapshot_registry import SnapshotRegistry
+
+
+def jpeg(value, size=(240, 320)):
+    ok, buffer = cv2.imencode(".jpg", np.full((*size, 3), value, dtype=np.uint8))
+    return buffer.tobytes()
+
+
+@pytest.fixture
+def registry():
+    return SnapshotRegistry(queue_size=4)
+
+
+def test_get_downscales_and_reuses_the_variant(registry):
+    registry.update("cam", jpeg(10), captured_at=1.0)
+    small = registry.get("cam", 80)
+    assert cv2.imdecode(np.frombuffer(small.jpeg, np.uint8), cv2.IMREAD_COLOR).shape[:2] == (60, 80)
+    assert small.etag != registry.get("cam").etag
+    assert registry.get("cam", 80) is small
+    # Wider than the frame: the original is served.
+    assert registry.get("cam", 640) is registry.get("cam")
+
+
+def test_a_new_frame_drops_the_resized_variants(registry):
+    registry.update("cam", jpeg(10), captured_at=1.0)
+    registry.update("other", jpeg(20), captured_at=1.0)
+    for width in (40, 80, 120):
+        registry.get("cam", width)
+    registry.get("other", 40)
+    registry.update("cam", jpeg(30), captured_at=2.0)
+    assert list(registry.resized) == [("other", 40)]
+    assert registry.get("cam", 80).captured_at == 2.0
+
+
+def test_a_variant_of_a_replaced_frame_is_not_kept(registry, monkeypatch):
+    registry.update("cam", jpeg(10), captured_at=1.0)
+    resize = registry._resize
+
+    def resize_while_a_frame_arrives(snapshot, width):
+        registry.update("cam", jpeg(30), captured_at=2.0)
+        return resize(snapshot, width)
+
+    monkeypatch.setattr(registry, "_resize", resize_while_a_frame_arrives)
+    assert registry.get("cam", 80).captured_at == 1.0
+    assert registry.resized == {}
+
+
+def test_remove_forgets_the_camera(registry):
+    registry.update("cam", jpeg(10))
+    registry.get("cam", 80)
+    registry.remove("cam")
+    assert registry.get("cam") is None and registry.resized == {}
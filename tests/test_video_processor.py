@@ -0,0 +1,68 @@
+import cv2
+import numpy as np
+import pytest
+
+from video_processor import VideoProcessor, load_clip_counter, save_clip_counter
+
+
+@pytest.fixture
+def video(tmp_path):
+    """10 s at 10 fps: a square moves during frames 30-39 and 70-79 and stands still otherwise."""
+    path = str(tmp_path / "source.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (320, 240))
+    x = 20
+    for i in range(100):
+        if 30 <= i < 40 or 70 <= i < 80:
+            x += 12
+        frame = np.zeros((240, 320, 3), dtype=np.uint8)
+        frame[80:160, x % 240:x % 240 + 80] = 255
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def run(video, folder, **settings):
+    processor = VideoProcessor()
+    processor.use_fixed_video = True
+    processor.fixed_video_path = video
+    processor.realtime = False
+    processor.source_folder = str(folder)
+    for name, value in settings.items():
+        setattr(processor, name, value)
+    processor.running = True
+    processor.process_video()
+    return processor
+
+
+def frame_count(path):
+    cap = cv2.VideoCapture(str(path))
+    count = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    return count
+
+
+def test_clips_span_pre_roll_to_post_roll_of_each_event(video, tmp_path):
+    clips = tmp_path / "clips"
+    run(video, clips, pre_roll=1, post_roll=1)
+    # Per event: 1 s before the first moving frame, up to 1 s after the last one.
+    assert sorted(p.name for p in clips.glob("*.mp4")) == ["1.mp4", "2.mp4"]
+    assert frame_count(clips / "1.mp4") == 30
+    assert frame_count(clips / "2.mp4") == 30
+    assert load_clip_counter(str(clips)) == 3
+
+
+def test_long_events_are_split_at_the_duration_limit(video, tmp_path):
+    clips = tmp_path / "clips"
+    run(video, clips, pre_roll=1, post_roll=1, clip_duration=1.5)
+    first_event = [frame_count(clips / f"{n}.mp4") for n in (1, 2)]
+    # Cut on the frame 1.5 s in (10 frames of pre-roll, then 3.0-3.5 s); the rest of
+    # the event starts a new clip without pre-roll and ends 1 s after the motion.
+    assert first_event == [16, 14]
+
+
+def test_clip_counter_never_reuses_a_clip_on_disk(tmp_path):
+    assert load_clip_counter(str(tmp_path)) == 1
+    save_clip_counter(str(tmp_path), 4)
+    assert load_clip_counter(str(tmp_path)) == 4
+    (tmp_path / "7.mp4").write_bytes(b"")
+    assert load_clip_counter(str(tmp_path)) == 8
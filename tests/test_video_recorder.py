@@ -0,0 +1,69 @@
+import shutil
+
+import cv2
+import numpy as np
+import pytest
+
+import video_recorder
+from video_recorder import VideoSnippetRecorder
+
+needs_ffmpeg = pytest.mark.skipif(shutil.which(video_recorder.FFMPEG_PATH) is None, reason="ffmpeg not installed")
+
+
+@pytest.fixture
+def video(tmp_path):
+    """4 s at 10 fps, 160x120, with a moving square."""
+    path = str(tmp_path / "source.avi")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"MJPG"), 10, (160, 120))
+    for i in range(40):
+        frame = np.zeros((120, 160, 3), dtype=np.uint8)
+        frame[40:80, i * 3:i * 3 + 40] = 255
+        writer.write(frame)
+    writer.release()
+    return path
+
+
+def frame_count(path):
+    cap = cv2.VideoCapture(path)
+    count = 0
+    while cap.read()[0]:
+        count += 1
+    cap.release()
+    return count
+
+
+@needs_ffmpeg
+def test_copy_mode_cuts_the_stream_into_segments(video, tmp_path):
+    recorder = VideoSnippetRecorder(duration=2, source=video, tmp_folder=str(tmp_path / "out"), mode="copy")
+    snippets = list(recorder.record_segments())
+    assert recorder.mode == "copy"
+    assert len(snippets) >= 2
+    assert all(snippet.path.endswith(".mkv") and snippet.start <= snippet.end for snippet in snippets)
+    assert sum(frame_count(snippet.path) for snippet in snippets) == 40
+
+
+def test_copy_mode_without_ffmpeg_falls_back_to_transcoding(video, tmp_path, monkeypatch):
+    monkeypatch.setattr(video_recorder, "FFMPEG_PATH", str(tmp_path / "missing-ffmpeg"))
+    recorder = VideoSnippetRecorder(duration=2, source=video, tmp_folder=str(tmp_path / "out"), mode="copy")
+    assert recorder.mode == "transcode"
+    assert "missing-ffmpeg not found" in recorder.stats["last_error"]
+    path = recorder.record_snippet()
+    assert path and frame_count(path) == 20
+
+
+@needs_ffmpeg
+def test_copy_mode_without_ffprobe_copies_without_probing(video, tmp_path, monkeypatch):
+    monkeypatch.setattr(video_recorder, "FFPROBE_PATH", str(tmp_path / "missing-ffprobe"))
+    recorder = VideoSnippetRecorder(duration=2, source=video, tmp_folder=str(tmp_path / "out"), mode="copy")
+    assert recorder.mode == "copy"
+    assert "missing-ffprobe not found" in recorder.stats["last_error"]
+    path = recorder.record_snippet()
+    assert path.endswith(".mkv") and frame_count(path) == 20
+
+
+def test_transcode_mode_hands_every_decoded_frame_to_on_frame(video, tmp_path):
+    frames = []
+    recorder = VideoSnippetRecorder(duration=2, source=video, tmp_folder=str(tmp_path / "out"),
+                                    mode="transcode", on_frame=frames.append)
+    recorder.record_snippet()
+    assert len(frames) == 20 and frames[0].shape == (120, 160, 3)
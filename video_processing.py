@@ -1,17 +1,66 @@
 import cv2
+import logging
+import os
 import time
 import numpy as np
+from dotenv import load_dotenv
 
-def capture_and_detect_motion(camera_ip, chunk_duration=30, wait_duration=5, min_motion_frames=5):
+from frame_buffer import FrameRingBuffer
+from frame_grabber import FrameGrabber, FRAME_QUEUE_SIZE
+from motion_detection import create_motion_detector, DEFAULT_MOTION_SCALE, DEFAULT_MOTION_THRESHOLD
+
+load_dotenv()
+
+# Memory budget of a camera's chunk ring buffer when `max_buffer_frames` is not given
+# (1 GiB is about 170 frames at 1080p); once full, the oldest frames of a chunk are overwritten.
+CHUNK_BUFFER_MAX_BYTES = int(os.getenv("CHUNK_BUFFER_MAX_BYTES", 1024 ** 3))
+
+
+def buffer_capacity(chunk_duration, fps, frame_shape, max_buffer_frames=None, max_bytes=CHUNK_BUFFER_MAX_BYTES):
+    """Frames to preallocate for a chunk: the whole chunk, bounded by a frame count or a byte budget."""
+    capacity = int(np.ceil(chunk_duration * fps))
+    if max_buffer_frames:
+        return max(1, min(capacity, max_buffer_frames))
+    return max(1, min(capacity, max_bytes // int(np.prod(frame_shape))))
+
+def capture_and_detect_motion(camera_ip, chunk_duration=30, wait_duration=5, min_motion_frames=5,
+                              max_buffer_frames=None, threaded=True, queue_size=FRAME_QUEUE_SIZE,
+                              stats=None, motion_backend="frame_diff", motion_zones=None,
+                              motion_scale=DEFAULT_MOTION_SCALE, motion_threshold=DEFAULT_MOTION_THRESHOLD):
     """
-    Capture video from `camera_ip`, detect motion, and yield 30-second chunks (list of frames).
+    Capture video from `camera_ip`, detect motion, and yield 30-second chunks.
     If there is no motion in the entire chunk, skip sending it.
 
+    Frames are decoded straight into one preallocated `FrameRingBuffer` that is
+    reused for every chunk (in threaded mode by the grab thread, which pauses while
+    a chunk is handed out); the yielded buffer is a zero-copy handle (iterate it,
+    or call `.view()` / `.segments()`) and is only valid until the next chunk is
+    requested.
+
     :param camera_ip: IP or URL to the camera feed (e.g. rtsp:// or http://).
     :param chunk_duration: Duration (in seconds) for which frames are buffered.
-    :param wait_duration: Pause (in seconds) after each chunk is processed.
+    :param wait_duration: Cool-down (in seconds) after each chunk during which
+                          frames are discarded. The stream keeps being read,
+                          so it never stalls.
     :param min_motion_frames: Minimum number of frames that contain motion
                               within the chunk to be considered "active."
+    :param max_buffer_frames: Upper bound on buffered frames per chunk; once
+                              reached the oldest frames of the chunk are overwritten.
+                              Defaults to `chunk_duration * fps`, capped by
+                              CHUNK_BUFFER_MAX_BYTES.
+    :param threaded: Read the stream on a dedicated `FrameGrabber` thread that
+                     hands frames over a bounded queue, so time spent by the
+                     consumer of a chunk does not stall capture.
+    :param queue_size: Capacity of the grabber queue (threaded mode).
+    :param stats: Optional dict updated with grabbed/delivered/dropped/late
+                  frame counters (threaded mode).
+    :param motion_backend: The camera's `motion_backend` ("frame_diff", "mog2",
+                           "knn" or "block_sum"), see `motion_detection`.
+    :param motion_zones: The camera's `motion_zones` (include/exclude polygons);
+                         motion outside them is ignored.
+    :param motion_scale: Fraction of the source resolution motion is scored at.
+    :param motion_threshold: Fraction (0-1) of the monitored area that must
+                             change for a frame to count as motion.
     """
     cap = cv2.VideoCapture(camera_ip)
     if not cap.isOpened():
@@ -23,57 +72,94 @@ def capture_and_detect_motion(camera_ip, chunk_duration=30, wait_duration=5, min
         # Fallback if FPS is not detected. Provide a safe default.
         fps = 20.0
 
-    # Simple background frame for naive motion detection
+    # The first frame gives the frame size for the buffer and the detector's background.
     ret, frame = cap.read()
     if not ret:
         print("Error: Could not read first frame from camera.")
         cap.release()
         return
 
-    prev_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-    frame_buffer = []
+    # Motion is scored on a downscaled, zone-masked proxy by the camera's backend
+    detector = create_motion_detector(motion_backend, scale=motion_scale, threshold=motion_threshold,
+                                      zones=motion_zones)
+    detector.score(frame)
+    capacity = buffer_capacity(chunk_duration, fps, frame.shape, max_buffer_frames)
+    if threaded:
+        # The grab thread writes ahead of the consumer by up to a full queue.
+        capacity = max(capacity, queue_size + 1)
+    height, width = frame.shape[:2]
+    frame_buffer = FrameRingBuffer(capacity, height, width)
     motion_count = 0
 
-    chunk_start_time = time.time()
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break  # End of stream or error
-
-        current_gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-
-        # Simple frame differencing approach
-        diff = cv2.absdiff(prev_gray, current_gray)
-        # Threshold the difference to obtain regions of motion
-        _, diff_thresh = cv2.threshold(diff, 25, 255, cv2.THRESH_BINARY)
-        # Count the number of non-zero pixels => measure motion
-        non_zero_count = np.count_nonzero(diff_thresh)
-
-        # Heuristic: if non_zero_count is above some threshold, declare motion
-        # The threshold below is arbitrary and depends on actual scene
-        motion_detected = non_zero_count > 10000
-
-        if motion_detected:
-            motion_count += 1
-
-        # Store the frame in our buffer
-        frame_buffer.append(frame)
-        prev_gray = current_gray
-
-        # Check if chunk_duration (30 seconds) has passed
-        elapsed = time.time() - chunk_start_time
-        if elapsed >= chunk_duration:
-            # If we had enough motion in this chunk, yield it
-            if motion_count >= min_motion_frames:
-                yield frame_buffer
-
-            # Reset for the next chunk
-            frame_buffer = []
-            motion_count = 0
-            chunk_start_time = time.time()
-
-            # Wait the specified duration before capturing the next chunk
-            time.sleep(wait_duration)
-
-    cap.release()
+    grabber = FrameGrabber(cap, queue_size=queue_size, buffer=frame_buffer).start() if threaded else None
+    if grabber is not None and stats is not None:
+        stats.update(grabber.stats)
+        grabber.stats = stats
+
+    def next_frame():
+        """Next frame in the ring buffer plus its grab time, or (None, None) at end of stream."""
+        if grabber is None:
+            # Decoded in place into the next ring buffer slot
+            return frame_buffer.read_from(cap), time.monotonic()
+        # Already decoded into its ring buffer slot by the grab thread
+        item = grabber.read()
+        if item is None:
+            if grabber.error:
+                raise ValueError(grabber.error)
+            return None, None
+        return item
+
+    def skip_until(deadline):
+        """Discard frames until `deadline` (monotonic) while keeping the stream drained."""
+        while time.monotonic() < deadline:
+            if grabber is not None:
+                # Paused, so the grab thread drains the stream without decoding.
+                if grabber.finished:
+                    return False
+                time.sleep(min(0.05, max(0.0, deadline - time.monotonic())))
+            elif not cap.grab():  # grab() skips the BGR conversion of read()
+                return False
+        return True
+
+    chunk_start_time = time.monotonic()
+
+    try:
+        while True:
+            try:
+                frame, grabbed_at = next_frame()
+            except ValueError as e:
+                print(f"Error: {e}")
+                break
+            if frame is None:
+                break  # End of stream or error
+
+            if detector.detect(frame):
+                motion_count += 1
+
+            # Chunks are cut on frame grab time, not on when we got round to them
+            if grabbed_at - chunk_start_time >= chunk_duration:
+                if grabber is not None:
+                    # Keep the grab thread out of the buffer while it is handed out.
+                    grabber.pause()
+                # If we had enough motion in this chunk, yield it
+                if motion_count >= min_motion_frames:
+                    yield frame_buffer
+
+                # Reset for the next chunk (the memory is reused)
+                frame_buffer.clear()
+                motion_count = 0
+
+                # Cool down until `wait_duration` after the chunk ended, draining the
+                # stream instead of sleeping; time the consumer spent counts towards it.
+                chunk_start_time = grabbed_at + wait_duration
+                if not skip_until(chunk_start_time):
+                    break
+                if grabber is not None:
+                    grabber.resume()
+                # Nothing to compare the first frame after the cool-down against
+                detector.reset()
+    finally:
+        if grabber is not None:
+            grabber.stop()
+            logging.info(f"Capture stats for {camera_ip}: {grabber.stats}")
+        cap.release()
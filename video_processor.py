@@ -1,10 +1,15 @@
 import cv2
+import collections
 import os
+import re
 import time
 import threading
 import logging
 from dotenv import load_dotenv
 
+from clip_writer import open_clip_writer
+from motion_detection import create_motion_detector
+
 # Load environment variables
 load_dotenv()
 
@@ -13,29 +18,71 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(
 
 # Load configurations from .env
 FPS = int(os.getenv("FPS", 30))
-CLIP_DURATION = int(os.getenv("CLIP_DURATION", 120))
+CLIP_DURATION = int(os.getenv("CLIP_DURATION", 120))  # Hard cap on clip length (seconds)
+# Seconds of footage kept in memory and written before the motion that starts a clip
+PRE_ROLL = float(os.getenv("PRE_ROLL", 3))
+# A clip ends once there has been no motion for this many seconds
+POST_ROLL = float(os.getenv("POST_ROLL", 5))
 SOURCE_FOLDER = os.getenv("SOURCE_FOLDER", "./clips")
 TMP_FOLDER = os.getenv("TMP_FOLDER", "./tmp")
 WEBCAM_IP = os.getenv("WEBCAM_IP", "http://192.168.236.101:5000/video_feed")
 USE_FIXED_VIDEO = os.getenv("USE_FIXED_VIDEO", "False").lower() == "true"
 FIXED_VIDEO_PATH = os.getenv("FIXED_VIDEO_PATH", "")
+# Motion is scored on a proxy at MOTION_SCALE of the source resolution; a frame has
+# motion when more than MOTION_THRESHOLD (0-1) of the monitored area changed.
+MOTION_SCALE = float(os.getenv("MOTION_SCALE", 0.25))
+MOTION_THRESHOLD = float(os.getenv("MOTION_THRESHOLD", 0.015))
+# frame_diff, mog2, knn or block_sum (see motion_detection)
+MOTION_BACKEND = os.getenv("MOTION_BACKEND", "frame_diff")
 
 # Ensure source folder exists
 os.makedirs(SOURCE_FOLDER, exist_ok=True)
 os.makedirs(TMP_FOLDER, exist_ok=True)
 
+COUNTER_FILE = ".clip_counter"
+
+def load_clip_counter(folder):
+    """
+    Next free clip number for `folder`: the persisted counter, bumped past any
+    numbered clip already on disk so a restart never overwrites footage.
+    """
+    counter = 1
+    try:
+        with open(os.path.join(folder, COUNTER_FILE)) as f:
+            counter = int(f.read().strip() or 1)
+    except (FileNotFoundError, ValueError):
+        pass
+    for name in os.listdir(folder):
+        match = re.fullmatch(r"(\d+)\.mp4", name)
+        if match:
+            counter = max(counter, int(match.group(1)) + 1)
+    return counter
+
+def save_clip_counter(folder, counter):
+    """Atomically persist the next clip number."""
+    path = os.path.join(folder, COUNTER_FILE)
+    with open(path + ".tmp", "w") as f:
+        f.write(str(counter))
+    os.replace(path + ".tmp", path)
+
 class VideoProcessor:
-    def __init__(self):
+    def __init__(self, motion_zones=None, motion_backend=None):
         self.running = False
         self.thread = None
         self.cap = None
-        self.clip_counter = 1
+        self.clip_counter = None  # Loaded from the source folder when processing starts
         self.use_fixed_video = USE_FIXED_VIDEO
+        # Pace a fixed video file at its frame rate so it behaves like a live feed
+        self.realtime = USE_FIXED_VIDEO
         self.fps = FPS
         self.clip_duration = CLIP_DURATION
+        self.pre_roll = PRE_ROLL
+        self.post_roll = POST_ROLL
         self.source_folder = SOURCE_FOLDER
         self.webcam_ip = WEBCAM_IP
         self.fixed_video_path = FIXED_VIDEO_PATH
+        self.motion_zones = motion_zones
+        self.motion_backend = motion_backend or MOTION_BACKEND
 
     def start(self):
         """Starts the video processing thread."""
@@ -55,7 +102,13 @@ class VideoProcessor:
         logging.info("Video processing stopped.")
 
     def process_video(self):
-        """Handles video capture, motion detection, and recording."""
+        """
+        Handles video capture, motion detection, and event recording.
+
+        A clip starts on motion and includes the last `pre_roll` seconds before it,
+        ends once there has been no motion for `post_roll` seconds, and never runs
+        longer than `clip_duration`. Times are measured in stream time (frames / fps).
+        """
         source = self.fixed_video_path if self.use_fixed_video and self.fixed_video_path else self.webcam_ip
         self.cap = cv2.VideoCapture(source)
 
@@ -64,64 +117,78 @@ class VideoProcessor:
             self.running = False
             return
 
-        prev_frame = None
-        recording = False
+        os.makedirs(self.source_folder, exist_ok=True)
+        if self.clip_counter is None:
+            self.clip_counter = load_clip_counter(self.source_folder)
+        fps = self.cap.get(cv2.CAP_PROP_FPS) or self.fps
+
+        detector = create_motion_detector(self.motion_backend, scale=MOTION_SCALE,
+                                          threshold=MOTION_THRESHOLD, zones=self.motion_zones)
+        pre_roll = collections.deque(maxlen=max(1, int(self.pre_roll * fps)))
         clip_writer = None
-        clip_start_time = None
+        finishing = []  # Futures of clips still being written out (see clip_writer)
+        clip_start = None
+        last_motion = None
+        frame_index = 0
+        started_at = time.monotonic()
 
         while self.running:
             ret, frame = self.cap.read()
             if not ret:
                 logging.warning("Failed to grab frame, ending capture.")
                 break
+            now = frame_index / fps
+            frame_index += 1
 
-            gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
-            gray = cv2.GaussianBlur(gray, (21, 21), 0)
+            # Motion detection logic (pluggable backend on a downscaled, zone-masked proxy)
+            motion_score = detector.score(frame)
+            motion = motion_score is not None and motion_score > detector.threshold
+            if motion:
+                last_motion = now
 
-            if prev_frame is None:
-                prev_frame = gray
-                continue
-
-            # Motion detection logic
-            frame_delta = cv2.absdiff(prev_frame, gray)
-            thresh = cv2.threshold(frame_delta, 25, 255, cv2.THRESH_BINARY)[1]
-            thresh = cv2.dilate(thresh, None, iterations=2)
-            motion_score = cv2.countNonZero(thresh)
-
-            # Start recording if motion detected
-            if motion_score > 5000:
-                if not recording:
+            if clip_writer is None:
+                if motion:
                     clip_filename = os.path.join(self.source_folder, f"{self.clip_counter}.mp4")
-                    fourcc = cv2.VideoWriter_fourcc(*"mp4v")
                     height, width = frame.shape[:2]
-                    clip_writer = cv2.VideoWriter(clip_filename, fourcc, self.fps, (width, height))
-                    recording = True
-                    clip_start_time = time.time()
-                    logging.info(f"Motion detected. Starting clip: {clip_filename}")
-
-                clip_writer.write(frame)
-
-                # Stop recording after clip duration
-                if time.time() - clip_start_time >= self.clip_duration:
-                    clip_writer.release()
+                    # Encoded on a separate thread (mp4v or ffmpeg H.264, see clip_writer)
+                    clip_writer = open_clip_writer(clip_filename, fps, (width, height), fourcc="mp4v")
                     self.clip_counter += 1
-                    recording = False
-                    clip_writer = None
-                    clip_start_time = None
-                    logging.info("Clip ended due to duration limit.")
-
-            elif recording:
+                    save_clip_counter(self.source_folder, self.clip_counter)
+                    clip_start = now - len(pre_roll) / fps
+                    logging.info(f"Motion detected. Starting clip: {clip_filename}")
+                    # Lead-up to the incident
+                    for buffered in pre_roll:
+                        clip_writer.write(buffered)
+                    pre_roll.clear()
+                    clip_writer.write(frame)
+                else:
+                    pre_roll.append(frame)
+            else:
                 clip_writer.write(frame)
-                if time.time() - clip_start_time >= self.clip_duration:
-                    clip_writer.release()
-                    self.clip_counter += 1
-                    recording = False
+                if now - clip_start >= self.clip_duration:
+                    reason = "duration limit"
+                elif now - last_motion >= self.post_roll:
+                    reason = "no further motion"
+                else:
+                    reason = None
+                if reason:
+                    # The file is finalized on the writer's thread; capture carries on.
+                    finishing = [future for future in finishing if not future.done()]
+                    finishing.append(clip_writer.finish())
                     clip_writer = None
-                    clip_start_time = None
-                    logging.info("Clip ended (no further motion).")
-
-            prev_frame = gray
-            time.sleep(0.05)
-
+                    logging.info(f"Clip ended ({reason}).")
+
+            if self.realtime:
+                # Sleep until this frame is due; a live feed paces itself.
+                delay = started_at + frame_index / fps - time.monotonic()
+                if delay > 0:
+                    time.sleep(delay)
+
+        if clip_writer is not None:
+            finishing.append(clip_writer.finish())
+            logging.info("Clip ended (capture stopped).")
+        # Capture is over, so wait for the last clips to be complete on disk.
+        for future in finishing:
+            future.result()
         if self.cap:
             self.cap.release()
@@ -1,9 +1,16 @@
+import collections
 import cv2
 import os
+import shutil
+import subprocess
+import threading
 import time
 import logging
+from collections import namedtuple
 from dotenv import load_dotenv
 
+from clip_writer import FFMPEG_CRF, FFMPEG_PATH, FFMPEG_PRESET, clip_extension, open_clip_writer
+
 # Load environment variables
 load_dotenv()
 
@@ -14,60 +21,345 @@ logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(levelname)s - %(
 TMP_FOLDER = os.getenv("TMP_FOLDER", "./tmp")
 WEBCAM_IP = os.getenv("WEBCAM_IP", "http://192.168.236.101:5000/video_feed")
 DEFAULT_FPS = 30  # Set a standard FPS to avoid frame jitter
+# "transcode" decodes every frame and re-encodes it (see clip_writer);
+# "copy" remuxes the camera stream into segments with ffmpeg without decoding.
+RECORDING_MODE = os.getenv("RECORDING_MODE", "transcode")
+FFPROBE_PATH = os.getenv("FFPROBE_PATH", "ffprobe")
+# Codecs that can be stream-copied into the Matroska segments as they are.
+COPYABLE_CODECS = {"h264", "hevc", "mjpeg", "mpeg4", "vp8", "vp9", "av1"}
+# Seconds between the JPEG snapshots handed to `on_snapshot` (see tasks.snapshot_registry).
+SNAPSHOT_INTERVAL = float(os.getenv("SNAPSHOT_INTERVAL", 2))
+SNAPSHOT_QUALITY = int(os.getenv("SNAPSHOT_QUALITY", 80))
+
+# A recorded file and the wall-clock time range (epoch seconds) it covers.
+Snippet = namedtuple("Snippet", ["path", "start", "end"])
 
 # Ensure tmp folder exists
 os.makedirs(TMP_FOLDER, exist_ok=True)
 
+def probe_codec(source):
+    """Codec name of the first video stream of `source`, or None if ffprobe is unavailable or fails."""
+    if shutil.which(FFPROBE_PATH) is None:
+        return None
+    try:
+        result = subprocess.run(
+            [FFPROBE_PATH, "-v", "error", "-select_streams", "v:0",
+             "-show_entries", "stream=codec_name", "-of", "default=nw=1:nk=1", source],
+            capture_output=True, text=True, timeout=15,
+        )
+    except (OSError, subprocess.TimeoutExpired):
+        return None
+    return result.stdout.strip() or None
+
+
 class VideoSnippetRecorder:
-    def __init__(self, duration=20):
+    def __init__(self, duration=20, source=None, tmp_folder=None, mode=None, realtime=False,
+                 on_snapshot=None, snapshot_interval=SNAPSHOT_INTERVAL, on_frame=None):
+        """
+        Records `duration`-second snippets from `source` into `tmp_folder`.
+
+        :param mode: "transcode" or "copy" (defaults to RECORDING_MODE).
+        :param realtime: Read a local file at its native rate (ffmpeg -re), as if it were a camera.
+        :param on_snapshot: Called with the JPEG bytes of a current frame about every
+            `snapshot_interval` seconds while recording. In copy mode only keyframes
+            are decoded for it.
+        :param on_frame: Called with every decoded frame (BGR array) in transcode
+            mode; copy mode never decodes them.
+
+        `stats` is updated while recording, for health reporting (see tasks.camera_health):
+        frames recorded, wall-clock time of the last one and the last error. Copy mode
+        never sees individual frames, so there `frames` is estimated from the stream
+        time ffmpeg has written and the stream's nominal frame rate.
+        """
+        if (mode or RECORDING_MODE) not in ("transcode", "copy"):
+            raise ValueError(f"Unknown recording mode {mode or RECORDING_MODE!r}, expected 'transcode' or 'copy'")
         self.duration = duration
-        self.webcam_ip = WEBCAM_IP
-        self.tmp_folder = TMP_FOLDER
+        self.webcam_ip = source or WEBCAM_IP
+        self.tmp_folder = tmp_folder or TMP_FOLDER
+        self.mode = mode or RECORDING_MODE
+        self.realtime = realtime
+        self.on_snapshot = on_snapshot
+        self.snapshot_interval = snapshot_interval
+        self.on_frame = on_frame
+        self.next_snapshot = 0.0
+        self.stats = {"frames": 0, "last_frame_at": None, "last_error": None}
+        os.makedirs(self.tmp_folder, exist_ok=True)
+        if self.mode == "copy":
+            self._check_copy_tools()
 
-        print("now")
-        """Records a 30-second video snippet from the webcam and returns the file path."""
-        self.cap = cv2.VideoCapture(self.webcam_ip)
-        
+        # Copy mode never decodes, so only the transcoding path opens a capture.
+        self.cap = cv2.VideoCapture(self.webcam_ip) if self.mode == "transcode" else None
+
+    def _check_copy_tools(self):
+        """
+        Copy mode runs ffmpeg (and ffprobe to pick copy or transcode). Without
+        ffmpeg every segmenter start would fail, so record through OpenCV instead;
+        without ffprobe the codec is not probed and ffmpeg's own copy failure
+        triggers the transcode fallback.
+        """
+        if shutil.which(FFPROBE_PATH) is None:
+            self._error(f"{FFPROBE_PATH} not found; copying {self.webcam_ip} without probing its codec.")
+        if shutil.which(FFMPEG_PATH) is None:
+            self._error(f"{FFMPEG_PATH} not found; recording {self.webcam_ip} in transcode mode instead of copy.")
+            self.mode = "transcode"
+
+    def record_segments(self):
+        """
+        Yield consecutive `Snippet`s until the stream ends or fails.
+        In copy mode a single long-running ffmpeg process cuts the stream, so no
+        frames are lost between snippets. In transcode mode each file is finalized
+        on its writer's thread while the next snippet is already recording, and is
+        yielded as soon as it is complete.
+        """
+        if self.mode == "copy":
+            yield from self._copy_segments()
+            return
+        finishing = collections.deque()  # (Future of the path, start, end) of snippets being finalized
+        while True:
+            start = time.time()
+            recording = self._open_snippet()
+            if recording is None:
+                break
+            out, total_frames = recording
+            for _ in range(total_frames):
+                if not self._record_frame(out):
+                    break
+                while finishing and finishing[0][0].done():
+                    yield from self._finished(*finishing.popleft())
+            finishing.append((out.finish(), start, time.time()))
+            if not self.cap.isOpened():
+                # The stream dropped mid-snippet; let the caller back off before reconnecting.
+                break
+        while finishing:
+            yield from self._finished(*finishing.popleft())
 
     def record_snippet(self):
+        """Record a single snippet; returns its path once the file is complete, or None."""
+        if self.mode == "copy":
+            return self._copy_snippet()
+        recording = self._open_snippet()
+        if recording is None:
+            return None
+        out, total_frames = recording
+        for _ in range(total_frames):
+            if not self._record_frame(out):
+                break
+        file_path = out.release()
+        if file_path:
+            logging.info(f"Recording complete: {file_path}")
+        return file_path
+
+    def _open_snippet(self):
+        """
+        Open the writer for the next snippet, reconnecting first if needed.
+        Returns `(writer, frames to record)`, or None if the stream is unusable.
+        """
         if not self.cap.isOpened():
-            logging.error(f"Error opening video source: {self.webcam_ip}")
+            # Released after a lost stream (or never opened): reconnect.
             self.cap = cv2.VideoCapture(self.webcam_ip)
+            if not self.cap.isOpened():
+                self._error(f"Error opening video source: {self.webcam_ip}")
+                return None
         
-        print("noww")
-
-        # Generate file path
-        timestamp = int(time.time())
-        file_path = os.path.join(self.tmp_folder, f"snippet_{timestamp}.avi")
+        # Generate file path (milliseconds, so back-to-back snippets never share a name)
+        timestamp = int(time.time() * 1000)
+        file_path = os.path.join(self.tmp_folder, f"snippet_{timestamp}{clip_extension(default='.avi')}")
         
-        fourcc = cv2.VideoWriter_fourcc(*"XVID")
         width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
         height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
         fps = self.cap.get(cv2.CAP_PROP_FPS) or DEFAULT_FPS  # Fallback if FPS is 0
         
         if width == 0 or height == 0:
-            logging.error("Invalid frame size from webcam.")
+            self._error("Invalid frame size from webcam.")
             self.cap.release()
             return None
         
-        out = cv2.VideoWriter(file_path, fourcc, fps, (width, height))
-
+        # Encoded on a separate thread (XVID or ffmpeg H.264, see clip_writer)
+        out = open_clip_writer(file_path, fps, (width, height), fourcc="XVID")
         logging.info(f"Recording video snippet: {file_path} at {fps} FPS")
-        frame_count = 0
-        total_frames = int(fps * self.duration)
+        return out, int(fps * self.duration)
 
-        while frame_count < total_frames:
-            ret, frame = self.cap.read()
-            if not ret:
-                logging.warning("Failed to grab frame, stopping recording.")
-                break
-            
-            out.write(frame)
-            frame_count += 1  # Keep track of frames written
-        
-        out.release()
-        logging.info(f"Recording complete: {file_path}")
-        return file_path
+    def _record_frame(self, out):
+        """Read one frame into `out`. False once the stream fails (the capture is then released)."""
+        ret, frame = self.cap.read()
+        if not ret:
+            logging.warning("Failed to grab frame, stopping recording.")
+            self.stats["last_error"] = "Failed to grab frame"
+            # A capture at end of stream still reports isOpened(); release it so the
+            # next snippet reconnects instead of returning empty files in a loop.
+            self.cap.release()
+            return False
+
+        out.write(frame)
+        self.stats["frames"] += 1
+        self.stats["last_frame_at"] = time.time()
+        if self.on_frame:
+            self.on_frame(frame)
+        if self.on_snapshot and time.monotonic() >= self.next_snapshot:
+            self.next_snapshot = time.monotonic() + self.snapshot_interval
+            ok, jpeg = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, SNAPSHOT_QUALITY])
+            if ok:
+                self.on_snapshot(jpeg.tobytes())
+        return True
+
+    @staticmethod
+    def _finished(future, start, end):
+        file_path = future.result()
+        # None for a header-only file (no frame was recorded); the writer removed it.
+        if file_path:
+            logging.info(f"Recording complete: {file_path}")
+            yield Snippet(file_path, start, end)
+
+    def _input_args(self, keyframes_only=False):
+        args = [FFMPEG_PATH, "-hide_banner", "-loglevel", "error"]
+        if self.realtime:
+            args.append("-re")
+        if keyframes_only:
+            # Only affects the decoder (snapshots); copied packets are untouched.
+            args += ["-skip_frame", "nokey"]
+        if self.webcam_ip.startswith(("http://", "https://")):
+            # MJPEG over HTTP carries no timestamps; stamp packets on arrival.
+            args += ["-use_wallclock_as_timestamps", "1"]
+        return args + ["-i", self.webcam_ip, "-map", "0:v:0"]
+
+    def _codec_args(self, copy):
+        if copy:
+            return ["-c", "copy"]
+        return ["-c:v", "libx264", "-preset", FFMPEG_PRESET, "-crf", str(FFMPEG_CRF), "-pix_fmt", "yuv420p"]
+
+    def _can_copy(self):
+        codec = probe_codec(self.webcam_ip)
+        if codec is not None and codec not in COPYABLE_CODECS:
+            logging.warning(f"Codec {codec} of {self.webcam_ip} cannot be copied, transcoding instead.")
+            return False
+        return True
+
+    def _copy_snippet(self):
+        """Remux a single `duration`-second snippet (Matroska) without decoding."""
+        file_path = os.path.join(self.tmp_folder, f"snippet_{int(time.time())}.mkv")
+        for copy in ((True, False) if self._can_copy() else (False,)):
+            args = self._input_args() + ["-t", str(self.duration)] + self._codec_args(copy) + ["-y", file_path]
+            result = subprocess.run(args, stdin=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+            if result.returncode == 0 and os.path.exists(file_path) and os.path.getsize(file_path) > 0:
+                logging.info(f"Recording complete: {file_path}")
+                return file_path
+            self._error(f"ffmpeg {'copy' if copy else 'transcode'} of {self.webcam_ip} failed: {result.stderr.strip()}")
+        return None
+
+    def _copy_segments(self):
+        copy_modes = (True, False) if self._can_copy() else (False,)
+        for copy in copy_modes:
+            produced = yield from self._run_segmenter(copy)
+            # Only fall back to transcoding if copying never produced a segment;
+            # a stream that fails later is a connection problem, not a codec one.
+            if produced:
+                return
+
+    def _run_segmenter(self, copy):
+        """Run one ffmpeg segmenter, yielding each segment as soon as it is closed. Returns the count."""
+        prefix = f"snippet_{int(time.time() * 1000)}_"
+        keyframes_only = copy and self.on_snapshot is not None
+        args = self._input_args(keyframes_only) + self._codec_args(copy) + [
+            "-f", "segment", "-segment_time", str(self.duration), "-reset_timestamps", "1",
+            "-segment_format", "matroska",
+            # ffmpeg prints "name,start,end" to stdout for every finished segment.
+            "-segment_list", "pipe:1", "-segment_list_type", "csv",
+            os.path.join(self.tmp_folder, f"{prefix}%05d.mkv"),
+            # key=value progress blocks on stderr every second (see _read_progress).
+            "-progress", "pipe:2", "-stats_period", "1",
+        ]
+        snapshot_path = os.path.join(self.tmp_folder, "snapshot.jpg")
+        if self.on_snapshot:
+            # Second output: a JPEG rewritten in place (atomically) every snapshot interval.
+            args += [
+                "-map", "0:v:0", "-vf", f"fps=1/{self.snapshot_interval}", "-q:v", "5",
+                "-update", "1", "-atomic_writing", "1", "-f", "image2", snapshot_path,
+            ]
+        logging.info(f"Recording {self.webcam_ip} in {self.duration}s segments ({'copy' if copy else 'transcode'})")
+        proc = subprocess.Popen(args, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, text=True)
+        produced = 0
+        watcher_done = threading.Event()
+        errors = collections.deque(maxlen=20)
+        progress = {"stream_fps": None}
+        # Draining stderr also keeps a chatty ffmpeg from blocking on a full pipe.
+        reader = threading.Thread(target=self._read_progress, args=(proc.stderr, errors, progress), daemon=True)
+        reader.start()
+        if self.on_snapshot:
+            threading.Thread(target=self._watch_snapshot, args=(snapshot_path, watcher_done), daemon=True).start()
+        try:
+            for line in proc.stdout:
+                fields = line.strip().split(",")
+                if len(fields) < 3:
+                    continue
+                # The segment just closed, so it ends now and lasted (end - start) stream seconds.
+                end = time.time()
+                duration = float(fields[2]) - float(fields[1])
+                produced += 1
+                segment_path = os.path.join(self.tmp_folder, fields[0])
+                if progress["stream_fps"] is None:
+                    progress["stream_fps"] = self._stream_fps(segment_path)
+                yield Snippet(segment_path, end - duration, end)
+            proc.wait()
+        finally:
+            watcher_done.set()
+            if proc.poll() is None:
+                proc.terminate()
+                proc.wait()
+        reader.join(timeout=5)
+        if proc.returncode != 0:
+            self._error(f"ffmpeg segmenter for {self.webcam_ip} exited with code {proc.returncode}: "
+                        f"{' '.join(errors)}")
+        return produced
+
+    def _read_progress(self, stderr, errors, progress):
+        """Follow ffmpeg's -progress output: written stream time means frames are arriving."""
+        written = 0.0
+        # Stream time restarts at zero with every ffmpeg run; frame counts carry on.
+        frames_before = self.stats["frames"]
+        for line in stderr:
+            key, sep, value = line.strip().partition("=")
+            if not sep or not key.replace("_", "").isalnum():
+                if line.strip():
+                    errors.append(line.strip())
+                    self.stats["last_error"] = line.strip()
+                continue
+            if key != "out_time_us" or not value.isdigit():
+                continue
+            out_time = int(value) / 1e6
+            if out_time > written:
+                written = out_time
+                self.stats["last_frame_at"] = time.time()
+                if progress["stream_fps"]:
+                    self.stats["frames"] = frames_before + int(written * progress["stream_fps"])
+
+    @staticmethod
+    def _stream_fps(path):
+        """Nominal frame rate of a recorded segment (read from its header), or None."""
+        cap = cv2.VideoCapture(path)
+        try:
+            return cap.get(cv2.CAP_PROP_FPS) or None
+        finally:
+            cap.release()
+
+    def _error(self, message):
+        logging.error(message)
+        self.stats["last_error"] = message
+
+    def _watch_snapshot(self, path, done):
+        """Hand each new version of ffmpeg's snapshot file to `on_snapshot`."""
+        last_mtime = None
+        while not done.wait(self.snapshot_interval / 2):
+            try:
+                mtime = os.stat(path).st_mtime_ns
+                if mtime == last_mtime:
+                    continue
+                with open(path, "rb") as f:
+                    jpeg = f.read()
+            except FileNotFoundError:
+                continue
+            last_mtime = mtime
+            self.on_snapshot(jpeg)
 
 # Usage example
 if __name__ == "__main__":